@@ -4,57 +4,40 @@ import json
 import os
 import sys
 import threading
+import importlib
 import importlib.util
 
 # 添加当前目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
+# 各生成步骤用到的模块和对象：启动时只检查模块文件是否存在，
+# 真正点击对应按钮时才导入（requests、PIL、reportlab 等较慢的依赖随之延后加载）
+STAGE_MODULES = {
+    "cards": ("character_card_generator", "CharacterCardGenerator"),
+    "pages": ("school_cards_to_png", "SchoolCardsToPNG"),
+    "pdf": ("mix_pdf", "create_pdf_from_pages"),
+}
+
 
 # 动态导入模块
 def load_module(module_name, class_name=None):
-    """动态导入模块和类"""
-    try:
-        # 尝试直接导入
-        if class_name:
-            module = __import__(module_name)
-            return getattr(module, class_name)
-        else:
-            return __import__(module_name)
-    except ImportError:
-        # 如果直接导入失败，尝试从文件导入
-        file_path = os.path.join(current_dir, f"{module_name}.py")
-        if not os.path.exists(file_path):
-            raise ImportError(f"找不到模块文件: {file_path}")
-
-        spec = importlib.util.spec_from_file_location(module_name, file_path)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-
-        if class_name:
-            return getattr(module, class_name)
-        else:
-            return module
-
-
-# 尝试导入模块
-try:
-    CharacterCardGenerator = load_module("character_card_generator", "CharacterCardGenerator")
-except Exception as e:
-    print(f"无法导入 CharacterCardGenerator: {e}")
-    CharacterCardGenerator = None
-
-try:
-    SchoolCardsToPNG = load_module("school_cards_to_png", "SchoolCardsToPNG")
-except Exception as e:
-    print(f"无法导入 SchoolCardsToPNG: {e}")
-    SchoolCardsToPNG = None
-
-try:
-    create_pdf_from_pages = load_module("mix_pdf", "create_pdf_from_pages")
-except Exception as e:
-    print(f"无法导入 create_pdf_from_pages: {e}")
-    create_pdf_from_pages = None
+    """按需导入模块和类（已导入的模块直接从 sys.modules 返回）"""
+    module = importlib.import_module(module_name)
+    if class_name:
+        return getattr(module, class_name)
+    return module
+
+
+def load_stage(stage):
+    """导入生成步骤对应的类或函数"""
+    return load_module(*STAGE_MODULES[stage])
+
+
+def missing_modules():
+    """返回找不到的模块名列表；只查找模块文件，不执行模块代码"""
+    return [module_name for module_name, _ in STAGE_MODULES.values()
+            if importlib.util.find_spec(module_name) is None]
 
 
 class CharacterCardApp:
@@ -63,8 +46,10 @@ class CharacterCardApp:
         self.root.title("角色卡生成器")
         self.root.geometry("600x500")
 
-        # 检查模块是否成功导入
-        if not all([CharacterCardGenerator, SchoolCardsToPNG, create_pdf_from_pages]):
+        # 检查模块文件是否存在（此时并不导入）
+        missing = missing_modules()
+        if missing:
+            print(f"无法找到模块: {', '.join(missing)}")
             self.show_module_error()
             return
 
@@ -293,6 +278,7 @@ class CharacterCardApp:
             # 暂时使用示例数据
             character_names = ["砂狼 白子", "小鸟游 星野", "奥空 绫音"]
 
+            CharacterCardGenerator = load_stage("cards")
             generator = CharacterCardGenerator("config.json")
             success = generator.batch_create_cards(character_names, self.config["cards_folder"])
 
@@ -326,6 +312,7 @@ class CharacterCardApp:
     def _generate_pages_thread(self):
         """生成页面的线程函数"""
         try:
+            SchoolCardsToPNG = load_stage("pages")
             generator = SchoolCardsToPNG("config.json")
             success = generator.create_pages_by_schools()
 
@@ -359,6 +346,7 @@ class CharacterCardApp:
     def _generate_pdf_thread(self):
         """生成PDF的线程函数"""
         try:
+            create_pdf_from_pages = load_stage("pdf")
             success = create_pdf_from_pages(
                 self.config["pages_folder"],
                 self.config["students_pdf"]
@@ -0,0 +1,231 @@
+import asyncio
+import functools
+import os
+
+from build_checkpoint import temp_path_for
+from character_card_generator import CharacterCardGenerator
+from mix_pdf import create_pdf_from_pages
+from school_cards_to_png import SchoolCardsToPNG
+
+
+@functools.lru_cache(maxsize=1)
+def load_aiohttp():
+    """可选依赖 aiohttp，第一次下载时才导入（导入较慢）；未安装时返回None"""
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+    return aiohttp
+
+
+class PipelineCancelled(Exception):
+    """异步任务被取消时用来中止同步阶段的异常"""
+
+
+class AsyncPipeline:
+    """供 asyncio 程序嵌入使用的异步接口
+
+    安装了可选依赖 aiohttp 时网络下载在事件循环中直接 await，未安装时在执行器的线程中用 requests 下载；
+    图像合成、页面渲染和PDF编码放到执行器中运行，不阻塞事件循环。
+    所有 iter_* 方法都是异步迭代器，每完成一项就产出一项结果；
+    取消外层任务或提前退出迭代会停止剩余工作。
+    """
+
+    def __init__(self, config_file="config.json", context=None, executor=None, concurrency=4):
+        self.generator = CharacterCardGenerator(config_file, context)
+        self.page_builder = SchoolCardsToPNG(config_file, context)
+        self.config = self.generator.config
+        self.config_file = config_file
+        self.context = context
+        self.executor = executor
+        self.concurrency = concurrency
+        self.session = None
+
+        # 事件循环中无法询问用户，下载失败直接跳过
+        self.generator.interactive = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+        return False
+
+    async def aclose(self):
+        """关闭HTTP会话"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        """在执行器中运行CPU密集的同步函数"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def fetch(self, url, save_path):
+        """下载单个URL到文件，成功返回True"""
+        aiohttp = load_aiohttp()
+        if aiohttp is None:
+            # 没有 aiohttp 时退回到线程中的 requests
+            return await self.run_in_executor(self._fetch_blocking, url, save_path)
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+
+        tmp_path = temp_path_for(save_path)
+        try:
+            async with self.session.get(url) as response:
+                if response.status != 200:
+                    return False
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(8192):
+                        f.write(chunk)
+            os.replace(tmp_path, save_path)
+            return True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _fetch_blocking(self, url, save_path):
+        # 与 CharacterCardGenerator 相同，requests 只在真正下载时导入
+        import requests
+
+        response = requests.get(url, stream=True, timeout=30)
+        if response.status_code != 200:
+            return False
+        self.generator.save_response(response, save_path)
+        return True
+
+    async def download_with_fallback(self, urls, save_path, image_type):
+        """依次尝试候选URL，命中素材缓存时不发起请求"""
+        asset_cache = self.generator.asset_cache
+        for url in urls:
+            if asset_cache and asset_cache.fetch(url, save_path):
+                print(f"使用缓存的{image_type}: {url}")
+                return True
+            try:
+                if await self.fetch(url, save_path):
+                    if asset_cache:
+                        asset_cache.store(url, save_path)
+                    print(f"成功下载{image_type}: {url}")
+                    return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"尝试下载{image_type}失败: {url}, 错误: {str(e)}")
+
+        print(f"所有{image_type}URL尝试失败")
+        return False
+
+    async def create_card(self, character_name, output_dir=None):
+        """异步创建一张角色信息卡，成功返回保存路径，失败返回None"""
+        avatar_urls, sd_model_urls, _ = self.generator.get_download_urls(character_name)
+        avatar_path, sd_model_path = self.generator.get_temp_paths(character_name)
+
+        avatar_available, sd_model_available = await asyncio.gather(
+            self.download_with_fallback(avatar_urls, avatar_path, "头像"),
+            self.download_with_fallback(sd_model_urls, sd_model_path, "SD模型"),
+        )
+
+        return await self.run_in_executor(self.generator.compose_character_card, character_name,
+                                          avatar_path, sd_model_path, avatar_available, sd_model_available,
+                                          output_dir)
+
+    async def iter_cards(self, character_names, output_dir=None):
+        """并发创建多张角色卡，按完成顺序产出 (角色名, 保存路径或None)"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(name):
+            async with semaphore:
+                return name, await self.create_card(name, output_dir)
+
+        tasks = [asyncio.ensure_future(worker(name)) for name in character_names]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            # 迭代提前结束或被取消时，停止还没完成的角色
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def batch_create_cards(self, character_names, output_dir=None):
+        """创建全部角色卡，返回 {角色名: 保存路径或None}"""
+        return {name: path async for name, path in self.iter_cards(character_names, output_dir)}
+
+    async def iter_pages(self, resume=True):
+        """逐页渲染页面，每完成一页产出 (页码, 文件路径)"""
+        output_dir = self.config.get("pages_folder")
+        pages = await self.run_in_executor(self.page_builder.plan_pages)
+        if not pages:
+            return
+
+        os.makedirs(output_dir, exist_ok=True)
+        page_iter = self.page_builder.iter_saved_pages(pages, output_dir, resume)
+        loop = asyncio.get_running_loop()
+        done = object()
+        step = None
+        try:
+            while True:
+                # 每次只在执行器中推进一页，两页之间可以响应取消
+                step = loop.run_in_executor(self.executor, next, page_iter, done)
+                item = await asyncio.shield(step)
+                if item is done:
+                    break
+                spec, png_path = item
+                yield spec["page_number"], png_path
+        finally:
+            # 被取消时等正在渲染的这一页结束，再关闭生成器；关闭时要等页面流水线的线程退出，
+            # 同样放到执行器中，不阻塞事件循环
+            if step is not None and not step.done():
+                await asyncio.wait({step})
+            await loop.run_in_executor(self.executor, page_iter.close)
+
+    async def build_pages(self, resume=True):
+        """渲染所有页面，返回页面文件路径列表"""
+        return [png_path async for _, png_path in self.iter_pages(resume)]
+
+    async def iter_pdf(self, pages_folder=None, output_pdf=None):
+        """合并PDF，每写入一页产出 (序号, 总页数, 页面路径)；最后一项为 ("done", 是否成功, 输出路径)"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        cancelled = False
+
+        def progress(index, total, png_path):
+            if cancelled:
+                raise PipelineCancelled("合并已取消")
+            loop.call_soon_threadsafe(queue.put_nowait, (index, total, png_path))
+
+        future = loop.run_in_executor(self.executor, functools.partial(
+            create_pdf_from_pages, pages_folder, output_pdf, self.config_file, self.context, progress))
+
+        getter = None
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                finished, _ = await asyncio.wait({getter, future}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in finished:
+                    yield getter.result()
+                    continue
+
+                getter.cancel()
+                while not queue.empty():
+                    yield queue.get_nowait()
+                output_pdf = output_pdf or self.config.get("students_pdf", "students.pdf")
+                yield "done", future.result(), output_pdf
+                return
+        finally:
+            # 被取消时通知同步线程在下一页处停止，并等待其退出
+            cancelled = True
+            if getter is not None:
+                getter.cancel()
+            if not future.done():
+                await asyncio.wait({future})
+
+    async def build_pdf(self, pages_folder=None, output_pdf=None):
+        """合并PDF，返回是否成功"""
+        success = False
+        async for event in self.iter_pdf(pages_folder, output_pdf):
+            if event[0] == "done":
+                success = event[1]
+        return success
@@ -0,0 +1,77 @@
+"""页面交接方式基准测试：对比中间PNG文件与共享内存页面槽两种方式生成整本PDF的耗时和峰值内存
+
+每种方式在独立的子进程中运行，峰值内存取该进程及其渲染子进程各自的最大RSS。
+
+用法: python benchmarks/bench_handoff.py [-c config.json] [-w 渲染进程数]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from build_context import BuildContext, load_config_file  # noqa: E402
+from build_planner import peak_rss_bytes  # noqa: E402
+
+
+def run_mode(mode, config_file, workers, workspace):
+    """在当前进程中按指定方式构建一次，返回耗时和峰值RSS"""
+    config = load_config_file(config_file)
+    config["cards_folder"] = os.path.abspath(config.get("cards_folder") or "character_cards")
+    context = BuildContext(config=config, workspace=workspace)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "file":
+            from mix_pdf import create_pdf_from_pages
+            from school_cards_to_png import SchoolCardsToPNG
+            ok = (SchoolCardsToPNG(context=context).create_pages_by_schools(resume=False)
+                  and create_pdf_from_pages(context=context))
+        else:
+            from shared_pages import build_pdf_shared
+            ok = build_pdf_shared(context=context, workers=workers)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "ok": bool(ok),
+        "seconds": elapsed,
+        "rss_mb": peak_rss_bytes() / 1024 / 1024,
+        "child_rss_mb": peak_rss_bytes(resource.RUSAGE_CHILDREN) / 1024 / 1024,
+        "pdf_mb": os.path.getsize(context.students_pdf) / 1024 / 1024 if ok else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比页面交接方式的耗时和峰值内存')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='共享内存方式的渲染进程数 (默认: 2)')
+    parser.add_argument('--run', choices=['file', 'shared'], help=argparse.SUPPRESS)
+    parser.add_argument('--workspace', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.config, args.workers, args.workspace)))
+        return
+
+    print(f"{'方式':<16}{'耗时(s)':>10}{'主进程RSS(MB)':>16}{'子进程RSS(MB)':>16}{'PDF(MB)':>10}")
+    for mode, label in (("file", "PNG文件"), ("shared", f"共享内存 x{args.workers}")):
+        with tempfile.TemporaryDirectory() as workspace:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode, '-c', args.config,
+                                     '-w', str(args.workers), '--workspace', workspace],
+                                    capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        status = "" if result["ok"] else "  (失败)"
+        print(f"{label:<16}{result['seconds']:>10.2f}{result['rss_mb']:>16.0f}"
+              f"{result['child_rss_mb']:>16.0f}{result['pdf_mb']:>10.1f}{status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""缩放策略基准测试：对比直接LANCZOS与 image_ops.resize_image 各档位在实际尺寸下的耗时
+
+用法: python benchmarks/bench_resample.py [-n 重复次数]
+"""
+import argparse
+import os
+import sys
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_ops import QUALITY_TIERS, choose_strategy, resize_image  # noqa: E402
+
+# (场景, 源尺寸, 目标尺寸)：角色卡为 1006x656，A4页面宽 2481 像素
+CASES = [
+    ("卡片 每行3张 300dpi", (1006, 656), (753, 491)),
+    ("卡片 每行6张 300dpi", (1006, 656), (366, 238)),
+    ("卡片 预览 40dpi", (1006, 656), (100, 65)),
+    ("学院图标", (1024, 768), (240, 180)),
+    ("本地大图 -> 头像", (6000, 4000), (404, 456)),
+]
+
+
+def make_source(size):
+    """生成带细节的测试图像（渐变加网格线），避免纯色图像让缩放显得过快"""
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.ROTATE_90).resize(size), gradient))
+    draw = ImageDraw.Draw(img)
+    for x in range(0, size[0], 7):
+        draw.line([(x, 0), (x, size[1])], fill=(255, 255, 255))
+    return img
+
+
+def timed(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='缩放策略基准测试')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='每项重复次数，取最快一次 (默认: 5)')
+    args = parser.parse_args()
+
+    print(f"{'场景':<22}{'策略':<10}{'reduce':>8}{'耗时ms':>10}{'加速':>8}{'平均误差':>10}")
+    for name, src_size, dst_size in CASES:
+        src = make_source(src_size)
+        base_time, reference = timed(lambda: src.resize(dst_size, Image.Resampling.LANCZOS), args.repeat)
+        print(f"{name:<22}{'LANCZOS':<10}{'-':>8}{base_time * 1000:>10.1f}{'1.00x':>8}{'-':>10}")
+
+        for quality in QUALITY_TIERS:
+            factor, _ = choose_strategy(src_size, dst_size, quality)
+            cost, result = timed(lambda: resize_image(src, dst_size, quality), args.repeat)
+            error = sum(ImageStat.Stat(ImageChops.difference(result, reference)).mean) / 3
+            print(f"{'':<22}{quality:<10}{factor:>8}{cost * 1000:>10.1f}{base_time / cost:>7.2f}x{error:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""启动时间基准测试：在全新的解释器中测量图形界面和各命令行工具的启动耗时
+
+带 argparse 的工具测量 `--help` 的总耗时（导入加上参数解析）。其他工具运行时会直接开始生成，
+所以只测量导入模块的耗时。每个目标重复运行若干次并取中位数，同时列出导入最慢的模块，
+便于发现被提前加载的重量级依赖。可以把结果保存为JSON，之后用 --baseline 对比。
+
+用法: python benchmarks/bench_startup.py [-n 重复次数] [-o 结果.json] [--baseline 旧结果.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 图形界面：导入 Main.py（窗口出现之前的全部准备工作）
+GUI_TARGETS = [
+    ("Main.py (导入)", ["-c", "import Main"]),
+]
+
+# 有显示器时额外测量创建窗口并完成第一次绘制的耗时
+GUI_WINDOW_SNIPPET = (
+    "import tkinter as tk, Main\n"
+    "root = tk.Tk()\n"
+    "app = Main.CharacterCardApp(root)\n"
+    "root.update()\n"
+    "root.destroy()\n"
+)
+
+# 使用 argparse 的命令行工具
+HELP_CLIS = [
+    "build_planner.py",
+    "build_service.py",
+    "card_dedup.py",
+    "create_pdf_from_images.py",
+    "create_text_image.py",
+    "incremental_build.py",
+    "multi_resolution.py",
+    "preview.py",
+    "render_jobs.py",
+    "school_shards.py",
+    "shared_pages.py",
+    "watch_build.py",
+]
+
+# 运行即开始生成的工具，只测量导入
+IMPORT_CLIS = [
+    "character_card_generator",
+    "school_cards_to_png",
+    "mix_pdf",
+]
+
+
+def targets(include_window):
+    """[(名称, 解释器参数), ...]"""
+    result = [("python (空解释器)", ["-c", "pass"])]
+    result += GUI_TARGETS
+    if include_window:
+        result.append(("Main.py (窗口)", ["-c", GUI_WINDOW_SNIPPET]))
+    result += [(script, [script, "--help"]) for script in HELP_CLIS]
+    result += [(f"{module}.py (导入)", ["-c", f"import {module}"]) for module in IMPORT_CLIS]
+    return result
+
+
+def time_once(args):
+    """在新进程中运行一次，返回耗时（秒）"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def import_times(args):
+    """用 -X importtime 统计各顶层包的累计导入耗时：{包名: 毫秒}"""
+    output = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True).stderr
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        # 父包的累计时间已包含子模块，按包取最大值
+        packages[package] = max(packages.get(package, 0), int(cumulative) / 1000)
+    return packages
+
+
+def slowest_imports(args, startup_packages, top=3):
+    """导入耗时最长的外部包，不含本项目模块和空解释器启动时就会导入的包：[(包名, 毫秒), ...]"""
+    packages = [(package, ms) for package, ms in import_times(args).items()
+                if package not in startup_packages and not package.startswith("_")
+                and not os.path.exists(os.path.join(ROOT, f"{package}.py"))]
+    return sorted(packages, key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量图形界面和各命令行工具的启动耗时')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='每个目标的运行次数 (默认: 5)')
+    parser.add_argument('-o', '--output', help='把结果保存为JSON文件')
+    parser.add_argument('--baseline', help='与之前保存的JSON结果对比')
+    parser.add_argument('--window', action='store_true',
+                        help='同时测量创建主窗口的耗时（需要图形显示环境）')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    startup_packages = set(import_times(["-c", "pass"]))
+    results = {}
+    print(f"{'目标':<34}{'中位数(ms)':>12}{'最短(ms)':>10}{'对比':>10}  最慢的导入")
+    for name, target_args in targets(args.window):
+        try:
+            samples = [time_once(target_args) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError:
+            print(f"{name:<34}{'运行失败':>12}")
+            continue
+
+        median_ms = statistics.median(samples) * 1000
+        results[name] = round(median_ms, 1)
+        delta = f"{median_ms - baseline[name]:+.0f}" if name in baseline else ""
+        imports = ", ".join(f"{module} {ms:.0f}" for module, ms in slowest_imports(target_args, startup_packages))
+        print(f"{name:<34}{median_ms:>12.0f}{min(samples) * 1000:>10.0f}{delta:>10}  {imports}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,816 @@
+"""输出一致性检查：用固定的合成名单生成角色卡、页面和PDF，与保存的基准输出逐项比较
+
+优化卡片、页面或PDF的代码时，重采样方式、透明通道处理、页面编号和对比度增强都可能在不经意间
+改变输出。这个脚本把固定名单依次交给 compose_character_card（下载之后的合成部分，不联网）、
+create_pages_by_schools 和 create_pdf_from_pages，然后：
+
+- 每张卡片、每一页和PDF中每一页的图像：比较解码后像素的SHA-256，不同时再计算感知差异
+  （平均差值、轻微模糊后差异明显的像素比例），按容差判断是否可以接受；
+- PDF结构：页数、页面尺寸、每页图像的尺寸、色彩空间和摆放位置、书签，逐项比较。
+  图像的压缩方式（直接嵌入PNG数据、重新压缩等）属于实现细节，不参与比较。
+
+容差按条目设置，保存在基准目录的 tolerances.json 中：键是条目名的通配模式（如 "pages/*"、
+"pages/0003"、"cards/格黑娜/*"），值包含 exact（必须完全相同）、mean（平均差值上限，0-255）、
+changed（差异像素比例上限）和 threshold（多大的差值算差异像素）。所有匹配的模式按文件中的顺序
+合并，写在后面的覆盖前面的。
+
+用法:
+  python benchmarks/golden_outputs.py record [-g 基准目录]
+      用参考实现生成基准输出
+  python benchmarks/golden_outputs.py check [-g 基准目录] [--set pdf_backend=reportlab ...]
+      重新生成并与基准比较，--set 覆盖配置，用来检查某条快速路径
+  python benchmarks/golden_outputs.py compare --set page_format=compact [--set ...]
+      不使用保存的基准：在临时目录中分别用参考配置和修改后的配置生成，直接比较
+有任何一项不通过时退出码为1。基准输出与字体和 Pillow 版本有关，应在同一环境中生成和检查。
+"""
+import argparse
+import base64
+import contextlib
+import copy
+import fnmatch
+import functools
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+# regression_suite 在导入时把项目根目录加入 sys.path
+from regression_suite import make_source
+
+from build_checkpoint import atomic_write_bytes
+
+# 固定名单：{学院: [(角色名, 头像类型, SD模型类型), ...]}
+# 类型见 make_fixture_image；missing 表示该图像下载失败，使用占位图。
+# 格黑娜的卡片超过一页，千年不在 school_order 中，检查分页和学院排序；
+# 千年的图标和一张卡片是调色板模式（见 PALETTE_SCHOOL）。
+FIXTURE_ROSTER = {
+    "阿拜多斯": [
+        ("学生1", "rgb", "rgb"),
+        ("学生2", "rgba", "rgb"),
+        ("学生3", "palette", "gray"),
+        ("学生4", "missing", "rgba"),
+        ("学生5", "la", "missing"),
+    ],
+    "格黑娜": [(f"学生{i}", "rgb", "rgba" if i % 3 == 0 else "rgb") for i in range(11, 24)]
+             + [("测试31/泳装", "small", "palette")],
+    "千年": [
+        ("学生41", "rgba", "palette"),
+    ],
+}
+
+AVATAR_SIZE = (404, 456)
+SD_MODEL_SIZE = (452, 452)
+SMALL_SIZE = (300, 380)
+
+# 直接放入学院文件夹的调色板模式图标和卡片，尺寸足够大，缩小时会先整数 reduce
+# （reduce 不支持调色板模式，需要先转换）
+PALETTE_SCHOOL = "千年"
+PALETTE_ICON_SIZE = (1600, 1200)
+PALETTE_CARD_SIZE = (3300, 4400)
+PALETTE_CARD_NAME = "学生49_card.png"
+
+# 手动指定的本地头像文件（process_local_image）：{条目名: 图像类型}，大倍数缩小
+LOCAL_IMAGES = {"palette": "palette", "bilevel": "bilevel", "gray16": "gray16"}
+LOCAL_IMAGE_SIZE = (2500, 2800)
+
+# 使用较低的DPI，检查一次只需要几秒；其余参数与默认配置一致
+FIXTURE_CONFIG = {
+    "cards_per_row": 2,
+    "dpi": 150,
+    "margin": 80,
+    "add_contrast": True,
+    "contrast_factor": 1.2,
+    "school_order": ["阿拜多斯", "格黑娜"],
+    "page_format": "balanced",
+    "pdf_backend": "stream",
+    "interactive": False,
+}
+
+# 新建基准目录时写入的默认容差
+DEFAULT_TOLERANCES = {
+    "*": {"exact": False, "mean": 0.25, "changed": 0.0005, "threshold": 12},
+}
+
+# 感知差异比较前的模糊半径，忽略重采样带来的单像素抖动
+DIFF_BLUR_RADIUS = 1
+
+# PDF中的坐标比较精度（点）
+PDF_COORDINATE_TOLERANCE = 0.01
+
+MANIFEST_NAME = "manifest.json"
+TOLERANCES_NAME = "tolerances.json"
+IMAGES_DIR = "images"
+
+
+def make_fixture_image(kind, size, seed):
+    """按类型生成输入图像，覆盖各种需要拍平到RGB的模式"""
+    if kind == "small":
+        kind, size = "rgb", SMALL_SIZE
+    img = make_source(size, seed)
+    if kind == "rgb":
+        return img
+    if kind == "gray":
+        return img.convert('L')
+    if kind in ("rgba", "la"):
+        # 中间完全不透明，边缘渐变到透明
+        alpha = Image.radial_gradient('L').resize(size).point(lambda v: 255 - v)
+        img = img.convert('RGBA' if kind == "rgba" else 'LA')
+        img.putalpha(alpha)
+        return img
+    if kind == "palette":
+        img = img.quantize(64)
+        ImageDraw.Draw(img).rectangle([0, 0, size[0] // 4, size[1] // 4], fill=0)
+        img.info['transparency'] = 0
+        return img
+    if kind == "bilevel":
+        return img.convert('1')
+    if kind == "gray16":
+        return img.convert('L').point(lambda v: v * 257, 'I').convert('I;16')
+    raise ValueError(f"未知的图像类型: {kind}")
+
+
+def fixture_cards(roster):
+    """[(学院, 角色名, 头像类型, SD模型类型, 随机种子), ...]"""
+    cards = []
+    for school_index, (school_name, entries) in enumerate(roster.items()):
+        for card_index, (name, avatar_kind, sd_model_kind) in enumerate(entries):
+            cards.append((school_name, name, avatar_kind, sd_model_kind, school_index * 1000 + card_index))
+    return cards
+
+
+def make_large_palette(size, seed):
+    """大尺寸的调色板图像：在小图上量化后按最近邻放大，避免量化大图的开销"""
+    small = make_fixture_image("palette", (size[0] // 8, size[1] // 8), seed)
+    large = small.resize(size, Image.Resampling.NEAREST)
+    large.info['transparency'] = 0
+    return large
+
+
+def local_image_path(context, key):
+    return os.path.join(context.workspace, "local", f"{key}.png")
+
+
+def render_fixture(config, workspace):
+    """在工作区中生成卡片、页面和PDF，返回构建环境"""
+    from build_context import BuildContext
+    from character_card_generator import CharacterCardGenerator
+    from mix_pdf import create_pdf_from_pages
+    from school_cards_to_png import SchoolCardsToPNG
+
+    context = BuildContext(config=config, workspace=workspace)
+    generator = CharacterCardGenerator(context=context)
+    scratch = context.get_scratch_dir()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for school_index, school_name in enumerate(FIXTURE_ROSTER):
+            school_folder = os.path.join(context.cards_folder, school_name)
+            os.makedirs(school_folder, exist_ok=True)
+            if school_name == PALETTE_SCHOOL:
+                make_large_palette(PALETTE_ICON_SIZE, school_index + 500).save(os.path.join(school_folder, "icon.png"))
+                make_large_palette(PALETTE_CARD_SIZE, school_index + 600).save(
+                    os.path.join(school_folder, PALETTE_CARD_NAME))
+            else:
+                make_source((300, 200), school_index + 500).save(os.path.join(school_folder, "icon.png"))
+
+        for school_name, name, avatar_kind, sd_model_kind, seed in fixture_cards(FIXTURE_ROSTER):
+            paths = []
+            for kind, size, suffix in ((avatar_kind, AVATAR_SIZE, "avatar"), (sd_model_kind, SD_MODEL_SIZE, "sd_model")):
+                path = os.path.join(scratch, f"{seed}_{suffix}.png")
+                if kind != "missing":
+                    make_fixture_image(kind, size, seed if suffix == "avatar" else seed + 500).save(path)
+                paths.append(path)
+            school_folder = os.path.join(context.cards_folder, school_name)
+            if generator.compose_character_card(name, paths[0], paths[1], avatar_kind != "missing",
+                                                sd_model_kind != "missing", school_folder) is None:
+                raise RuntimeError(f"角色卡合成失败: {name}")
+
+        os.makedirs(os.path.join(workspace, "local"), exist_ok=True)
+        for index, (key, kind) in enumerate(LOCAL_IMAGES.items()):
+            source_path = os.path.join(scratch, f"local_{key}.png")
+            make_fixture_image(kind, LOCAL_IMAGE_SIZE, 900 + index).save(source_path)
+            processed = generator.process_local_image(source_path, AVATAR_SIZE, "头像")
+            if processed is None:
+                raise RuntimeError(f"本地图像处理失败: {key}")
+            processed.save(local_image_path(context, key), 'PNG')
+
+        if not SchoolCardsToPNG(context=context).create_pages_by_schools(resume=False):
+            raise RuntimeError("页面生成失败")
+        if not create_pdf_from_pages(context=context):
+            raise RuntimeError("PDF合并失败")
+
+    return context
+
+
+# ---- PDF解析：只读取比较结构和图像所需的部分，不支持对象流和交叉引用流（本项目的两种后端都不使用）----
+
+class Name(str):
+    """PDF名称对象"""
+
+
+class Ref(int):
+    """间接引用（只记录对象号）"""
+
+
+class Operator(str):
+    """内容流中的操作符或其他关键字"""
+
+
+WHITESPACE = b' \t\r\n\x0c\x00'
+DELIMITERS = b'()<>[]{}/%'
+REF_PATTERN = re.compile(rb'\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])')
+OBJECT_PATTERN = re.compile(rb'(\d+)\s+\d+\s+obj\b')
+NUMBER_PATTERN = re.compile(rb'[+-]?(\d+\.?\d*|\.\d+)$')
+LITERAL_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def skip_space(data, pos):
+    while pos < len(data):
+        char = data[pos]
+        if char in WHITESPACE:
+            pos += 1
+        elif char == ord('%'):
+            end = data.find(b'\n', pos)
+            pos = len(data) if end < 0 else end + 1
+        else:
+            break
+    return pos
+
+
+def read_token(data, pos):
+    """读取一个普通字符组成的记号，返回 (记号, 新位置)"""
+    end = pos
+    while end < len(data) and data[end] not in WHITESPACE and data[end] not in DELIMITERS:
+        end += 1
+    return data[pos:end], end
+
+
+def read_literal(data, pos):
+    """读取 (...) 字符串，pos 指向左括号之后"""
+    result = bytearray()
+    depth = 1
+    while pos < len(data):
+        char = data[pos:pos + 1]
+        pos += 1
+        if char == b'\\':
+            escaped = data[pos:pos + 1]
+            pos += 1
+            if escaped in LITERAL_ESCAPES:
+                result += LITERAL_ESCAPES[escaped]
+            elif escaped.isdigit():
+                digits = re.match(rb'[0-7]{1,3}', data[pos - 1:pos + 2]).group()
+                result.append(int(digits, 8) & 0xFF)
+                pos += len(digits) - 1
+            elif escaped == b'\r':
+                if data[pos:pos + 1] == b'\n':
+                    pos += 1
+            elif escaped != b'\n':
+                result += escaped
+            continue
+        if char == b'(':
+            depth += 1
+        elif char == b')':
+            depth -= 1
+            if depth == 0:
+                return bytes(result), pos
+        result += char
+    raise ValueError("PDF字符串没有结束")
+
+
+def parse_value(data, pos):
+    """从 pos 处解析一个PDF对象，返回 (值, 新位置)"""
+    pos = skip_space(data, pos)
+    if data.startswith(b'<<', pos):
+        result = {}
+        pos += 2
+        while True:
+            pos = skip_space(data, pos)
+            if data.startswith(b'>>', pos):
+                return result, pos + 2
+            key, pos = parse_value(data, pos)
+            result[key], pos = parse_value(data, pos)
+    char = data[pos:pos + 1]
+    if char == b'[':
+        result = []
+        pos += 1
+        while True:
+            pos = skip_space(data, pos)
+            if data.startswith(b']', pos):
+                return result, pos + 1
+            value, pos = parse_value(data, pos)
+            result.append(value)
+    if char == b'<':
+        end = data.index(b'>', pos)
+        digits = re.sub(rb'\s', b'', data[pos + 1:end])
+        return bytes.fromhex((digits + b'0' * (len(digits) % 2)).decode('ascii')), end + 1
+    if char == b'(':
+        return read_literal(data, pos + 1)
+    if char == b'/':
+        token, pos = read_token(data, pos + 1)
+        name = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), token)
+        return Name(name.decode('latin-1')), pos
+    if char in (b')', b'>', b']', b'{', b'}'):
+        return Operator(char.decode('latin-1')), pos + 1
+
+    token, end = read_token(data, pos)
+    if NUMBER_PATTERN.match(token):
+        if b'.' not in token:
+            ref = REF_PATTERN.match(data, end)
+            if ref:
+                return Ref(int(token)), ref.end()
+            return int(token), end
+        return float(token), end
+    return {b'true': True, b'false': False, b'null': None}.get(token, Operator(token.decode('latin-1'))), end
+
+
+class PdfDocument:
+    """按顺序扫描文件中的所有间接对象"""
+
+    def __init__(self, data):
+        self.objects = {}
+        pos = 0
+        while True:
+            match = OBJECT_PATTERN.search(data, pos)
+            if not match:
+                break
+            value, pos = parse_value(data, match.end())
+            stream = None
+            after = skip_space(data, pos)
+            if data.startswith(b'stream', after):
+                start = after + len(b'stream')
+                start += 2 if data.startswith(b'\r\n', start) else 1
+                length = value.get('Length')
+                if type(length) is int and data.startswith(b'endstream', skip_space(data, start + length)):
+                    end = start + length
+                else:
+                    # 长度是间接引用时按 endstream 查找
+                    end = data.index(b'endstream', start)
+                    end -= 2 if data[end - 2:end] == b'\r\n' else 1 if data[end - 1:end] in (b'\r', b'\n') else 0
+                stream = data[start:end]
+                pos = end
+            self.objects[int(match.group(1))] = (value, stream)
+
+        trailer_at = data.rfind(b'trailer')
+        if trailer_at < 0:
+            raise ValueError("不支持使用交叉引用流的PDF")
+        self.trailer, _ = parse_value(data, trailer_at + len(b'trailer'))
+
+    def resolve(self, value):
+        while isinstance(value, Ref):
+            value = self.objects[value][0]
+        return value
+
+    def stream(self, ref):
+        return self.objects[ref][1]
+
+    def pages(self):
+        """按页序返回 [(页面字典, 继承后的 MediaBox, 继承后的 Resources), ...]"""
+        result = []
+
+        def walk(node, inherited):
+            node = self.resolve(node)
+            inherited = dict(inherited)
+            for key in ('MediaBox', 'Resources'):
+                if key in node:
+                    inherited[key] = self.resolve(node[key])
+            if node.get('Type') == 'Pages':
+                for kid in self.resolve(node['Kids']):
+                    walk(kid, inherited)
+            else:
+                result.append((node, inherited.get('MediaBox'), inherited.get('Resources', {})))
+
+        catalog = self.resolve(self.trailer['Root'])
+        walk(catalog['Pages'], {})
+        return result
+
+    def outline_titles(self):
+        catalog = self.resolve(self.trailer['Root'])
+        outlines = self.resolve(catalog.get('Outlines'))
+        titles = []
+        item = outlines.get('First') if outlines else None
+        while item is not None:
+            node = self.resolve(item)
+            titles.append(pdf_text_string(node.get('Title', b'')))
+            item = node.get('Next')
+        return titles
+
+
+def pdf_text_string(value):
+    if value.startswith(b'\xfe\xff'):
+        return value[2:].decode('utf-16-be')
+    return value.decode('latin-1')
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def decode_filters(data, filters, parms):
+    """依次应用过滤器；遇到带PNG预测器的 FlateDecode 时停止，返回 (数据, 剩余过滤器, 对应参数)"""
+    for index, (name, parm) in enumerate(zip(filters, parms)):
+        if name in ('ASCII85Decode', 'A85'):
+            data = data.strip()
+            data = base64.a85decode(data if data.endswith(b'~>') else data + b'~>', adobe=True)
+        elif name in ('FlateDecode', 'Fl'):
+            if parm and parm.get('Predictor', 1) >= 10:
+                return data, filters[index:], parms[index:]
+            data = zlib.decompress(data)
+        else:
+            return data, filters[index:], parms[index:]
+    return data, [], []
+
+
+def png_chunk(tag, body):
+    return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body))
+
+
+def decode_image(document, info, data):
+    """把图像XObject解码为PIL图像"""
+    filters = [str(f) for f in as_list(document.resolve(info.get('Filter')))]
+    parms = [document.resolve(p) for p in as_list(document.resolve(info.get('DecodeParms')))]
+    parms += [None] * (len(filters) - len(parms))
+    width, height = info['Width'], info['Height']
+    bits = info.get('BitsPerComponent', 8)
+    color_space = document.resolve(info['ColorSpace'])
+    palette = None
+    if isinstance(color_space, list):
+        base, lookup = color_space[1], color_space[3]
+        if isinstance(lookup, Ref):
+            # 调色板也可以是单独的流对象
+            lookup_filters = [str(f) for f in as_list(document.resolve(document.resolve(lookup).get('Filter')))]
+            lookup, _, _ = decode_filters(document.stream(lookup), lookup_filters, [None] * len(lookup_filters))
+        color_space, palette = 'Indexed', lookup
+        if document.resolve(base) != 'DeviceRGB':
+            raise ValueError(f"不支持的调色板色彩空间: {base}")
+
+    data, filters, parms = decode_filters(data, filters, parms)
+    if filters and filters[0] in ('DCTDecode', 'DCT'):
+        # Pillow 解码Adobe CMYK JPEG时已经处理了反相，不再应用 Decode 数组
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    color_type = {'DeviceGray': 0, 'DeviceRGB': 2, 'Indexed': 3}.get(color_space)
+    if color_type is None:
+        raise ValueError(f"不支持的色彩空间: {color_space}")
+    if filters:
+        if filters[0] not in ('FlateDecode', 'Fl') or len(filters) > 1:
+            raise ValueError(f"不支持的图像过滤器: {filters}")
+        # 带PNG预测器的Flate数据就是PNG的IDAT内容，补上文件头后交给Pillow解码
+        chunks = [png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bits, color_type, 0, 0, 0))]
+        if palette is not None:
+            chunks.append(png_chunk(b'PLTE', palette))
+        chunks += [png_chunk(b'IDAT', data), png_chunk(b'IEND', b'')]
+        img = Image.open(io.BytesIO(b'\x89PNG\r\n\x1a\n' + b''.join(chunks)))
+        img.load()
+    else:
+        mode = {'DeviceGray': 'L', 'DeviceRGB': 'RGB', 'Indexed': 'P'}[color_space]
+        rawmode = mode if bits == 8 else f"{mode};{bits}" if mode != 'RGB' else mode
+        if mode == 'L' and bits == 1:
+            mode, rawmode = '1', '1'
+        img = Image.frombytes(mode, (width, height), data, 'raw', rawmode)
+        if palette is not None:
+            img.putpalette(palette)
+
+    decode = document.resolve(info.get('Decode'))
+    if decode and palette is None and all(decode[i] == 1 and decode[i + 1] == 0 for i in range(0, len(decode), 2)):
+        img = Image.eval(img, lambda v: 255 - v)
+    return img
+
+
+def multiply(m, n):
+    """矩阵 m × n（PDF的6元组形式）"""
+    return [m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5]]
+
+
+def content_data(document, contents):
+    """页面或表单的内容流（多个内容流首尾相接）"""
+    parts = []
+    for ref in as_list(contents):
+        info = document.resolve(ref)
+        filters = [str(f) for f in as_list(document.resolve(info.get('Filter')))]
+        data, remaining, _ = decode_filters(document.stream(ref), filters, [None] * len(filters))
+        if remaining:
+            raise ValueError(f"不支持的内容流过滤器: {remaining}")
+        parts.append(data)
+    return b'\n'.join(parts)
+
+
+def page_images(document, data, resources, ctm, found):
+    """执行内容流中的图形状态操作，收集 [(图像引用, 变换矩阵), ...]"""
+    xobjects = document.resolve(document.resolve(resources).get('XObject', {}))
+    stack = []
+    operands = []
+    pos = 0
+    while True:
+        pos = skip_space(data, pos)
+        if pos >= len(data):
+            break
+        value, pos = parse_value(data, pos)
+        if not isinstance(value, Operator):
+            operands.append(value)
+            continue
+        if value == 'q':
+            stack.append(ctm)
+        elif value == 'Q' and stack:
+            ctm = stack.pop()
+        elif value == 'cm' and len(operands) >= 6:
+            ctm = multiply([float(v) for v in operands[-6:]], ctm)
+        elif value == 'Do' and operands:
+            ref = xobjects.get(operands[-1])
+            info = document.resolve(ref)
+            if info.get('Subtype') == 'Image':
+                found.append((ref, ctm))
+            elif info.get('Subtype') == 'Form':
+                matrix = [float(v) for v in info.get('Matrix', [1, 0, 0, 1, 0, 0])]
+                page_images(document, content_data(document, ref), info.get('Resources', resources),
+                            multiply(matrix, ctm), found)
+        operands = []
+    return found
+
+
+def read_pdf(pdf_path):
+    """PDF的结构描述和每页图像：(结构, {条目名: PIL图像})"""
+    with open(pdf_path, 'rb') as f:
+        document = PdfDocument(f.read())
+
+    pages = []
+    images = {}
+    for page_index, (page, media_box, resources) in enumerate(document.pages()):
+        found = page_images(document, content_data(document, page.get('Contents')), resources,
+                            [1, 0, 0, 1, 0, 0], [])
+        page_images_info = []
+        for image_index, (ref, ctm) in enumerate(found):
+            info = document.resolve(ref)
+            color_space = document.resolve(info['ColorSpace'])
+            page_images_info.append({
+                "width": info['Width'],
+                "height": info['Height'],
+                "color_space": str(color_space[0] if isinstance(color_space, list) else color_space),
+                "soft_mask": 'SMask' in info,
+                "placement": [round(v, 4) for v in ctm],
+            })
+            key = f"pdf/{page_index + 1:04d}" + (f"_{image_index + 1}" if image_index else "")
+            images[key] = decode_image(document, info, document.stream(ref))
+        pages.append({"media_box": [float(v) for v in document.resolve(media_box)], "images": page_images_info})
+
+    return {"page_count": len(pages), "pages": pages, "outlines": document.outline_titles()}, images
+
+
+# ---- 输出收集和比较 ----
+
+def collect_outputs(context):
+    """{条目名: 图像文件路径}；页面用不含扩展名的文件名，切换页面格式后仍能对应"""
+    from page_formats import list_page_files
+
+    outputs = {}
+    for school_name in FIXTURE_ROSTER:
+        school_folder = os.path.join(context.cards_folder, school_name)
+        for file_name in sorted(os.listdir(school_folder)):
+            if file_name != "icon.png":
+                outputs[f"cards/{school_name}/{os.path.splitext(file_name)[0]}"] = os.path.join(school_folder, file_name)
+    for key in LOCAL_IMAGES:
+        outputs[f"local/{key}"] = local_image_path(context, key)
+    for page_path in list_page_files(context.pages_folder):
+        outputs[f"pages/{os.path.splitext(os.path.basename(page_path))[0]}"] = page_path
+    return outputs
+
+
+def pixel_hash(img):
+    digest = hashlib.sha256(f"{img.mode} {img.width}x{img.height}\n".encode('ascii'))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def comparable(img):
+    """统一到RGB或RGBA再比较，调色板、灰度等模式的差异不算输出变化"""
+    has_alpha = 'A' in img.getbands() or 'transparency' in img.info
+    return img.convert('RGBA' if has_alpha else 'RGB')
+
+
+def pixel_diff(reference, actual, threshold):
+    """感知差异：{"mean": 平均差值, "changed": 差异像素比例, "max": 模糊后的最大差值}"""
+    reference, actual = comparable(reference), comparable(actual)
+    if reference.mode != actual.mode:
+        reference, actual = reference.convert('RGBA'), actual.convert('RGBA')
+
+    diff = ImageChops.difference(reference, actual)
+    mean = sum(ImageStat.Stat(diff).mean) / len(diff.getbands())
+
+    blur = ImageFilter.GaussianBlur(DIFF_BLUR_RADIUS)
+    blurred = ImageChops.difference(reference.filter(blur), actual.filter(blur))
+    per_pixel = functools.reduce(ImageChops.lighter, blurred.split())
+    histogram = per_pixel.histogram()
+    changed = sum(histogram[threshold + 1:]) / (per_pixel.width * per_pixel.height)
+    return {"mean": mean, "changed": changed, "max": per_pixel.getextrema()[1]}
+
+
+def load_tolerances(path):
+    if not os.path.exists(path):
+        return copy.deepcopy(DEFAULT_TOLERANCES)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def tolerance_for(key, tolerances):
+    """合并所有匹配条目名的容差设置，后出现的模式覆盖先出现的"""
+    result = dict(DEFAULT_TOLERANCES["*"])
+    for pattern, settings in tolerances.items():
+        if fnmatch.fnmatchcase(key, pattern):
+            result.update(settings)
+    return result
+
+
+def image_file(golden_dir, key):
+    return os.path.join(golden_dir, IMAGES_DIR, *key.split("/")) + ".png"
+
+
+def record_golden(config, golden_dir):
+    """生成并保存基准输出"""
+    from PIL import __version__ as pillow_version
+
+    with tempfile.TemporaryDirectory() as workspace:
+        context = render_fixture(config, workspace)
+        images = {key: Image.open(path) for key, path in collect_outputs(context).items()}
+        structure, pdf_images = read_pdf(context.students_pdf)
+        images.update(pdf_images)
+
+        if os.path.isdir(os.path.join(golden_dir, IMAGES_DIR)):
+            shutil.rmtree(os.path.join(golden_dir, IMAGES_DIR))
+        items = {}
+        for key, img in images.items():
+            path = image_file(golden_dir, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 参考图像无损保存，调色板等模式原样保留，哈希始终按解码后的像素计算
+            img.save(path, 'PNG', compress_level=1)
+            items[key] = {"sha256": pixel_hash(img), "mode": img.mode, "size": list(img.size)}
+            img.close()
+
+    manifest = {"pillow": pillow_version, "config": config, "items": items, "pdf": structure}
+    atomic_write_bytes(os.path.join(golden_dir, MANIFEST_NAME),
+                       json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # 已有的容差文件可能是手工调整过的，不覆盖
+    tolerances_path = os.path.join(golden_dir, TOLERANCES_NAME)
+    if not os.path.exists(tolerances_path):
+        atomic_write_bytes(tolerances_path, json.dumps(DEFAULT_TOLERANCES, ensure_ascii=False, indent=2).encode('utf-8'))
+    return manifest
+
+
+def compare_structure(expected, actual):
+    """比较两份PDF结构描述，返回差异说明列表"""
+    problems = []
+    if expected["page_count"] != actual["page_count"]:
+        problems.append(f"页数 {actual['page_count']}，基准为 {expected['page_count']}")
+    if expected["outlines"] != actual["outlines"]:
+        problems.append(f"书签 {actual['outlines']}，基准为 {expected['outlines']}")
+
+    def close(a, b):
+        return len(a) == len(b) and all(abs(x - y) <= PDF_COORDINATE_TOLERANCE for x, y in zip(a, b))
+
+    for index, (page, golden) in enumerate(zip(actual["pages"], expected["pages"])):
+        label = f"PDF第{index + 1}页"
+        if not close(page["media_box"], golden["media_box"]):
+            problems.append(f"{label} 页面尺寸 {page['media_box']}，基准为 {golden['media_box']}")
+        if len(page["images"]) != len(golden["images"]):
+            problems.append(f"{label} 有 {len(page['images'])} 个图像，基准为 {len(golden['images'])} 个")
+            continue
+        for image, golden_image in zip(page["images"], golden["images"]):
+            for field in ("width", "height", "color_space", "soft_mask"):
+                if image[field] != golden_image[field]:
+                    problems.append(f"{label} 图像 {field} 为 {image[field]}，基准为 {golden_image[field]}")
+            if not close(image["placement"], golden_image["placement"]):
+                problems.append(f"{label} 图像位置 {image['placement']}，基准为 {golden_image['placement']}")
+    return problems
+
+
+def check_against(golden_dir, overrides, tolerances_path=None, diff_dir=None, verbose=False):
+    """用基准中记录的配置加上 overrides 重新生成，与基准比较；全部通过时返回True"""
+    from PIL import __version__ as pillow_version
+
+    with open(os.path.join(golden_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    tolerances = load_tolerances(tolerances_path or os.path.join(golden_dir, TOLERANCES_NAME))
+    if manifest["pillow"] != pillow_version:
+        print(f"注意: 基准由 Pillow {manifest['pillow']} 生成，当前为 {pillow_version}")
+
+    config = dict(manifest["config"], **overrides)
+    counts = {"相同": 0, "容差内": 0, "不通过": 0}
+
+    with tempfile.TemporaryDirectory() as workspace:
+        context = render_fixture(config, workspace)
+        outputs = {key: Image.open(path) for key, path in collect_outputs(context).items()}
+        structure, pdf_images = read_pdf(context.students_pdf)
+        outputs.update(pdf_images)
+
+        structure_problems = compare_structure(manifest["pdf"], structure)
+        for problem in structure_problems:
+            print(f"不通过  PDF结构: {problem}")
+
+        for key in sorted(manifest["items"].keys() | outputs.keys()):
+            expected = manifest["items"].get(key)
+            img = outputs.get(key)
+            if expected is None or img is None:
+                print(f"不通过  {key}: {'基准中没有这一项' if expected is None else '没有生成'}")
+                counts["不通过"] += 1
+                continue
+
+            if pixel_hash(img) == expected["sha256"]:
+                counts["相同"] += 1
+                if verbose:
+                    print(f"相同    {key}")
+                continue
+
+            tolerance = tolerance_for(key, tolerances)
+            with Image.open(image_file(golden_dir, key)) as reference:
+                reference.load()
+            if list(img.size) != expected["size"]:
+                status, detail = "不通过", f"尺寸 {img.width}x{img.height}，基准为 {expected['size'][0]}x{expected['size'][1]}"
+            elif tolerance["exact"]:
+                status, detail = "不通过", "要求完全相同"
+            else:
+                diff = pixel_diff(reference, img, tolerance["threshold"])
+                ok = diff["mean"] <= tolerance["mean"] and diff["changed"] <= tolerance["changed"]
+                status = "容差内" if ok else "不通过"
+                detail = (f"平均差值 {diff['mean']:.3f} (上限 {tolerance['mean']})，"
+                          f"差异像素 {diff['changed']:.4%} (上限 {tolerance['changed']:.4%})，最大差值 {diff['max']}")
+            if status == "不通过" and diff_dir and reference.size == img.size:
+                save_diff_image(reference, img, os.path.join(diff_dir, *key.split("/")) + ".png")
+
+            counts[status] += 1
+            if status == "不通过" or verbose:
+                print(f"{status:<6}{key}: {detail}")
+
+        for img in outputs.values():
+            img.close()
+
+    print(f"共 {sum(counts.values())} 项图像: " + "，".join(f"{name} {count}" for name, count in counts.items())
+          + f"；PDF结构{'不通过' if structure_problems else '一致'}")
+    return counts["不通过"] == 0 and not structure_problems
+
+
+def save_diff_image(reference, actual, path):
+    """保存放大后的差异图，方便定位变化的位置"""
+    diff = ImageChops.difference(comparable(reference).convert('RGB'), comparable(actual).convert('RGB'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    diff.point(lambda v: min(255, v * 8)).save(path)
+
+
+def parse_overrides(items):
+    """把 --set 键=值 解析为配置字典，值按JSON解析，失败时当作字符串"""
+    overrides = {}
+    for item in items or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--set 需要 键=值 的形式: {item}")
+        try:
+            overrides[key] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[key] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用固定名单生成卡片、页面和PDF，与基准输出比较')
+    parser.add_argument('command', choices=['record', 'check', 'compare'],
+                        help='record 生成基准，check 与保存的基准比较，compare 参考配置与修改后的配置直接比较')
+    parser.add_argument('-g', '--golden', default='golden_outputs', help='基准目录 (默认: golden_outputs)')
+    parser.add_argument('--set', action='append', metavar='键=值', dest='overrides',
+                        help='覆盖配置，可重复，如 --set pdf_backend=reportlab')
+    parser.add_argument('--tolerances', help='使用指定的容差文件，代替基准目录中的 tolerances.json')
+    parser.add_argument('--diff-dir', help='把不通过条目的差异图保存到这个目录')
+    parser.add_argument('-v', '--verbose', action='store_true', help='列出所有条目，包括完全相同的')
+    args = parser.parse_args()
+
+    overrides = parse_overrides(args.overrides)
+
+    if args.command == 'record':
+        manifest = record_golden(dict(FIXTURE_CONFIG, **overrides), args.golden)
+        print(f"基准已保存到 {args.golden}: {len(manifest['items'])} 项图像，PDF {manifest['pdf']['page_count']} 页")
+        return
+
+    if args.command == 'check':
+        ok = check_against(args.golden, overrides, args.tolerances, args.diff_dir, args.verbose)
+    else:
+        with tempfile.TemporaryDirectory() as golden_dir:
+            record_golden(dict(FIXTURE_CONFIG), golden_dir)
+            ok = check_against(golden_dir, overrides, args.tolerances, args.diff_dir, args.verbose)
+
+    print("全部通过" if ok else "有检查项未通过")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
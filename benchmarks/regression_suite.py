@@ -0,0 +1,366 @@
+"""内存和吞吐量回归检查：在合成的角色卡上依次运行各构建阶段，检查峰值内存预算和吞吐量下限
+
+每个阶段在独立的子进程中运行，各阶段共用同一个临时工作区，后一阶段使用前一阶段的输出。
+子进程中用 tracemalloc 记录Python对象的峰值分配，并由后台线程每10毫秒采样一次RSS。
+Pillow 的像素缓冲区不经过 tracemalloc，图像对象一直不释放这类问题主要由RSS预算发现；
+阶段结束时的 tracemalloc 快照则指出仍然存活的分配来自哪一行代码，超出预算时一并列出。
+
+预算随合成数据的规模变化：内存预算 = 固定部分 + 每页（或每张卡片）的少量余量，页面缓冲区
+随页数增长时会立即超出；吞吐量下限以每秒卡片数、页数和写出的MB数给出。
+
+用法: python benchmarks/regression_suite.py [-n 每个学院的卡片数] [--floor-scale 0.5] [--stage pages]
+有任何一项不满足时退出码为1。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCHOOLS = ["阿拜多斯", "格黑娜", "千年"]
+
+# 第一个学院的图标和一张额外的卡片保存为调色板模式，覆盖缩放前的模式转换
+# （图标缩小倍数足够大，会先整数 reduce）
+PALETTE_ICON_SIZE = (1600, 1200)
+PALETTE_CARD_SIZE = (760, 1000)
+PALETTE_CARDS = 1
+
+FIXTURE_CONFIG = {
+    "cards_per_row": 3,
+    "dpi": 300,
+    "margin": 80,
+    "add_contrast": True,
+    "contrast_factor": 1.2,
+    "school_order": SCHOOLS,
+    "page_format": "balanced",
+    "pdf_backend": "stream",
+    "interactive": False,
+}
+
+# 各阶段的预算：(固定MB, 每页MB, 每张卡片MB)。合成数据为300dpi的A4页面，一页RGB像素约26MB，
+# 压缩整页时 tobytes 的结果及其拼接过程会在Python堆上短暂占用两页大小。内存在不同规模下应保持不变，
+# 每页、每卡的余量只用于清单等少量记录。吞吐量下限约为单核开发机实测值的三分之一。
+BUDGETS = {
+    "cards": {"rss_mb": (30, 0, 0.02), "traced_mb": (4, 0, 0.01),
+              "floors": {"cards/s": 7, "MB/s": 0.15}},
+    "pages": {"rss_mb": (110, 0.5, 0), "traced_mb": (4, 0.05, 0),
+              "floors": {"cards/s": 4, "pages/s": 0.3}},
+    "pdf": {"rss_mb": (200, 0.5, 0), "traced_mb": (70, 0.05, 0),
+            "floors": {"pages/s": 0.5, "MB/s": 1.2}},
+    "incremental": {"rss_mb": (230, 0.5, 0), "traced_mb": (70, 0.05, 0),
+                    "floors": {"cards/s": 4, "pages/s": 0.3}},
+}
+
+STAGE_ORDER = list(BUDGETS)
+
+# RSS采样间隔（秒）
+SAMPLE_INTERVAL = 0.01
+
+# tracemalloc 记录的调用栈深度，用于把 Pillow 内部的分配归到调用它的项目代码上
+TRACE_FRAMES = 12
+
+PIL_DIR = os.path.dirname(Image.__file__)
+
+
+def short_path(filename):
+    """本项目文件显示相对路径，Pillow 文件显示为 PIL/xxx.py"""
+    if filename.startswith(PIL_DIR):
+        return os.path.join("PIL", os.path.relpath(filename, PIL_DIR))
+    return os.path.relpath(filename, ROOT)
+
+
+def current_rss():
+    """当前进程的常驻内存（字节）；没有 /proc 时退回到历史峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        from build_planner import peak_rss_bytes
+        return peak_rss_bytes()
+
+
+class RssSampler:
+    """后台线程定期采样RSS，记录峰值"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+        return False
+
+
+def make_source(size, seed):
+    """生成带渐变、色块和线条的合成图像，压缩率接近真实立绘，不会像纯色图像那样过于理想"""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (gradient, gradient.transpose(Image.Transpose.ROTATE_90).resize(size),
+                              Image.new('L', size, rng.randrange(256))))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse([x, y, x + rng.randrange(40, 160), y + rng.randrange(40, 160)],
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    for x in range(0, size[0], rng.randrange(5, 12)):
+        draw.line([(x, 0), (x, size[1])], fill=(255, 255, 255))
+    return img
+
+
+def make_palette(size, seed):
+    """调色板模式的合成图像，带一个透明色"""
+    img = make_source(size, seed).quantize(64)
+    img.info['transparency'] = 0
+    return img
+
+
+def folder_bytes(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+
+def stage_cards(context, cards_per_school):
+    """合成角色卡：头像和SD模型使用合成图像，不联网"""
+    from character_card_generator import CharacterCardGenerator
+
+    generator = CharacterCardGenerator(context=context)
+    scratch = context.get_scratch_dir()
+    jobs = []
+    for school_index, school_name in enumerate(SCHOOLS):
+        school_folder = os.path.join(context.cards_folder, school_name)
+        os.makedirs(school_folder, exist_ok=True)
+        if school_index == 0:
+            make_palette(PALETTE_ICON_SIZE, school_index).save(os.path.join(school_folder, "icon.png"))
+            for i in range(PALETTE_CARDS):
+                card_path = os.path.join(school_folder, f"调色板{90000 + i}_card.png")
+                make_palette(PALETTE_CARD_SIZE, 90000 + i).save(card_path)
+        else:
+            make_source((300, 200), school_index).save(os.path.join(school_folder, "icon.png"))
+        for i in range(cards_per_school):
+            seed = school_index * 10000 + i
+            avatar_path = os.path.join(scratch, f"{seed}_avatar.png")
+            sd_model_path = os.path.join(scratch, f"{seed}_sd_model.png")
+            make_source((404, 456), seed).save(avatar_path)
+            make_source((452, 452), seed + 5000).save(sd_model_path)
+            jobs.append((f"学生{i + 1}", avatar_path, sd_model_path, school_folder))
+
+    def run():
+        for name, avatar_path, sd_model_path, school_folder in jobs:
+            if generator.compose_character_card(name, avatar_path, sd_model_path, True, True, school_folder) is None:
+                raise RuntimeError(f"角色卡合成失败: {name}")
+        written = sum(folder_bytes(os.path.join(context.cards_folder, school)) for school in SCHOOLS)
+        return {"cards": len(jobs), "bytes": written}
+
+    return run
+
+
+def stage_pages(context, cards_per_school):
+    from school_cards_to_png import SchoolCardsToPNG
+
+    builder = SchoolCardsToPNG(context=context)
+
+    def run():
+        if not builder.create_pages_by_schools(resume=False):
+            raise RuntimeError("页面生成失败")
+        return {"cards": cards_per_school * len(SCHOOLS) + PALETTE_CARDS, "pages": page_count(context.pages_folder),
+                "bytes": folder_bytes(context.pages_folder)}
+
+    return run
+
+
+def stage_pdf(context, cards_per_school):
+    from mix_pdf import create_pdf_from_pages
+
+    def run():
+        if not create_pdf_from_pages(context=context):
+            raise RuntimeError("PDF合并失败")
+        return {"pages": page_count(context.pages_folder), "bytes": os.path.getsize(context.students_pdf)}
+
+    return run
+
+
+def stage_incremental(context, cards_per_school):
+    from incremental_build import IncrementalBook
+
+    book = IncrementalBook(context=context)
+    output_pdf = os.path.join(context.workspace, "incremental.pdf")
+
+    def run():
+        if not book.build(output_pdf, full=True):
+            raise RuntimeError("增量PDF生成失败")
+        return {"cards": cards_per_school * len(SCHOOLS) + PALETTE_CARDS, "pages": page_count(context.pages_folder),
+                "bytes": os.path.getsize(output_pdf)}
+
+    return run
+
+
+STAGES = {
+    "cards": stage_cards,
+    "pages": stage_pages,
+    "pdf": stage_pdf,
+    "incremental": stage_incremental,
+}
+
+
+def page_count(pages_folder):
+    from page_formats import list_page_files
+    return len(list_page_files(pages_folder))
+
+
+def run_stage(stage, workspace, cards_per_school, top):
+    """在当前（子）进程中运行一个阶段，返回测量结果"""
+    from build_context import BuildContext
+
+    config = dict(FIXTURE_CONFIG)
+    context = BuildContext(config=config, workspace=workspace)
+
+    # 准备工作（导入、生成输入图像）不计入测量
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = STAGES[stage](context, cards_per_school)
+
+    tracemalloc.start(TRACE_FRAMES)
+    before = tracemalloc.take_snapshot()
+    baseline_rss = current_rss()
+    start = time.perf_counter()
+    with RssSampler() as sampler, contextlib.redirect_stdout(io.StringIO()):
+        units = run()
+    seconds = time.perf_counter() - start
+    _, traced_peak = tracemalloc.get_traced_memory()
+
+    # 阶段前后对比，只看本项目和 Pillow 中增长的分配；按调用栈中最近的本项目代码行汇总，
+    # 同时给出实际分配所在的行
+    sources = [tracemalloc.Filter(True, os.path.join(ROOT, "*")),
+               tracemalloc.Filter(True, os.path.join(PIL_DIR, "*")),
+               tracemalloc.Filter(False, __file__)]
+    after = tracemalloc.take_snapshot().filter_traces(sources)
+    sites = {}
+    for stat in after.compare_to(before.filter_traces(sources), 'traceback'):
+        if stat.size_diff <= 0:
+            continue
+        frames = list(stat.traceback)
+        owner = next((frame for frame in reversed(frames)
+                      if frame.filename.startswith(ROOT) and frame.filename != __file__), frames[-1])
+        key = (short_path(owner.filename), owner.lineno, short_path(frames[-1].filename), frames[-1].lineno)
+        size, count = sites.get(key, (0, 0))
+        sites[key] = (size + stat.size_diff, count + stat.count_diff)
+    sites = [{"site": f"{owner}:{line}" + ("" if (owner, line) == (alloc, alloc_line) else f" ({alloc}:{alloc_line})"),
+              "kb": size / 1024, "count": count}
+             for (owner, line, alloc, alloc_line), (size, count) in
+             sorted(sites.items(), key=lambda item: item[1][0], reverse=True)[:top]]
+    tracemalloc.stop()
+    context.cleanup()
+
+    mb = 1024 * 1024
+    return {
+        "stage": stage,
+        "seconds": seconds,
+        "units": units,
+        "rss_mb": (sampler.peak - baseline_rss) / mb,
+        "traced_mb": traced_peak / mb,
+        "sites": sites,
+    }
+
+
+def check(result, floor_scale):
+    """对照预算和下限检查一个阶段的结果，返回不满足的项目"""
+    budget = BUDGETS[result["stage"]]
+    units = result["units"]
+    pages, cards = units.get("pages", 0), units.get("cards", 0)
+    failures = []
+
+    for key, label in (("rss_mb", "RSS增量"), ("traced_mb", "Python分配峰值")):
+        fixed, per_page, per_card = budget[key]
+        limit = fixed + per_page * pages + per_card * cards
+        if result[key] > limit:
+            failures.append(f"{label} {result[key]:.1f} MB 超出预算 {limit:.1f} MB")
+
+    rates = {
+        "cards/s": cards / result["seconds"],
+        "pages/s": pages / result["seconds"],
+        "MB/s": units.get("bytes", 0) / 1024 / 1024 / result["seconds"],
+    }
+    for key, floor in budget["floors"].items():
+        floor *= floor_scale
+        if rates[key] < floor:
+            failures.append(f"吞吐量 {rates[key]:.2f} {key} 低于下限 {floor:.2f} {key}")
+    return rates, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='内存预算和吞吐量下限的回归检查')
+    parser.add_argument('-n', '--cards', type=int, default=24, help='每个学院的卡片数 (默认: 24)')
+    parser.add_argument('--stage', choices=STAGE_ORDER, action='append',
+                        help='只检查指定阶段（可重复；前置阶段仍会运行以准备输入）')
+    parser.add_argument('--floor-scale', type=float, default=1.0,
+                        help='吞吐量下限的缩放系数，较慢的机器上可以调低 (默认: 1.0)')
+    parser.add_argument('--top', type=int, default=8, help='超出预算时列出的分配位置数 (默认: 8)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='所有阶段都列出分配位置')
+    parser.add_argument('--run', choices=STAGE_ORDER, help=argparse.SUPPRESS)
+    parser.add_argument('--workspace', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_stage(args.run, args.workspace, args.cards, args.top), ensure_ascii=False))
+        return
+
+    selected = set(args.stage or STAGE_ORDER)
+    last = max(STAGE_ORDER.index(stage) for stage in selected)
+
+    print(f"合成数据: {len(SCHOOLS)} 个学院，每个学院 {args.cards} 张卡片")
+    print(f"{'阶段':<14}{'耗时(s)':>9}{'RSS增量(MB)':>13}{'Python峰值(MB)':>16}  吞吐量")
+    failed = False
+    with tempfile.TemporaryDirectory() as workspace:
+        for stage in STAGE_ORDER[:last + 1]:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', stage,
+                                     '--workspace', workspace, '-n', str(args.cards), '--top', str(args.top)],
+                                    capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{stage:<14}运行失败")
+                print(output.stderr.strip())
+                sys.exit(1)
+
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            rates, failures = check(result, args.floor_scale)
+            if stage not in selected:
+                continue
+
+            throughput = ", ".join(f"{rates[key]:.2f} {key}" for key in BUDGETS[stage]["floors"])
+            print(f"{stage:<14}{result['seconds']:>9.2f}{result['rss_mb']:>13.1f}{result['traced_mb']:>16.2f}  "
+                  f"{throughput}")
+            for failure in failures:
+                print(f"  失败: {failure}")
+            if failures or args.verbose:
+                print("  阶段中增长且结束时仍存活的分配:")
+                for site in result["sites"]:
+                    print(f"    {site['kb']:>10.1f} KB {site['count']:>7} 个  {site['site']}")
+            failed = failed or bool(failures)
+
+    print("有检查项未通过" if failed else "全部通过")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import json
+import os
+
+from PIL import Image
+
+
+def temp_path_for(path):
+    """生成与目标文件同目录的临时文件路径（扩展名不参与glob匹配）"""
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def atomic_write_bytes(path, data):
+    """先写临时文件再重命名，保证目标文件要么完整要么不存在"""
+    tmp_path = temp_path_for(path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_save_image(img, path, format=None, **params):
+    """原子地保存图像，中途被杀掉也不会留下半写的文件"""
+    if format is None:
+        ext = os.path.splitext(path)[1].lower()
+        format = Image.registered_extensions().get(ext, 'PNG')
+
+    tmp_path = temp_path_for(path)
+    try:
+        img.save(tmp_path, format, **params)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class BuildCheckpoint:
+    """记录批处理任务中已完成的工作单元，任务中断后可以从断点继续"""
+
+    def __init__(self, path, signature=None):
+        self.path = path
+        self.signature = signature
+        self.completed = {}
+        self.load()
+
+    def load(self):
+        """读取检查点文件，签名不一致（配置改变）时丢弃旧记录"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"读取检查点失败: {str(e)}，将重新开始")
+            return
+
+        if data.get("signature") != self.signature:
+            print("配置已改变，忽略旧的检查点")
+            return
+
+        self.completed = data.get("completed", {})
+        if self.completed:
+            print(f"从检查点恢复: 已完成 {len(self.completed)} 个单元")
+
+    def save(self):
+        """原子地写入检查点文件"""
+        data = {"signature": self.signature, "completed": self.completed}
+        atomic_write_bytes(self.path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def is_done(self, unit, fingerprint=None):
+        """判断单元是否已完成（指纹不同视为未完成）"""
+        unit = str(unit)
+        return unit in self.completed and self.completed[unit] == fingerprint
+
+    def mark_done(self, unit, fingerprint=None):
+        """标记单元已完成并立即持久化"""
+        self.completed[str(unit)] = fingerprint
+        self.save()
+
+    def reset(self):
+        """清空所有记录"""
+        self.completed = {}
+        self.clear()
+
+    def clear(self):
+        """任务全部完成后删除检查点文件"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
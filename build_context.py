@@ -0,0 +1,152 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+
+# 需要按工作区解析的输出位置及其默认值
+OUTPUT_DEFAULTS = {
+    "cards_folder": "character_cards",
+    "pages_folder": "pages",
+    "students_pdf": "students.pdf",
+    "shards_folder": "school_shards",
+}
+
+# 名单是不分学院的列表时，角色卡放入的学院文件夹（页面只从学院子文件夹中读取卡片）
+DEFAULT_SCHOOL = "未分组"
+
+
+def load_config_file(config_file):
+    """加载配置文件"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"配置文件 {config_file} 不存在，使用默认配置")
+        return {}
+    except Exception as e:
+        print(f"读取配置文件失败: {str(e)}，使用默认配置")
+        return {}
+
+
+class BuildContext:
+    """一次构建的隔离环境：独立的配置副本、临时目录和输出位置
+
+    多个构建（同一进程内的多个线程，或多个进程）只要使用不同的工作区，
+    就不会读写彼此的文件。
+    """
+
+    def __init__(self, config=None, config_file="config.json", workspace=None):
+        if config is None:
+            config = load_config_file(config_file)
+
+        # 深拷贝配置，避免不同构建之间互相修改
+        self.config = copy.deepcopy(config)
+        self.workspace = os.path.abspath(workspace or os.getcwd())
+        os.makedirs(self.workspace, exist_ok=True)
+
+        # 相对路径一律相对于工作区解析
+        for key, default in OUTPUT_DEFAULTS.items():
+            self.config[key] = self.resolve(self.config.get(key) or default)
+
+        self.scratch_dir = None
+
+    def resolve(self, path):
+        """将相对路径解析到工作区下"""
+        if os.path.isabs(path):
+            return path
+        return os.path.join(self.workspace, path)
+
+    def get_scratch_dir(self):
+        """返回本次构建专用的临时目录（首次调用时创建）"""
+        if self.scratch_dir is None:
+            scratch_root = self.config.get("scratch_root") or self.workspace
+            os.makedirs(scratch_root, exist_ok=True)
+            self.scratch_dir = tempfile.mkdtemp(prefix=".build_", dir=scratch_root)
+        return self.scratch_dir
+
+    @property
+    def cards_folder(self):
+        return self.config["cards_folder"]
+
+    @property
+    def pages_folder(self):
+        return self.config["pages_folder"]
+
+    @property
+    def students_pdf(self):
+        return self.config["students_pdf"]
+
+    @property
+    def shards_folder(self):
+        return self.config["shards_folder"]
+
+    def cleanup(self):
+        """删除临时目录"""
+        if self.scratch_dir and os.path.exists(self.scratch_dir):
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+        self.scratch_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+        return False
+
+
+def roster_groups(roster, config):
+    """把名单整理成 [(学院, [角色名, ...]), ...]
+
+    列表名单放入配置项 default_school 指定的学院（默认"未分组"），不直接写到 cards_folder 根目录，
+    否则生成页面时找不到这些卡片。
+    """
+    if isinstance(roster, dict):
+        return list(roster.items())
+    return [(config.get("default_school") or DEFAULT_SCHOOL, list(roster))]
+
+
+def run_build(context, roster=None):
+    """在给定的构建环境中依次执行：生成角色卡（可选）、生成页面、合并PDF
+
+    roster 可以是角色名列表，也可以是 {学院: [角色名, ...]} 字典，角色卡生成到对应的学院文件夹中
+    （列表名单见 roster_groups）。有角色卡生成失败时不再继续，返回False。
+    """
+    from character_card_generator import CharacterCardGenerator
+    from mix_pdf import create_pdf_from_pages
+    from school_cards_to_png import SchoolCardsToPNG
+
+    if roster:
+        generator = CharacterCardGenerator(context=context)
+        failed = 0
+        for school_name, names in roster_groups(roster, context.config):
+            created = generator.batch_create_cards(names, os.path.join(context.cards_folder, school_name))
+            failed += len(names) - created
+        if failed:
+            print(f"{failed} 个角色卡生成失败，未生成页面和PDF")
+            return False
+
+    if context.config.get("output_resolutions"):
+        # 一次合成，逐级缩小后同时写出多个分辨率的PDF
+        from multi_resolution import build_multi_resolution
+        return build_multi_resolution(context=context)
+
+    if context.config.get("page_handoff") == "shared_memory":
+        # 页面经共享内存直接交给PDF写入端，不保存中间PNG
+        from shared_pages import build_pdf_shared
+        return build_pdf_shared(context=context, workers=context.config.get("render_workers", 2))
+
+    if context.config.get("school_shards", False):
+        # 每个学院单独生成并缓存PDF分片，再复制图像流合并成整本书
+        from school_shards import SchoolShards
+        return SchoolShards(context=context).build()
+
+    if context.config.get("incremental_pdf", False):
+        # 只重新渲染内容变化的页面，其余页面从上一次的PDF中复制
+        from incremental_build import IncrementalBook
+        return IncrementalBook(context=context).build()
+
+    if not SchoolCardsToPNG(context=context).create_pages_by_schools():
+        return False
+
+    return create_pdf_from_pages(context=context)
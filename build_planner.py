@@ -0,0 +1,565 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+from PIL import Image, ImageEnhance
+
+from build_checkpoint import BuildCheckpoint, atomic_write_bytes
+from build_context import roster_groups
+from image_ops import resize_image
+from page_formats import DEFAULT_PAGE_FORMAT, PAGE_FORMATS, page_format
+from page_pipeline import canvas_pool_size
+from pdf_passthrough import probe_passthrough
+from pdf_writer import DEFAULT_COMPRESS_LEVEL, load_manifest
+from school_cards_to_png import SchoolCardsToPNG
+
+# 角色卡生成器输出的卡片尺寸（头像和SD模型占位图拼接后的大小），用于还没有生成的卡片
+NEW_CARD_SIZE = (1006, 656)
+
+DEFAULT_RATES_FILE = "build_rates.json"
+
+# 默认速率：耗时在开发机（单核，300dpi，每行3张卡片）上用 --calibrate 测得，体积按一般的角色卡估计；
+# 在目标机器上用真实卡片校准后保存到 build_rates.json 中，估算会准确得多
+DEFAULT_RATES = {
+    # 合成一页的固定开销和每张卡片的解码、缩放、粘贴耗时（秒）
+    "page_seconds": 0.022,
+    "card_seconds": 0.031,
+    # 对比度增强加 zlib 压缩一页（直接写PDF的构建方式和不能直接复制压缩数据时）
+    "flate_seconds": 0.38,
+    # 压缩后字节数 = 基数 + 每张卡片的字节数
+    "flate_bytes": [25000, 60000],
+    # 各页面格式档位保存一页的耗时和体积
+    "formats": {
+        "fast": {"seconds": 0.17, "bytes": [120000, 90000]},
+        "balanced": {"seconds": 0.26, "bytes": [33000, 60000]},
+        "compact": {"seconds": 2.3, "bytes": [400, 35000]},
+    },
+    # 直接复制PNG压缩数据写入PDF（不需要对比度增强时）
+    "passthrough_seconds": 0.001,
+    # 多分辨率输出时缩小页面的耗时（每百万源像素，high 档位）
+    "downsample_seconds": 0.025,
+    # 合成一张角色卡和下载一张图片
+    "compose_seconds": 0.03,
+    "download_seconds": 1.5,
+    # 导入 PIL 后进程的常驻内存（MB）
+    "base_rss_mb": 30,
+}
+
+
+def image_size(path):
+    """只读取文件头得到图像尺寸；PNG直接解析IHDR，其他格式由Pillow读取文件头"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+    with Image.open(path) as img:
+        return img.size
+
+
+def build_mode(config):
+    """run_build 会使用的构建方式"""
+    if config.get("output_resolutions"):
+        return "multi_resolution"
+    if config.get("page_handoff") == "shared_memory":
+        return "shared_memory"
+    if config.get("school_shards", False):
+        return "school_shards"
+    if config.get("incremental_pdf", False):
+        return "incremental"
+    return "pages"
+
+
+def load_rates(rates_file):
+    """读取校准过的速率，缺少的项使用默认值；返回 (速率, 是否来自校准文件)"""
+    rates = json.loads(json.dumps(DEFAULT_RATES))
+    try:
+        with open(rates_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return rates, False
+
+    formats = saved.pop("formats", {})
+    rates.update(saved)
+    rates["formats"].update(formats)
+    return rates, True
+
+
+def load_roster(path):
+    """读取名单：JSON（角色名列表或 {学院: [角色名, ...]}，与构建服务相同）或每行一个角色名的文本"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if path.lower().endswith('.json'):
+        return json.loads(text)
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def bytes_for(rate, cards):
+    base, per_card = rate
+    return base + per_card * cards
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    """getrusage 的峰值RSS（字节）：macOS 上 ru_maxrss 以字节为单位，其他系统以KB为单位"""
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def overlapped(first, second, cpus):
+    """流水线中两个阶段同时进行的耗时：多核时取较慢的一方，单核时两者相加"""
+    return max(first, second) if cpus > 1 else first + second
+
+
+class BuildPlanner:
+    """构建前的试运行：只读取目录、文件头和清单，估算页数、下载量、输出体积、峰值内存和耗时
+
+    排版复用 SchoolCardsToPNG 的计算，不解码任何图像。耗时和体积按 build_rates.json 中
+    记录的速率推算（没有校准文件时使用 DEFAULT_RATES），可用 --calibrate 在本机重新测量。
+    """
+
+    def __init__(self, config_file="config.json", context=None):
+        self.config_file = config_file
+        self.context = context
+        self.builder = SchoolCardsToPNG(config_file, context)
+        self.config = self.builder.config
+        if self.config.get("exclude_duplicate_cards", False):
+            # 试运行不写回卡片哈希缓存
+            from card_dedup import CardHashIndex, cache_path_for
+            self.builder.card_hashes = CardHashIndex(cache_path_for(self.config, context), read_only=True)
+        self.rates_file = self.config.get("build_rates", DEFAULT_RATES_FILE)
+        self.rates, self.calibrated = load_rates(self.rates_file)
+        if self.config.get("add_contrast", False):
+            self.contrast_factor = self.config.get("contrast_factor", 1.2)
+        else:
+            self.contrast_factor = None
+
+    def plan_roster(self, roster):
+        """名单中需要生成的角色卡、下载次数和缓存命中，与 batch_create_cards 的跳过规则一致"""
+        plan = {"characters": 0, "skipped": 0, "to_compose": 0, "downloads": 0, "cache_hits": 0,
+                "max_requests": 0, "new_cards": {}}
+        if not roster:
+            return plan
+
+        from character_card_generator import CharacterCardGenerator
+        with contextlib.redirect_stdout(io.StringIO()):
+            generator = CharacterCardGenerator(self.config_file, self.context)
+
+        cards_folder = self.config.get("cards_folder") or "character_cards"
+        for school_name, names in roster_groups(roster, self.config):
+            output_dir = os.path.join(cards_folder, school_name)
+            checkpoint_path = os.path.join(output_dir, ".cards_checkpoint.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                checkpoint = BuildCheckpoint(checkpoint_path, signature=generator.font_path or "")
+
+            for name in names:
+                plan["characters"] += 1
+                output_path = os.path.join(output_dir, f"{generator.safe_filename(name)}_card.png")
+                exists = os.path.exists(output_path)
+                if checkpoint.is_done(name) and exists:
+                    plan["skipped"] += 1
+                    continue
+
+                plan["to_compose"] += 1
+                if not exists:
+                    plan["new_cards"][school_name] = plan["new_cards"].get(school_name, 0) + 1
+
+                # 下载时按顺序尝试候选URL，第一个URL已在素材缓存中时不需要联网
+                avatar_urls, sd_model_urls, _ = generator.get_download_urls(name)
+                for urls in (avatar_urls, sd_model_urls):
+                    if generator.asset_cache and os.path.exists(generator.asset_cache.path_for(urls[0])):
+                        plan["cache_hits"] += 1
+                    else:
+                        plan["downloads"] += 1
+                        plan["max_requests"] += len(urls)
+        return plan
+
+    def previous_fingerprints(self, mode, school_name):
+        """上一次构建记录的页指纹集合（只有按页增量的构建方式才会复用页面）"""
+        if mode == "incremental":
+            manifest_pdf = self.config.get("students_pdf", "students.pdf")
+        elif mode == "school_shards":
+            from school_shards import shard_file_name
+            manifest_pdf = os.path.join(self.config.get("shards_folder", "school_shards"),
+                                        shard_file_name(school_name))
+        else:
+            return set()
+        return {record.get("fingerprint") for record in load_manifest(manifest_pdf) or []}
+
+    def plan_schools(self, mode, new_cards):
+        """每个学院的页面计划：[{学院, 卡片数, 新卡片数, 每页卡片数, 每页实际卡片数列表,
+        需要重新渲染的页面的卡片数列表, 可复用页数}, ...]"""
+        cards_folder = self.config.get("cards_folder")
+        cards_per_row = self.config.get("cards_per_row", 4)
+
+        specs = []
+        if cards_folder and os.path.isdir(cards_folder):
+            with contextlib.redirect_stdout(io.StringIO()):
+                specs = self.builder.plan_pages() or []
+
+        existing = {}
+        for spec in specs:
+            existing.setdefault(spec["school_name"], []).append(spec)
+
+        fingerprint = None
+        if mode in ("incremental", "school_shards"):
+            from incremental_build import IncrementalBook
+            fingerprint = IncrementalBook(builder=self.builder).fingerprint
+
+        schools = []
+        school_order = self.config.get("school_order", [])
+        for school_name in self.builder.order_schools(set(existing) | set(new_cards), school_order):
+            school_specs = existing.get(school_name, [])
+            card_files = [path for spec in school_specs for path in spec["card_files"]]
+            added = new_cards.get(school_name, 0)
+
+            if card_files:
+                aspect_ratio = self.builder.card_aspect_ratio(card_files[0])
+            else:
+                aspect_ratio = NEW_CARD_SIZE[1] / NEW_CARD_SIZE[0]
+            card_count = len(card_files) + added
+            card_width, card_height, _, cards_per_page, total_pages = self.builder.page_layout(
+                card_count, aspect_ratio, cards_per_row)
+
+            if added:
+                # 名单会给这个学院新增卡片，按新的卡片总数重新排版，所有页面都需要重新渲染
+                page_cards = [min(cards_per_page, card_count - i * cards_per_page) for i in range(total_pages)]
+                render_cards = page_cards
+            else:
+                # 逐页比较指纹，变化的页面可以在学院中的任意位置
+                page_cards = [len(spec["card_files"]) for spec in school_specs]
+                previous = self.previous_fingerprints(mode, school_name) if fingerprint else set()
+                render_cards = [len(spec["card_files"]) for spec in school_specs
+                                if not previous or fingerprint(spec) not in previous]
+
+            schools.append({
+                "school": school_name,
+                "cards": card_count,
+                "new_cards": added,
+                "card_files": card_files,
+                "card_size": (card_width, card_height),
+                "cards_per_page": cards_per_page,
+                "page_cards": page_cards,
+                "render_cards": render_cards,
+                "reused_pages": len(page_cards) - len(render_cards),
+            })
+        return schools
+
+    def estimate(self, roster=None):
+        """生成试运行报告（字典）"""
+        start = time.perf_counter()
+        config = self.config
+        rates = self.rates
+        mode = build_mode(config)
+        cpus = os.cpu_count() or 1
+
+        cards = self.plan_roster(roster)
+        schools = self.plan_schools(mode, cards["new_cards"])
+
+        all_pages = [n for school in schools for n in school["page_cards"]]
+        # 需要渲染的页面：可复用的页面不计入（按页增量时未变化的页面只复制图像流）
+        rendered = [n for school in schools for n in school["render_cards"]]
+        reused_pages = len(all_pages) - len(rendered)
+
+        render_seconds = sum(rates["page_seconds"] + rates["card_seconds"] * n for n in rendered)
+        flate_seconds = rates["flate_seconds"] * len(rendered)
+        extra_pixels, downsample_pixels = self.extra_outputs() if mode == "multi_resolution" else (0, 0)
+        if extra_pixels:
+            # 每个额外分辨率：从上一级缩小，再压缩（不做对比度增强，耗时按像素比例估计）
+            flate_seconds += len(rendered) * (rates["flate_seconds"] * extra_pixels
+                                              + rates["downsample_seconds"] * downsample_pixels)
+        copy_seconds = rates["passthrough_seconds"] * reused_pages
+        cards_seconds = cards["downloads"] * rates["download_seconds"] + cards["to_compose"] * rates["compose_seconds"]
+        flate_bytes = sum(bytes_for(rates["flate_bytes"], n) for n in all_pages) * (1 + extra_pixels)
+
+        formats = {}
+        for name in PAGE_FORMATS:
+            extension = page_format(name)[0]
+            rate = rates["formats"].get(name, DEFAULT_RATES["formats"][name])
+            pages_bytes = sum(bytes_for(rate["bytes"], n) for n in all_pages)
+            if mode == "pages":
+                # 中间页面文件保存后再合并：PNG页面在不需要对比度增强时直接复制压缩数据
+                passthrough = extension == "png" and self.contrast_factor is None
+                pdf_bytes = pages_bytes if passthrough else flate_bytes
+                pdf_workers = max(1, min(config.get("pdf_workers", 1), cpus))
+                pdf_seconds = len(all_pages) * (rates["passthrough_seconds"] if passthrough
+                                                 else rates["flate_seconds"]) / pdf_workers
+                # 合成与保存在两个线程中交替进行
+                seconds = overlapped(render_seconds, rate["seconds"] * len(rendered), cpus) + pdf_seconds
+            else:
+                # 页面直接压缩进PDF，不保存中间文件，页面格式不影响结果
+                pages_bytes = 0
+                pdf_bytes = flate_bytes
+                seconds = self.direct_pdf_seconds(mode, schools, render_seconds, flate_seconds, cpus) + copy_seconds
+            formats[name] = {"pages_bytes": pages_bytes, "pdf_bytes": pdf_bytes, "seconds": seconds + cards_seconds}
+
+        return {
+            "mode": mode,
+            "page_format": config.get("page_format") or DEFAULT_PAGE_FORMAT,
+            "schools": [{"school": school["school"], "cards": school["cards"], "new_cards": school["new_cards"],
+                         "cards_per_page": school["cards_per_page"], "pages": len(school["page_cards"]),
+                         "reused_pages": school["reused_pages"]} for school in schools],
+            "total_pages": len(all_pages),
+            "pages_to_render": len(rendered),
+            "cards": {key: value for key, value in cards.items() if key != "new_cards"},
+            "cards_seconds": cards_seconds,
+            "formats": formats,
+            "memory": self.estimate_memory(mode, schools),
+            "rates_file": self.rates_file if self.calibrated else None,
+            "planning_seconds": time.perf_counter() - start,
+        }
+
+    def extra_outputs(self):
+        """多分辨率输出的额外开销：(额外输出的像素数之和, 缩小时读取的源像素数之和)
+
+        都以主输出一页的像素数为1，源像素以百万像素计；每一级从上一级缩小。
+        """
+        from multi_resolution import output_targets, page_size_for
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            targets = output_targets(self.config)
+        pixels = self.builder.width * self.builder.height
+        sizes = [page_size_for(dpi) for dpi, _ in targets[1:]]
+        sources = [pixels] + [w * h for w, h in sizes[:-1]]
+        return sum(w * h for w, h in sizes) / pixels, sum(sources) / 1e6
+
+    def direct_pdf_seconds(self, mode, schools, render_seconds, flate_seconds, cpus):
+        """页面直接写入PDF的构建方式的耗时（渲染和压缩在流水线中重叠）"""
+        rates = self.rates
+        if mode == "shared_memory":
+            workers = max(1, min(self.config.get("render_workers", 2), cpus))
+            return overlapped(render_seconds / workers, flate_seconds, cpus)
+
+        if mode == "school_shards":
+            workers = max(1, min(self.config.get("shard_workers") or cpus, cpus))
+            per_school = [sum(overlapped(rates["page_seconds"] + rates["card_seconds"] * n, rates["flate_seconds"], cpus)
+                              for n in school["render_cards"]) for school in schools]
+            # 按学院并行，最慢的学院决定下限；最后复制所有分片的图像流合并
+            merge_seconds = rates["passthrough_seconds"] * sum(len(school["page_cards"]) for school in schools)
+            return max(sum(per_school) / workers, max(per_school, default=0)) + merge_seconds
+
+        return overlapped(render_seconds, flate_seconds, cpus)
+
+    def estimate_memory(self, mode, schools):
+        """按构建方式估算峰值内存（MB）：主进程和所有进程合计
+
+        页面画布、最大的卡片解码缓冲（由文件头得到尺寸）和压缩缓冲按像素数计算，
+        再加上每个进程导入依赖后的常驻内存。
+        """
+        width, height = self.builder.width, self.builder.height
+        pixels = width * height
+        # Pillow 的RGB图像在内存中每像素占4字节
+        page_bytes = pixels * 4
+        base = self.rates["base_rss_mb"] * 1024 * 1024
+
+        largest_card = 0
+        largest_thumb = 0
+        for school in schools:
+            card_width, card_height = school["card_size"]
+            largest_thumb = max(largest_thumb, card_width * card_height * 4)
+            sizes = [image_size(path) for path in school["card_files"]]
+            if school["new_cards"]:
+                sizes.append(NEW_CARD_SIZE)
+            largest_card = max([largest_card] + [w * h * 4 for w, h in sizes])
+        card_buffers = largest_card + largest_thumb
+
+        # 压缩一页：对比度增强要生成灰度均值图、它的RGB版本和结果图像（共9字节/像素），
+        # tobytes 拼接时短暂存在两份3字节/像素的数据
+        encode_buffers = pixels * ((9 if self.contrast_factor is not None else 0) + 6)
+        pool = canvas_pool_size(width, height, self.config.get("page_memory_budget_mb"))
+        renderer = base + pool * page_bytes + card_buffers + encode_buffers
+        if mode == "multi_resolution":
+            # 各级缩小结果同时存在，压缩时 tobytes 再各复制一份
+            renderer += int(self.extra_outputs()[0] * pixels * 7)
+
+        cpus = os.cpu_count() or 1
+        if mode == "shared_memory":
+            workers = self.config.get("render_workers", 2)
+            ring = (workers + 2) * page_bytes
+            main = base + ring + encode_buffers
+            total = main + workers * (base + page_bytes + card_buffers)
+            processes = workers + 1
+        elif mode == "school_shards":
+            workers = min(self.config.get("shard_workers") or cpus, max(1, len(schools)))
+            main = base if workers > 1 else renderer
+            total = main + (workers * renderer if workers > 1 else 0)
+            processes = workers + 1 if workers > 1 else 1
+        elif mode == "pages":
+            # 保存页面时编码直接读取画布，不另外复制像素
+            renderer -= encode_buffers
+            pdf_workers = self.config.get("pdf_workers", 1)
+            passthrough = self.contrast_factor is None and page_format(self.config.get("page_format"))[0] == "png"
+            # 合并PDF时每页先解码再压缩；可以直接复制压缩数据时几乎不占内存
+            merge_buffers = 0 if passthrough else page_bytes + encode_buffers
+            if pdf_workers > 1:
+                compressed = bytes_for(self.rates["flate_bytes"],
+                                       max((school["cards_per_page"] for school in schools), default=0))
+                main = renderer + 2 * pdf_workers * compressed
+                total = main + pdf_workers * (base + merge_buffers)
+                processes = pdf_workers + 1
+            else:
+                # 保存页面和合并PDF在同一进程中先后进行
+                main = total = max(renderer, base + merge_buffers)
+                processes = 1
+        else:
+            main = total = renderer
+            processes = 1
+
+        mb = 1024 * 1024
+        return {"main_mb": main / mb, "total_mb": total / mb, "processes": processes,
+                "page_mb": page_bytes / mb, "canvas_pool": pool}
+
+    def calibrate(self, sample_pages=2):
+        """用真实卡片渲染几页，测量合成、各页面格式和PDF压缩的速率并保存到速率文件"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            pages = self.builder.plan_pages() if os.path.isdir(self.config.get("cards_folder") or "") else None
+        if not pages:
+            print("没有可用于校准的卡片")
+            return False
+
+        # 卡片最多的几页作为样本，另外渲染一页空白页得到固定开销
+        samples = sorted(pages, key=lambda spec: len(spec["card_files"]), reverse=True)[:sample_pages]
+        blank = dict(samples[0], card_files=[], school_page=1)
+        base_rss_mb = peak_rss_bytes() / 1024 / 1024
+
+        def timed(func):
+            start = time.perf_counter()
+            result = func()
+            return time.perf_counter() - start, result
+
+        blank_seconds, blank_page = timed(lambda: self.builder.render_page(blank))
+        rendered = [(spec, *timed(lambda spec=spec: self.builder.render_page(spec))) for spec in samples]
+        cards = sum(len(spec["card_files"]) for spec, _, _ in rendered) / len(rendered)
+        page_seconds = sum(seconds for _, seconds, _ in rendered) / len(rendered)
+        full_page = rendered[0][2]
+        full_cards = len(samples[0]["card_files"])
+
+        def per_card(full, empty):
+            return [empty, max(0, (full - empty) / full_cards)]
+
+        rates = dict(self.rates)
+        rates["page_seconds"] = blank_seconds
+        rates["card_seconds"] = max(0.0, (page_seconds - blank_seconds) / cards)
+
+        def flate(page):
+            if self.contrast_factor is not None:
+                page = ImageEnhance.Contrast(page).enhance(self.contrast_factor)
+            return zlib.compress(page.tobytes(), DEFAULT_COMPRESS_LEVEL)
+
+        flate_seconds, data = timed(lambda: flate(full_page))
+        downsample_seconds, _ = timed(lambda: resize_image(full_page, (full_page.width // 2, full_page.height // 2),
+                                                          self.builder.resample_quality))
+        rates["downsample_seconds"] = downsample_seconds / (full_page.width * full_page.height / 1e6)
+        rates["flate_seconds"] = flate_seconds
+        rates["flate_bytes"] = per_card(len(data), len(flate(blank_page)))
+
+        formats = {}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in PAGE_FORMATS:
+                extension, image_format, params = page_format(name)
+
+                def save(page, path):
+                    page.save(path, image_format, **params)
+                    return os.path.getsize(path)
+
+                seconds, size = timed(lambda: save(full_page, os.path.join(tmp_dir, f"full.{extension}")))
+                formats[name] = {"seconds": seconds,
+                                 "bytes": per_card(size, save(blank_page, os.path.join(tmp_dir, f"blank.{extension}")))}
+
+            # 直接复制PNG压缩数据
+            png_path = os.path.join(tmp_dir, "full.png")
+            full_page.save(png_path, "PNG", compress_level=6)
+            rates["passthrough_seconds"], _ = timed(lambda: probe_passthrough(png_path))
+
+            # 合成一张角色卡（用占位图，不联网）
+            from character_card_generator import CharacterCardGenerator
+            with contextlib.redirect_stdout(io.StringIO()):
+                generator = CharacterCardGenerator(self.config_file, self.context)
+                avatar_path = os.path.join(tmp_dir, "avatar.png")
+                Image.new('RGB', (404, 456), (200, 180, 160)).save(avatar_path)
+                rates["compose_seconds"], _ = timed(lambda: generator.compose_character_card(
+                    "校准", avatar_path, os.path.join(tmp_dir, "sd.png"), True, False, tmp_dir))
+
+        rates["formats"] = formats
+        rates["base_rss_mb"] = base_rss_mb
+        rates["measured_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        atomic_write_bytes(self.rates_file, json.dumps(rates, ensure_ascii=False, indent=2).encode('utf-8'))
+        self.rates, self.calibrated = rates, True
+        print(f"速率已保存到 {self.rates_file}（样本 {len(samples)} 页，平均每页 {cards:.0f} 张卡片）")
+        return True
+
+
+MODE_NAMES = {
+    "pages": "保存页面文件后合并PDF",
+    "incremental": "按页增量生成PDF",
+    "school_shards": "按学院分片生成PDF",
+    "shared_memory": "共享内存直接生成PDF",
+    "multi_resolution": "一次合成输出多个分辨率的PDF（体积为所有PDF合计）",
+}
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} 秒"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} 分钟"
+    return f"{seconds / 3600:.1f} 小时"
+
+
+def print_report(report):
+    """以表格形式打印试运行报告"""
+    mb = 1024 * 1024
+    print(f"构建方式: {MODE_NAMES[report['mode']]}")
+    print(f"{'学院':<12}{'卡片':>6}{'新增':>6}{'每页':>6}{'页数':>6}{'可复用':>8}")
+    for school in report["schools"]:
+        print(f"{school['school']:<12}{school['cards']:>6}{school['new_cards']:>6}{school['cards_per_page']:>6}"
+              f"{school['pages']:>6}{school['reused_pages']:>8}")
+    print(f"共 {report['total_pages']} 页，需要渲染 {report['pages_to_render']} 页")
+
+    cards = report["cards"]
+    if cards["characters"]:
+        print(f"角色卡: 名单 {cards['characters']} 个，跳过 {cards['skipped']} 个，生成 {cards['to_compose']} 个；"
+              f"下载 {cards['downloads']} 张（最多 {cards['max_requests']} 次请求），缓存命中 {cards['cache_hits']} 张，"
+              f"约 {format_duration(report['cards_seconds'])}")
+
+    print(f"{'页面格式':<12}{'页面文件(MB)':>14}{'PDF(MB)':>10}{'预计耗时':>12}")
+    for name, estimate in report["formats"].items():
+        marker = " *" if name == report["page_format"] else ""
+        pages_mb = f"{estimate['pages_bytes'] / mb:.1f}" if estimate["pages_bytes"] else "-"
+        print(f"{name + marker:<12}{pages_mb:>14}{estimate['pdf_bytes'] / mb:>10.1f}"
+              f"{format_duration(estimate['seconds']):>12}")
+
+    memory = report["memory"]
+    print(f"峰值内存: 主进程约 {memory['main_mb']:.0f} MB，{memory['processes']} 个进程合计约 {memory['total_mb']:.0f} MB"
+          f"（每页画布 {memory['page_mb']:.0f} MB，画布池 {memory['canvas_pool']} 个）")
+    source = f"速率文件 {report['rates_file']}" if report["rates_file"] else "默认速率（可用 --calibrate 校准）"
+    print(f"估算依据: {source}；规划用时 {report['planning_seconds'] * 1000:.0f} 毫秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='试运行：估算页数、下载量、输出体积、峰值内存和耗时，不生成任何文件')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-r', '--roster', help='角色名单：JSON（列表或 {学院: [角色名]}）或每行一个角色名的文本')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出报告')
+    parser.add_argument('--calibrate', action='store_true', help='渲染几页样本测量本机速率，保存到速率文件')
+    args = parser.parse_args()
+
+    planner = BuildPlanner(args.config)
+    if args.calibrate and not planner.calibrate():
+        return
+
+    report = planner.estimate(load_roster(args.roster) if args.roster else None)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
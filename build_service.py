@@ -0,0 +1,300 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from build_context import BuildContext, load_config_file, run_build
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 结束的任务保留多久（秒）后连同工作区一起删除
+DEFAULT_JOB_TTL = 24 * 3600
+
+# 请求中允许覆盖的配置项：只有排版和画质参数。路径类配置（输出位置、缓存目录、字体等）
+# 和资源配置只能由服务端的基础配置决定，否则客户端可以让构建读写工作区以外的文件
+CLIENT_CONFIG_KEYS = {
+    "cards_per_row", "dpi", "margin", "add_contrast", "contrast_factor", "school_order",
+    "page_format", "resample_quality", "pdf_backend", "exclude_duplicate_cards",
+    "duplicate_threshold", "default_school", "output_resolutions",
+}
+
+
+def is_plain_name(name):
+    """可以直接用作工作区内文件夹名的名称：不含路径分隔符，不是 . 或 .."""
+    return (isinstance(name, str) and name not in ("", ".", "..")
+            and os.path.basename(name) == name and "\\" not in name)
+
+
+def validate_request(roster, overrides):
+    """检查请求中的名单和配置，不允许时抛出 ValueError"""
+    rejected = sorted(set(overrides) - CLIENT_CONFIG_KEYS)
+    if rejected:
+        raise ValueError(f"不允许覆盖的配置项: {', '.join(rejected)}")
+
+    schools = list(roster) if isinstance(roster, dict) else []
+    if "default_school" in overrides:
+        schools.append(overrides["default_school"])
+    for school_name in schools:
+        if not is_plain_name(school_name):
+            raise ValueError(f"无效的学院名: {school_name!r}")
+
+    # 额外输出的PDF由服务按主PDF的名称命名，不接受客户端给出的路径
+    for entry in overrides.get("output_resolutions") or []:
+        if isinstance(entry, dict) and set(entry) - {"dpi"}:
+            raise ValueError("output_resolutions 只能指定 dpi")
+
+
+def input_hash(roster, config):
+    """根据名单和配置计算任务摘要，相同输入得到相同摘要"""
+    payload = json.dumps({"roster": roster, "config": config}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BuildJob:
+    """一次构建任务的状态"""
+
+    def __init__(self, job_id, roster, config, workspace):
+        self.job_id = job_id
+        self.roster = roster
+        self.config = config
+        self.workspace = workspace
+        self.status = QUEUED
+        self.error = None
+        self.pdf_path = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pdf_ready": self.status == DONE,
+        }
+
+
+class BuildService:
+    """构建任务队列：线程池执行任务，排队或运行中的相同输入的任务只执行一次
+
+    所有任务运行在同一进程中，因此字体、下载素材和缩略图缓存在任务之间共享。
+    结束超过 job_ttl 秒的任务在提交新任务时清除，工作区一并删除。
+    """
+
+    def __init__(self, root_dir="build_jobs", workers=2, base_config=None, job_ttl=DEFAULT_JOB_TTL):
+        self.root_dir = os.path.abspath(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.base_config = base_config or {}
+        self.job_ttl = job_ttl
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def job_config(self, overrides):
+        """合并基础配置和请求中的配置，并打开服务模式需要的选项"""
+        config = dict(self.base_config)
+        config.update(overrides or {})
+        config["interactive"] = False
+        config["thumbnail_cache"] = True
+        config.setdefault("asset_cache", os.path.join(self.root_dir, "assets"))
+        return config
+
+    def submit(self, roster, overrides=None):
+        """提交任务，返回 (任务, 是否与已有任务合并)；名单或配置不允许时抛出 ValueError
+
+        只与排队或运行中的任务合并；已结束的相同任务会重新构建（输入文件可能已经变化），
+        复用原来的工作区，未变化的角色卡和页面由检查点跳过。
+        """
+        validate_request(roster, overrides or {})
+        config = self.job_config(overrides)
+        job_id = input_hash(roster, config)[:16]
+
+        with self.lock:
+            self.evict_expired()
+            job = self.jobs.get(job_id)
+            if job and job.status in (QUEUED, RUNNING):
+                return job, True
+
+            job = BuildJob(job_id, roster, config, os.path.join(self.root_dir, job_id))
+            self.jobs[job_id] = job
+
+        self.executor.submit(self._run, job)
+        return job, False
+
+    def evict_expired(self):
+        """删除结束超过 job_ttl 秒的任务及其工作区，调用方需持有锁"""
+        if not self.job_ttl:
+            return
+        deadline = time.time() - self.job_ttl
+        expired = [job for job in self.jobs.values()
+                   if job.status in (DONE, FAILED) and job.finished_at and job.finished_at < deadline]
+        for job in expired:
+            del self.jobs[job.job_id]
+            shutil.rmtree(job.workspace, ignore_errors=True)
+            print(f"已清除过期任务 {job.job_id}")
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def _run(self, job):
+        """在工作线程中执行构建"""
+        job.status = RUNNING
+        job.started_at = time.time()
+        print(f"开始构建任务 {job.job_id}")
+        try:
+            with BuildContext(job.config, workspace=job.workspace) as context:
+                success = run_build(context, job.roster)
+                if success:
+                    job.pdf_path = context.students_pdf
+                    job.status = DONE
+                else:
+                    job.error = "构建失败"
+                    job.status = FAILED
+        except Exception as e:
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            print(f"任务 {job.job_id} 结束: {job.status}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+    """HTTP/JSON 接口
+
+    POST /builds            提交构建 {"roster": ..., "config": {...}}
+    GET  /builds            列出所有任务
+    GET  /builds/<id>       查询任务状态
+    GET  /builds/<id>/pdf   下载生成的PDF
+    """
+
+    service = None
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != "/builds":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except Exception as e:
+            self.send_json(400, {"error": f"无效的JSON: {str(e)}"})
+            return
+
+        roster = request.get("roster")
+        overrides = request.get("config", {})
+        if roster is not None and not isinstance(roster, (list, dict)):
+            self.send_json(400, {"error": "roster 必须是列表或 {学院: [角色名]} 字典"})
+            return
+        if not isinstance(overrides, dict):
+            self.send_json(400, {"error": "config 必须是对象"})
+            return
+
+        try:
+            job, deduplicated = self.service.submit(roster, overrides)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        data = job.to_dict()
+        data["deduplicated"] = deduplicated
+        self.send_json(200 if deduplicated else 202, data)
+
+    def do_GET(self):
+        parts = [p for p in self.path.split('/') if p]
+        if parts == ["builds"]:
+            self.send_json(200, {"jobs": self.service.list_jobs()})
+            return
+
+        if len(parts) < 2 or parts[0] != "builds":
+            self.send_json(404, {"error": "not found"})
+            return
+
+        job = self.service.get(parts[1])
+        if job is None:
+            self.send_json(404, {"error": "任务不存在"})
+            return
+
+        if len(parts) == 2:
+            self.send_json(200, job.to_dict())
+        elif parts[2:] == ["pdf"]:
+            self.send_pdf(job)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def send_pdf(self, job):
+        if job.status != DONE or not job.pdf_path or not os.path.exists(job.pdf_path):
+            self.send_json(409, {"error": "PDF尚未生成", "status": job.status})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(os.path.getsize(job.pdf_path)))
+        self.end_headers()
+        with open(job.pdf_path, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+
+def serve(host="127.0.0.1", port=8765, workers=2, root_dir="build_jobs", config_file="config.json",
+          job_ttl=DEFAULT_JOB_TTL):
+    """启动构建服务并一直运行"""
+    service = BuildService(root_dir, workers, load_config_file(config_file), job_ttl)
+    handler = type("Handler", (BuildRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"构建服务已启动: http://{host}:{port} ，工作线程 {workers} 个")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("正在停止构建服务...")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地构建服务（HTTP/JSON）')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口 (默认: 8765)')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='工作线程数 (默认: 2)')
+    parser.add_argument('--root', default='build_jobs', help='任务工作区根目录 (默认: build_jobs)')
+    parser.add_argument('-c', '--config', default='config.json', help='基础配置文件 (默认: config.json)')
+    parser.add_argument('--job-ttl', type=float, default=DEFAULT_JOB_TTL / 3600,
+                        help=f'结束的任务保留多少小时后删除，0 表示一直保留 (默认: {DEFAULT_JOB_TTL // 3600})')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.root, args.config, args.job_ttl * 3600)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from build_checkpoint import atomic_write_bytes
+
+# 差值哈希（dHash）的网格大小：8 表示把卡片缩成 9x8 的灰度图，比较相邻像素得到64位
+HASH_SIZE = 8
+
+# 汉明距离不超过这个值的两张卡片视为近似重复（64位中最多有几位不同）
+DEFAULT_THRESHOLD = 4
+
+# 哈希缓存默认保存在 cards_folder 下（以点开头，不会被当作学院文件夹）
+CACHE_NAME = ".card_hashes.json"
+CACHE_VERSION = 1
+
+# 两两比较时每块参与异或的元素数上限：临时数组约 8MB，比更大的块更快（缓存命中更好）
+PAIR_BLOCK_ELEMENTS = 1024 * 1024
+
+
+def grayscale_grid(path, hash_size=HASH_SIZE):
+    """把卡片缩成 (hash_size+1) x hash_size 的灰度图，返回字节；无法读取时返回None
+
+    先用 draft（JPEG在解码时直接缩小）和整数倍的 reduce 降低像素数，再用区域平均缩到网格大小，
+    对重新导出、轻微缩放或重新压缩的同一张卡片结果基本一致。
+    """
+    size = (hash_size + 1, hash_size)
+    try:
+        with Image.open(path) as img:
+            img.draft('L', (size[0] * 8, size[1] * 8))
+            gray = img.convert('L')
+    except Exception:
+        return None
+
+    factor = min(gray.width // (size[0] * 4), gray.height // (size[1] * 4))
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return gray.resize(size, Image.Resampling.BOX).tobytes()
+
+
+def dhash(grids, hash_size=HASH_SIZE):
+    """一批灰度网格的dHash：每行比较相邻像素，右边更亮记为1，返回 uint64 数组"""
+    pixels = np.frombuffer(b''.join(grids), dtype=np.uint8).reshape(len(grids), hash_size, hash_size + 1)
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    return np.packbits(bits.reshape(len(grids), -1), axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        """NumPy 2.0 之前没有 bitwise_count，按字节查表"""
+        return _BYTE_BITS[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def near_duplicate_pairs(hashes, threshold=DEFAULT_THRESHOLD):
+    """所有汉明距离不超过 threshold 的卡片对，返回 (i, j, 距离) 三个数组，i < j
+
+    按块计算上三角部分：每次取若干行与其后的全部哈希异或后数位数，临时数组大小固定，
+    一万张卡片约五千万对，在单核上也只需要零点几秒。
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    count = len(hashes)
+    rows_per_block = max(1, PAIR_BLOCK_ELEMENTS // max(count, 1))
+    found_i, found_j, found_d = [], [], []
+    for start in range(0, count, rows_per_block):
+        block = hashes[start:start + rows_per_block]
+        distances = popcount(block[:, None] ^ hashes[None, start:])
+        rows, cols = np.nonzero(distances <= threshold)
+        # 只保留上三角（列号大于行号），排除自身和重复的对
+        keep = cols > rows
+        rows, cols = rows[keep], cols[keep]
+        found_i.append(rows + start)
+        found_j.append(cols + start)
+        found_d.append(distances[rows, cols])
+
+    if not found_i:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, np.array([], dtype=np.uint8)
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_d)
+
+
+class CardHashIndex:
+    """所有卡片的感知哈希，按 (修改时间, 大小) 缓存在JSON文件中，未变化的卡片不再重新解码
+
+    read_only 为True时只读取缓存，新计算的哈希不写回（用于试运行规划）。
+    """
+
+    def __init__(self, cache_path=None, hash_size=HASH_SIZE, workers=1, read_only=False):
+        self.cache_path = cache_path
+        self.hash_size = hash_size
+        self.workers = workers
+        self.read_only = read_only
+        # {绝对路径: [修改时间ns, 大小, 十六进制哈希]}
+        self.entries = {}
+        self.dirty = False
+        self.last_misses = 0
+        self.load()
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"读取卡片哈希缓存失败: {str(e)}，将重新计算")
+            return
+
+        if data.get("version") == CACHE_VERSION and data.get("hash_size") == self.hash_size:
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        if not self.cache_path or not self.dirty or self.read_only:
+            return
+        data = {"version": CACHE_VERSION, "hash_size": self.hash_size, "entries": self.entries}
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        atomic_write_bytes(self.cache_path, json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        self.dirty = False
+
+    def hashes(self, card_files):
+        """返回与 card_files 对应的哈希数组和可用掩码（无法读取的卡片掩码为False）"""
+        states = []
+        missing = []
+        for path in card_files:
+            key = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+                state = [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                state = None
+            states.append((key, state))
+            entry = self.entries.get(key)
+            if state is not None and (entry is None or entry[:2] != state):
+                missing.append(key)
+
+        self.last_misses = len(missing)
+        if missing:
+            self.compute(missing, dict(states))
+
+        values = np.zeros(len(card_files), dtype=np.uint64)
+        valid = np.zeros(len(card_files), dtype=bool)
+        for i, (key, state) in enumerate(states):
+            entry = self.entries.get(key)
+            if state is not None and entry is not None and entry[2] is not None:
+                values[i] = int(entry[2], 16)
+                valid[i] = True
+        return values, valid
+
+    def compute(self, paths, states):
+        """解码并缩小未命中缓存的卡片，然后一次性计算哈希"""
+        if self.workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                grids = list(pool.map(grayscale_grid, paths, [self.hash_size] * len(paths), chunksize=64))
+        else:
+            grids = [grayscale_grid(path, self.hash_size) for path in paths]
+
+        readable = [i for i, grid in enumerate(grids) if grid is not None]
+        values = dhash([grids[i] for i in readable], self.hash_size) if readable else []
+        hex_values = dict(zip(readable, (f"{int(v):016x}" for v in values)))
+        for i, path in enumerate(paths):
+            if i not in hex_values:
+                print(f"无法读取卡片，跳过重复检测: {path}")
+            self.entries[path] = states[path] + [hex_values.get(i)]
+        self.dirty = True
+
+    def prune(self):
+        """删除已不存在的卡片的缓存记录"""
+        stale = [path for path in self.entries if not os.path.exists(path)]
+        for path in stale:
+            del self.entries[path]
+        if stale:
+            self.dirty = True
+
+
+def find_duplicates(card_files, index, threshold=DEFAULT_THRESHOLD):
+    """把近似重复的卡片分组，每组保留修改时间最新的一张
+
+    返回 [{"keep": 保留的卡片, "duplicates": [(重复卡片, 与保留卡片的距离), ...]}, ...]，
+    相似关系按传递合并（A近似B、B近似C时三张为一组）。
+    """
+    values, valid = index.hashes(card_files)
+    index.save()
+
+    positions = np.flatnonzero(valid)
+    first, second, _ = near_duplicate_pairs(values[positions], threshold)
+
+    # 并查集合并相似的卡片
+    parent = list(range(len(positions)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(first.tolist(), second.tolist()):
+        ri, rj = root(i), root(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+
+    members = {}
+    for i in range(len(positions)):
+        members.setdefault(root(i), []).append(int(positions[i]))
+
+    groups = []
+    for group in members.values():
+        if len(group) < 2:
+            continue
+        keep = max(group, key=lambda i: (os.path.getmtime(card_files[i]), -i))
+        others = [i for i in group if i != keep]
+        distances = popcount(values[others] ^ values[keep]).tolist()
+        duplicates = [(card_files[i], int(d)) for i, d in zip(others, distances)]
+        groups.append((keep, {"keep": card_files[keep], "duplicates": duplicates}))
+    return [group for _, group in sorted(groups, key=lambda item: item[0])]
+
+
+def cache_path_for(config, context=None):
+    """哈希缓存文件的位置：配置项 card_hash_cache，默认在 cards_folder 下"""
+    path = config.get("card_hash_cache")
+    if not path:
+        return os.path.join(config.get("cards_folder") or "character_cards", CACHE_NAME)
+    return context.resolve(path) if context else path
+
+
+def print_report(groups, school_cards, builder):
+    """按组列出重复卡片，并估算去掉之后每个学院能少渲染几页"""
+    school_of = {path: school for school, paths in school_cards.items() for path in paths}
+    excluded = {path for group in groups for path, _ in group["duplicates"]}
+
+    for group in groups:
+        print(f"保留 {school_of[group['keep']]}/{os.path.basename(group['keep'])}")
+        for path, distance in group["duplicates"]:
+            print(f"  重复 {school_of[path]}/{os.path.basename(path)}（距离 {distance}）")
+
+    cards_per_row = builder.config.get("cards_per_row", 4)
+    pages_before = pages_after = 0
+    for card_files in school_cards.values():
+        if not card_files:
+            continue
+        kept = [path for path in card_files if path not in excluded]
+        aspect_ratio = builder.card_aspect_ratio(card_files[0])
+        pages_before += builder.page_layout(len(card_files), aspect_ratio, cards_per_row)[4]
+        if kept:
+            pages_after += builder.page_layout(len(kept), builder.card_aspect_ratio(kept[0]), cards_per_row)[4]
+
+    print(f"共 {len(groups)} 组近似重复，{len(excluded)} 张卡片可以去掉，页数 {pages_before} -> {pages_after}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='用感知哈希查找角色卡文件夹中重复或近似重复的卡片')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-t', '--threshold', type=int,
+                        help=f'汉明距离不超过多少视为重复 (默认: 配置中的 duplicate_threshold 或 {DEFAULT_THRESHOLD})')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='计算新卡片哈希的进程数 (默认: 1)')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出重复分组')
+    parser.add_argument('--list', action='store_true', help='只输出可以去掉的卡片路径，每行一个')
+    args = parser.parse_args()
+
+    from school_cards_to_png import SchoolCardsToPNG
+
+    builder = SchoolCardsToPNG(args.config)
+    config = builder.config
+    root_folder = config.get("cards_folder")
+    if not root_folder or not os.path.isdir(root_folder):
+        print(f"角色卡文件夹不存在: {root_folder}")
+        return
+
+    threshold = args.threshold if args.threshold is not None else config.get("duplicate_threshold", DEFAULT_THRESHOLD)
+    school_cards = {school: builder.get_card_files(os.path.join(root_folder, school))
+                    for school in builder.get_ordered_schools(root_folder, config.get("school_order", []))}
+    card_files = [path for paths in school_cards.values() for path in paths]
+
+    start = time.time()
+    index = CardHashIndex(cache_path_for(config), workers=args.workers)
+    index.prune()
+    groups = find_duplicates(card_files, index, threshold)
+    elapsed = time.time() - start
+
+    if args.json:
+        print(json.dumps(groups, ensure_ascii=False, indent=2))
+    elif args.list:
+        for group in groups:
+            for path, _ in group["duplicates"]:
+                print(path)
+    else:
+        print(f"检查了 {len(card_files)} 张卡片（{index.last_misses} 张重新计算哈希），用时 {elapsed:.2f} 秒")
+        print_report(groups, school_cards, builder)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,24 @@ import json
 
 import os
 import re
-import requests
+import warnings
+from urllib.parse import quote
+
 from PIL import Image, ImageDraw, ImageFont
 
+from build_checkpoint import BuildCheckpoint, atomic_save_image, temp_path_for
+from image_ops import flatten_to_rgb, resize_image
+from shared_cache import get_asset_cache, get_font
+
+# 本地图像的默认像素上限（约 8000x6000），超过的图像在解码前就被拒绝
+DEFAULT_MAX_IMAGE_PIXELS = 50_000_000
+
 
 class CharacterCardGenerator:
-    def __init__(self, config_file="config.json"):
-        # 加载配置文件
-        self.config = self.load_config(config_file)
+    def __init__(self, config_file="config.json", context=None):
+        # 加载配置文件（传入构建环境时使用其独立的配置）
+        self.context = context
+        self.config = context.config if context else self.load_config(config_file)
 
         # API格式列表
         self.avatar_url_patterns = [
@@ -26,6 +36,13 @@ class CharacterCardGenerator:
         self.font_path = self.config.get("font_path")
         self.output_path = self.config.get("cards_folder")
 
+        # 非交互模式下（如构建服务）下载失败时不再询问用户
+        self.interactive = self.config.get("interactive", True)
+
+        # 下载素材的共享缓存，多个构建之间复用
+        asset_cache_dir = self.config.get("asset_cache")
+        self.asset_cache = get_asset_cache(asset_cache_dir) if asset_cache_dir else None
+
         # 如果没有配置字体路径，尝试查找系统字体
         if not self.font_path:
             possible_fonts = [
@@ -65,14 +82,20 @@ class CharacterCardGenerator:
 
     def download_image_with_fallback(self, url_patterns, save_path, image_type, character_name):
         """尝试多种URL格式下载图像"""
+        # requests 导入较慢（约0.1秒），只在真正需要下载时才导入
+        import requests
+
         for pattern in url_patterns:
             url = pattern.format(character_name)
+            if self.asset_cache and self.asset_cache.fetch(url, save_path):
+                print(f"使用缓存的{image_type}: {url}")
+                return True
             try:
                 response = requests.get(url, stream=True, timeout=30)
                 if response.status_code == 200:
-                    with open(save_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
+                    self.save_response(response, save_path)
+                    if self.asset_cache:
+                        self.asset_cache.store(url, save_path)
                     print(f"成功下载{image_type}: {url}")
                     return True
             except Exception as e:
@@ -81,6 +104,9 @@ class CharacterCardGenerator:
 
         # 如果所有URL都失败，询问用户
         print(f"所有{image_type}URL尝试失败")
+        if not self.interactive:
+            return False
+
         manual_url = input(f"是否手动指定{character_name}的{image_type}URL? (y/n): ").strip().lower()
         if manual_url == 'y':
             custom_url = input(f"请输入{character_name}的{image_type}URL: ").strip()
@@ -88,9 +114,7 @@ class CharacterCardGenerator:
                 try:
                     response = requests.get(custom_url, stream=True, timeout=30)
                     response.raise_for_status()
-                    with open(save_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
+                    self.save_response(response, save_path)
                     print(f"使用手动URL成功下载{image_type}")
                     return True
                 except Exception as e2:
@@ -109,7 +133,7 @@ class CharacterCardGenerator:
 
                     processed_img = self.process_local_image(local_path, target_size, image_type)
                     if processed_img:
-                        processed_img.save(save_path, quality=95)
+                        atomic_save_image(processed_img, save_path, quality=95)
                         print(f"使用本地文件成功: {local_path}")
                         return True
                 except Exception as e2:
@@ -117,29 +141,57 @@ class CharacterCardGenerator:
 
         return False
 
-    def process_local_image(self, image_path, target_size, image_type):
-        """处理本地图像，缩放和裁剪到目标尺寸"""
+    def save_response(self, response, save_path):
+        """将下载内容写入临时文件，完整下载后再重命名到目标路径"""
+        tmp_path = temp_path_for(save_path)
         try:
-            img = Image.open(image_path)
-            target_width, target_height = target_size
-            img_width, img_height = img.size
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    f.write(chunk)
+            os.replace(tmp_path, save_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
-            scale_ratio = max(target_width / img_width, target_height / img_height)
-            new_width = int(img_width * scale_ratio)
-            new_height = int(img_height * scale_ratio)
-
-            img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-            left = (new_width - target_width) // 2
-            top = (new_height - target_height) // 2
-            right = left + target_width
-            bottom = top + target_height
+    def process_local_image(self, image_path, target_size, image_type):
+        """处理本地图像，缩放和裁剪到目标尺寸
 
-            img_cropped = img_resized.crop((left, top, right, bottom))
+        只读取文件头检查尺寸，超过像素上限（max_image_pixels）的图像直接拒绝；
+        先算出源图中需要的区域再缩放，JPEG按比例解码，不会完整解码再裁剪。
+        """
+        max_pixels = self.config.get("max_image_pixels", DEFAULT_MAX_IMAGE_PIXELS)
+        try:
+            # 尺寸由下面的像素上限把关，不需要 Pillow 再发出解压炸弹警告
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+                img = Image.open(image_path)
+
+            with img:
+                # Image.open 只解析文件头，此时还没有解码像素
+                img_width, img_height = img.size
+                if max_pixels and img_width * img_height > max_pixels:
+                    print(f"图像过大，已拒绝: {os.path.basename(image_path)} ({img_width}x{img_height}，"
+                          f"上限 {max_pixels} 像素)")
+                    return None
+
+                target_width, target_height = target_size
+                scale_ratio = max(target_width / img_width, target_height / img_height)
+
+                # 目标区域在源图中对应的范围（居中裁剪）
+                crop_width = target_width / scale_ratio
+                crop_height = target_height / scale_ratio
+                left = (img_width - crop_width) / 2
+                top = (img_height - crop_height) / 2
+                box = (left, top, left + crop_width, top + crop_height)
+
+                img_cropped = resize_image(img, target_size, self.config.get("resample_quality", "high"), box=box)
 
             print(f"成功处理{image_type}图像: {os.path.basename(image_path)} -> {target_size[0]}x{target_size[1]}")
             return img_cropped
 
+        except Image.DecompressionBombError as e:
+            print(f"图像过大，已拒绝: {str(e)}")
+            return None
         except Exception as e:
             print(f"处理本地图像失败: {str(e)}")
             return None
@@ -148,59 +200,75 @@ class CharacterCardGenerator:
         """检查角色是否有特殊形态"""
         if '/' in character_name:
             base_name, form_name = character_name.split('/', 1)
-            base_name_encoded = requests.utils.quote(base_name)
-            form_name_encoded = requests.utils.quote(form_name)
+            base_name_encoded = quote(base_name)
+            form_name_encoded = quote(form_name)
 
             avatar_url = f"https://static.kivo.wiki/images/students/{base_name_encoded}/{form_name_encoded}/avatar.png"
             sd_model_url = f"https://static.kivo.wiki/images/students/{base_name_encoded}/{form_name_encoded}/sd_model.png"
             return avatar_url, sd_model_url, True
         else:
-            character_name_encoded = requests.utils.quote(character_name)
+            character_name_encoded = quote(character_name)
             avatar_url = self.avatar_url_patterns[0].format(character_name_encoded)
             sd_model_url = self.sd_model_url_patterns[0].format(character_name_encoded)
             return avatar_url, sd_model_url, False
 
-    def create_character_card(self, character_name):
-        """创建角色信息卡"""
-        # 删除角色名中的空格
+    def get_download_urls(self, character_name):
+        """返回头像和SD模型的候选URL列表（处理特殊形态）"""
+        avatar_url, sd_model_url, is_special_form = self.get_special_form_urls(character_name)
+
+        # 如果是特殊形态，直接使用特殊URL；普通形态尝试多种URL格式
+        if is_special_form:
+            return [avatar_url], [sd_model_url], True
+
+        avatar_urls = [pattern.format(character_name) for pattern in self.avatar_url_patterns]
+        sd_model_urls = [pattern.format(character_name) for pattern in self.sd_model_url_patterns]
+        return avatar_urls, sd_model_urls, False
+
+    def get_temp_paths(self, character_name):
+        """返回下载临时文件的路径 (头像, SD模型)"""
+        # 创建临时文件夹（构建环境下使用其专用的临时目录）
+        temp_dir = self.context.get_scratch_dir() if self.context else "temp_images"
+        os.makedirs(temp_dir, exist_ok=True)
+
         safe_character_name = self.safe_filename(character_name)
+        avatar_path = os.path.join(temp_dir, f"{safe_character_name}_avatar.png")
+        sd_model_path = os.path.join(temp_dir, f"{safe_character_name}_sd_model.png")
+        return avatar_path, sd_model_path
+
+    def create_character_card(self, character_name, output_dir=None):
+        """创建角色信息卡，默认保存到配置中的 cards_folder"""
         display_name = self.format_display_name(character_name)
 
         print(f"开始为角色 '{display_name}' 创建信息卡...")
 
-        # 创建临时文件夹
-        temp_dir = "temp_images"
-        os.makedirs(temp_dir, exist_ok=True)
-
         # 获取正确的URL（处理特殊形态）
-        avatar_url, sd_model_url, is_special_form = self.get_special_form_urls(character_name)
+        avatar_urls, sd_model_urls, is_special_form = self.get_download_urls(character_name)
 
         if is_special_form:
             print(f"检测到特殊形态角色，使用特殊URL格式")
 
-        avatar_path = os.path.join(temp_dir, f"{safe_character_name}_avatar.png")
-        sd_model_path = os.path.join(temp_dir, f"{safe_character_name}_sd_model.png")
+        avatar_path, sd_model_path = self.get_temp_paths(character_name)
 
         # 下载图像，使用回退机制
-        avatar_available = False
-        sd_model_available = False
+        avatar_available = self.download_image_with_fallback(avatar_urls, avatar_path, "头像", character_name)
+        sd_model_available = self.download_image_with_fallback(sd_model_urls, sd_model_path, "SD模型",
+                                                               character_name)
 
-        # 如果是特殊形态，直接使用特殊URL
-        if is_special_form:
-            avatar_available = self.download_image_with_fallback([avatar_url], avatar_path, "头像", character_name)
-            sd_model_available = self.download_image_with_fallback([sd_model_url], sd_model_path, "SD模型",
-                                                                   character_name)
-        else:
-            # 普通形态，尝试多种URL格式
-            avatar_available = self.download_image_with_fallback(self.avatar_url_patterns, avatar_path, "头像",
-                                                                 character_name)
-            sd_model_available = self.download_image_with_fallback(self.sd_model_url_patterns, sd_model_path, "SD模型",
-                                                                   character_name)
+        output_path = self.compose_character_card(character_name, avatar_path, sd_model_path,
+                                                  avatar_available, sd_model_available, output_dir)
+        return output_path is not None
+
+    def compose_character_card(self, character_name, avatar_path, sd_model_path,
+                               avatar_available, sd_model_available, output_dir=None):
+        """用已下载的头像和SD模型合成角色信息卡，成功时返回保存路径，失败返回None"""
+        # 删除角色名中的空格
+        safe_character_name = self.safe_filename(character_name)
+        display_name = self.format_display_name(character_name)
 
         # 如果两个图像都下载失败，则返回失败
         if not avatar_available and not sd_model_available:
             print(f"角色 '{display_name}' 的头像和SD模型都无法下载，跳过此角色")
-            return False
+            return None
 
         try:
             # 处理图像
@@ -212,19 +280,12 @@ class CharacterCardGenerator:
 
             # 处理头像图像
             if avatar_available:
-                avatar_img = Image.open(avatar_path)
-                if avatar_img.mode in ('RGBA', 'LA') or (avatar_img.mode == 'P' and 'transparency' in avatar_img.info):
-                    background = Image.new('RGB', avatar_img.size, (255, 255, 255))
-                    if avatar_img.mode in ('RGBA', 'LA'):
-                        background.paste(avatar_img, mask=avatar_img.split()[-1])
-                    else:
-                        background.paste(avatar_img)
-                    avatar_img = background
+                avatar_img = flatten_to_rgb(Image.open(avatar_path))
             else:
                 avatar_img = Image.new('RGB', avatar_placeholder_size, (240, 240, 240))
                 draw_placeholder = ImageDraw.Draw(avatar_img)
                 try:
-                    font = ImageFont.truetype(self.font_path, 24) if self.font_path else ImageFont.load_default()
+                    font = get_font(self.font_path, 24) if self.font_path else ImageFont.load_default()
                     text = "头像不可用"
                     bbox = draw_placeholder.textbbox((0, 0), text, font=font)
                     text_width = bbox[2] - bbox[0]
@@ -237,20 +298,12 @@ class CharacterCardGenerator:
 
             # 处理SD模型图像
             if sd_model_available:
-                sd_model_img = Image.open(sd_model_path)
-                if sd_model_img.mode in ('RGBA', 'LA') or (
-                        sd_model_img.mode == 'P' and 'transparency' in sd_model_img.info):
-                    background = Image.new('RGB', sd_model_img.size, (255, 255, 255))
-                    if sd_model_img.mode in ('RGBA', 'LA'):
-                        background.paste(sd_model_img, mask=sd_model_img.split()[-1])
-                    else:
-                        background.paste(sd_model_img)
-                    sd_model_img = background
+                sd_model_img = flatten_to_rgb(Image.open(sd_model_path))
             else:
                 sd_model_img = Image.new('RGB', sd_model_placeholder_size, (240, 240, 240))
                 draw_placeholder = ImageDraw.Draw(sd_model_img)
                 try:
-                    font = ImageFont.truetype(self.font_path, 24) if self.font_path else ImageFont.load_default()
+                    font = get_font(self.font_path, 24) if self.font_path else ImageFont.load_default()
                     text = "SD模型不可用"
                     bbox = draw_placeholder.textbbox((0, 0), text, font=font)
                     text_width = bbox[2] - bbox[0]
@@ -287,12 +340,12 @@ class CharacterCardGenerator:
             self.add_decorations(draw, card_width, card_height)
 
             # 保存结果
-            output_path = self.config.get("cards_folder")
+            output_path = output_dir or self.config.get("cards_folder")
             print(f"输出路径: {output_path}")
             os.makedirs(output_path, exist_ok=True)
             output_path = os.path.join(output_path, f"{safe_character_name}_card.png")
 
-            card.save(output_path, quality=95)
+            atomic_save_image(card, output_path, quality=95)
             print(f"角色信息卡已保存: {output_path}")
 
             # 清理临时文件
@@ -304,11 +357,11 @@ class CharacterCardGenerator:
             except:
                 pass
 
-            return True
+            return output_path
 
         except Exception as e:
             print(f"创建角色信息卡时出错: {str(e)}")
-            return False
+            return None
 
     def add_character_name(self, draw, name, x, y):
         """添加角色名称到图像左上方"""
@@ -316,7 +369,7 @@ class CharacterCardGenerator:
             font_size = 60
             if self.font_path:
                 try:
-                    font = ImageFont.truetype(self.font_path, font_size)
+                    font = get_font(self.font_path, font_size)
                 except:
                     font = ImageFont.load_default()
             else:
@@ -336,18 +389,34 @@ class CharacterCardGenerator:
         line_color = (150, 150, 150)
         draw.line([10, 120, width - 10, 120], fill=line_color, width=2)
 
-    def batch_create_cards(self, character_names, output_dir="character_cards"):
-        """批量创建多个角色的信息卡"""
+    def batch_create_cards(self, character_names, output_dir=None, resume=True):
+        """批量创建多个角色的信息卡，已完成的角色记录在检查点中，中断后可续跑"""
+        output_dir = output_dir or self.config.get("cards_folder") or "character_cards"
         os.makedirs(output_dir, exist_ok=True)
 
+        checkpoint = BuildCheckpoint(os.path.join(output_dir, ".cards_checkpoint.json"),
+                                     signature=self.font_path or "")
+        if not resume:
+            checkpoint.reset()
+
         success_count = 0
         for name in character_names:
             safe_name = self.safe_filename(name)
             output_path = os.path.join(output_dir, f"{safe_name}_card.png")
-            if self.create_character_card(name):
+            if checkpoint.is_done(name) and os.path.exists(output_path):
+                print(f"跳过已完成的角色: {name}")
+                success_count += 1
+                continue
+
+            if self.create_character_card(name, output_dir):
+                checkpoint.mark_done(name)
                 success_count += 1
 
         print(f"\n批量创建完成: {success_count}/{len(character_names)} 个角色信息卡创建成功")
+        if success_count == len(character_names):
+            checkpoint.clear()
+        else:
+            print("失败的角色未记录到检查点，重新运行将只处理这些角色")
         return success_count
 
 def main():
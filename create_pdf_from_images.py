@@ -1,12 +1,15 @@
 import os
 import glob
 from PIL import Image
-from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, letter
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfdoc
 import argparse
 
+from image_ops import flatten_to_rgb, has_transparency
+from pdf_passthrough import draw_passthrough_image, probe_passthrough
+from pdf_writer import write_image_pdf
+
 
 def get_image_files(folder_path, extensions=None):
     """
@@ -53,9 +56,46 @@ def calculate_image_size(img_width, img_height, page_width, page_height, margin=
     return x, y, new_width, new_height
 
 
-def create_pdf_from_images(folder_path, output_pdf, page_size='A4', margin=50, include_subfolders=True):
+def draw_image_page(c, image_path, page_width, page_height, margin):
+    """把一张图像居中绘制到当前页面
+
+    JPEG和普通PNG直接嵌入原始压缩数据，不解码；只有需要转换的图像才交给PIL处理。
+    """
+    info = probe_passthrough(image_path)
+    if info is not None:
+        x, y, display_width, display_height = calculate_image_size(
+            info.width, info.height, page_width, page_height, margin
+        )
+        draw_passthrough_image(c, image_path, x, y, display_width, display_height, info)
+        return
+
+    # 打开图像
+    with Image.open(image_path) as img:
+        # 获取图像尺寸
+        img_width, img_height = img.size
+
+        # 计算自适应尺寸和位置
+        x, y, display_width, display_height = calculate_image_size(
+            img_width, img_height, page_width, page_height, margin
+        )
+
+        # 带透明度的图像合成到白色背景上，其他图像直接由ImageReader读取文件
+        if has_transparency(img):
+            img_reader = ImageReader(flatten_to_rgb(img))
+        else:
+            img_reader = ImageReader(image_path)
+
+        # 在PDF上绘制图像
+        c.drawImage(img_reader, x, y, display_width, display_height)
+
+
+def create_pdf_from_images(folder_path, output_pdf, page_size='A4', margin=50, include_subfolders=True, workers=1,
+                           backend='stream'):
     """
     从图像创建PDF文档
+
+    backend 为 'stream' 时逐页写盘，内存占用与图像数量无关；为 'reportlab' 时整个文档在内存中生成。
+    workers 大于1时图像在多个进程中并行编码，再按顺序写入PDF
     """
     # 检查文件夹是否存在
     if not os.path.exists(folder_path):
@@ -97,7 +137,11 @@ def create_pdf_from_images(folder_path, output_pdf, page_size='A4', margin=50, i
             print("使用默认的A4页面尺寸")
             page_width, page_height = A4
 
-    # 创建PDF
+    if backend == 'stream' or workers > 1:
+        return create_pdf_streaming(image_files, output_pdf, (page_width, page_height), margin, workers)
+
+    # 创建PDF（reportlab 的画布模块较重，只有这个后端用到，使用时才导入）
+    from reportlab.pdfgen import canvas
     try:
         c = canvas.Canvas(output_pdf, pagesize=(page_width, page_height))
 
@@ -105,30 +149,11 @@ def create_pdf_from_images(folder_path, output_pdf, page_size='A4', margin=50, i
             try:
                 print(f"处理图像 {i + 1}/{len(image_files)}: {os.path.basename(image_path)}")
 
-                # 打开图像
-                with Image.open(image_path) as img:
-                    # 转换为RGB（如果必要）
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-
-                    # 获取图像尺寸
-                    img_width, img_height = img.size
+                draw_image_page(c, image_path, page_width, page_height, margin)
 
-                    # 计算自适应尺寸和位置
-                    x, y, display_width, display_height = calculate_image_size(
-                        img_width, img_height, page_width, page_height, margin
-                    )
-
-                    # 将图像保存为临时文件或使用ImageReader
-                    # 这里我们使用ImageReader直接读取图像
-                    img_reader = ImageReader(image_path)
-
-                    # 在PDF上绘制图像
-                    c.drawImage(img_reader, x, y, display_width, display_height)
-
-                    # 添加新页面
-                    if i < len(image_files) - 1:  # 最后一页后不添加空白页
-                        c.showPage()
+                # 添加新页面
+                if i < len(image_files) - 1:  # 最后一页后不添加空白页
+                    c.showPage()
 
             except Exception as e:
                 print(f"处理图像 '{image_path}' 时出错: {str(e)}")
@@ -144,6 +169,32 @@ def create_pdf_from_images(folder_path, output_pdf, page_size='A4', margin=50, i
         return False
 
 
+def create_pdf_streaming(image_files, output_pdf, page_size, margin, workers=1):
+    """用流式写入器逐页写出PDF；workers 大于1时图像在进程池中并行编码"""
+    page_width, page_height = page_size
+
+    def placement(info):
+        return calculate_image_size(info.width, info.height, page_width, page_height, margin)
+
+    def report(index, total, image_path):
+        print(f"处理图像 {index}/{total}: {os.path.basename(image_path)}")
+
+    def on_error(image_path, error):
+        print(f"处理图像 '{image_path}' 时出错: {str(error)}")
+
+    try:
+        if not write_image_pdf(output_pdf, image_files, page_size, placement=placement, workers=workers,
+                               progress_callback=report, on_error=on_error):
+            print("没有可以写入的图像，未生成PDF")
+            return False
+        print(f"PDF已成功生成: {output_pdf}")
+        return True
+
+    except Exception as e:
+        print(f"生成PDF时出错: {str(e)}")
+        return False
+
+
 def main():
     """
     主函数，处理命令行参数
@@ -157,6 +208,10 @@ def main():
                         help='页面边距，单位: 点 (默认: 50)')
     parser.add_argument('--no-subfolders', action='store_true',
                         help='不包含子文件夹中的图像')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='并行编码图像的进程数 (默认: 1)')
+    parser.add_argument('--backend', choices=['stream', 'reportlab'], default='stream',
+                        help='PDF写入方式: stream 逐页写盘, reportlab 整个文档在内存中生成 (默认: stream)')
 
     args = parser.parse_args()
 
@@ -176,7 +231,9 @@ def main():
         output_pdf=args.output,
         page_size=args.page_size,
         margin=args.margin,
-        include_subfolders=include_subfolders
+        include_subfolders=include_subfolders,
+        workers=args.workers,
+        backend=args.backend
     )
 
     if success:
@@ -1,6 +1,14 @@
 from PIL import Image, ImageDraw, ImageFont
+import argparse
+import functools
+import json
 import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+from build_checkpoint import atomic_save_image, atomic_write_bytes
+from shared_cache import get_font
 
 # 硬编码配置
 CONFIG = {
@@ -12,38 +20,65 @@ CONFIG = {
     'padding': 50
 }
 
+# 图集的最大宽度（像素），超过时换行
+ATLAS_MAX_WIDTH = 4096
 
-def create_text_image(text, output_path):
-    """
-    使用硬编码配置渲染文字并保存为图片
-    """
-    try:
-        # 加载字体
-        font = ImageFont.truetype(CONFIG['font_path'], CONFIG['font_size'])
+# 每张图集的最大高度（像素），超过时另起一张图集
+ATLAS_MAX_HEIGHT = 4096
+
+# 图集中相邻图片之间的间隔，避免缩放显示时相互渗色
+ATLAS_GAP = 2
+
+
+@functools.lru_cache(maxsize=1)
+def _measure_draw():
+    """多行文字测量用的绘图对象，整个进程只创建一次"""
+    return ImageDraw.Draw(Image.new('RGBA', (1, 1), (0, 0, 0, 0)))
 
-        # 创建临时绘图对象来计算文字尺寸
-        temp_img = Image.new('RGBA', (1, 1), (0, 0, 0, 0))
-        temp_draw = ImageDraw.Draw(temp_img)
 
-        # 计算文字边界框
-        bbox = temp_draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+@functools.lru_cache(maxsize=8192)
+def measure_text(text, font_path, font_size):
+    """计算并缓存文字边界框；单行文字直接由字体计算，不需要临时图像"""
+    font = get_font(font_path, font_size)
+    if '\n' in text:
+        return _measure_draw().multiline_textbbox((0, 0), text, font=font)
+    return font.getbbox(text)
 
-        # 计算图片尺寸
-        img_width = text_width + CONFIG['padding'] * 2
-        img_height = text_height + CONFIG['padding'] * 2
 
-        # 创建图片
-        img = Image.new('RGBA', (img_width, img_height), CONFIG['bg_color'])
-        draw = ImageDraw.Draw(img)
+def render_text_image(text, font_path=None, font_size=None):
+    """按配置渲染文字，返回RGBA图像"""
+    font_path = font_path or CONFIG['font_path']
+    font_size = font_size or CONFIG['font_size']
+    font = get_font(font_path, font_size)
 
-        # 计算文字位置（居中）
-        x = (img_width - text_width) / 2
-        y = (img_height - text_height) / 2
+    # 计算文字边界框
+    bbox = measure_text(text, font_path, font_size)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
 
-        # 绘制文字
-        draw.text((x, y), text, font=font, fill=CONFIG['text_color'])
+    # 计算图片尺寸
+    img_width = text_width + CONFIG['padding'] * 2
+    img_height = text_height + CONFIG['padding'] * 2
+
+    # 创建图片
+    img = Image.new('RGBA', (img_width, img_height), CONFIG['bg_color'])
+    draw = ImageDraw.Draw(img)
+
+    # 计算文字位置（居中）
+    x = (img_width - text_width) / 2
+    y = (img_height - text_height) / 2
+
+    # 绘制文字
+    draw.text((x, y), text, font=font, fill=CONFIG['text_color'])
+    return img
+
+
+def create_text_image(text, output_path):
+    """
+    使用硬编码配置渲染文字并保存为图片
+    """
+    try:
+        img = render_text_image(text)
 
         # 保存图片
         img.save(output_path, 'PNG')
@@ -56,11 +91,133 @@ def create_text_image(text, output_path):
         return False
 
 
-def main():
-    """主函数 - 持续运行模式"""
-    # 确保输出目录存在
-    os.makedirs(CONFIG['output_dir'], exist_ok=True)
+def _init_worker(font_path, font_size):
+    """工作进程启动时加载一次字体"""
+    CONFIG['font_path'] = font_path
+    CONFIG['font_size'] = font_size
+    get_font(font_path, font_size)
+
+
+def _render_to_file(text, output_path):
+    img = render_text_image(text)
+    atomic_save_image(img, output_path, 'PNG')
+    return img.size
+
+
+def _render_to_bytes(text):
+    img = render_text_image(text)
+    return img.size, img.tobytes()
+
+
+def text_image_size(text):
+    """render_text_image 输出的图片尺寸，只测量文字不渲染"""
+    bbox = measure_text(text, CONFIG['font_path'], CONFIG['font_size'])
+    return bbox[2] - bbox[0] + CONFIG['padding'] * 2, bbox[3] - bbox[1] + CONFIG['padding'] * 2
+
+
+def read_texts(source):
+    """从文件（'-' 表示标准输入）读取要渲染的文字，每行一条，忽略空行"""
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def pack_atlas(sizes, max_width=ATLAS_MAX_WIDTH, max_height=ATLAS_MAX_HEIGHT, gap=ATLAS_GAP):
+    """按行（货架）排列图片：从高到低依次放置，一行放不下时换行，一张图集放不下时另起一张
+
+    返回 ([每张图集的 (宽, 高)], [每张图片的 (图集序号, x, y)])，后者顺序与 sizes 相同。
+    单张图片超过最大宽度或高度时，所在图集按这张图片放大。
+    """
+    max_width = max(max_width, max(w for w, _ in sizes))
+    order = sorted(range(len(sizes)), key=lambda i: sizes[i][1], reverse=True)
+    positions = [None] * len(sizes)
+    pages = []
+    x = y = row_height = atlas_width = 0
+    for i in order:
+        width, height = sizes[i]
+        if x > 0 and x + width > max_width:
+            y += row_height + gap
+            x = row_height = 0
+        if y > 0 and y + height > max_height:
+            pages.append((atlas_width, y - gap))
+            x = y = row_height = atlas_width = 0
+        positions[i] = (len(pages), x, y)
+        x += width + gap
+        row_height = max(row_height, height)
+        atlas_width = max(atlas_width, x - gap)
+    pages.append((atlas_width, y + row_height))
+    return pages, positions
 
+
+def atlas_file_name(atlas_name, page, page_count):
+    """只有一张图集时为 NAME.png，多张时为 NAME_1.png、NAME_2.png ..."""
+    return f"{atlas_name}.png" if page_count == 1 else f"{atlas_name}_{page + 1}.png"
+
+
+def render_batch(texts, output_dir, workers=4, atlas_name=None):
+    """批量渲染文字图片
+
+    相同的文字只渲染一次；每个工作进程只加载一次字体。给出 atlas_name 时把所有图片拼成
+    图集 <atlas_name>.png（超过 ATLAS_MAX_HEIGHT 时拆成 <atlas_name>_1.png、_2.png ...）
+    并写出 <atlas_name>.json 索引，否则每条文字保存为一个文件，并写出 index.json 记录文件与文字的对应关系。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    unique_texts = list(dict.fromkeys(texts))
+    initargs = (CONFIG['font_path'], CONFIG['font_size'])
+
+    if not atlas_name:
+        paths = {text: os.path.join(output_dir, f"text_{i + 1:05d}.png") for i, text in enumerate(unique_texts)}
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            sizes = dict(zip(unique_texts, pool.map(_render_to_file, unique_texts,
+                                                    [paths[text] for text in unique_texts], chunksize=16)))
+        index = [{"text": text, "file": os.path.basename(paths[text]), "width": sizes[text][0],
+                  "height": sizes[text][1]} for text in texts]
+        atomic_write_bytes(os.path.join(output_dir, "index.json"),
+                           json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+        print(f"已生成 {len(unique_texts)} 张文字图片（共 {len(texts)} 条）到 {output_dir}")
+        return True
+
+    # 先测量尺寸完成排列，再逐张图集渲染：渲染结果到达后立即贴入图集并丢弃，
+    # 同时只保留一张图集和它的图片，不会把所有位图都留在主进程中
+    sizes = [text_image_size(text) for text in unique_texts]
+    pages, positions = pack_atlas(sizes)
+    page_texts = [[] for _ in pages]
+    for i, (page, _, _) in enumerate(positions):
+        page_texts[page].append(i)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        for page, members in enumerate(page_texts):
+            atlas = Image.new('RGBA', pages[page], CONFIG['bg_color'])
+            results = pool.map(_render_to_bytes, [unique_texts[i] for i in members], chunksize=16)
+            for i, (size, data) in zip(members, results):
+                if size != sizes[i]:
+                    raise RuntimeError(f"文字图片尺寸与测量结果不一致: {unique_texts[i]!r} {size} != {sizes[i]}")
+                _, x, y = positions[i]
+                sprite = Image.frombytes('RGBA', size, data)
+                atlas.paste(sprite, (x, y))
+                sprite.close()
+
+            atlas_path = os.path.join(output_dir, atlas_file_name(atlas_name, page, len(pages)))
+            atomic_save_image(atlas, atlas_path, 'PNG')
+            atlas.close()
+            print(f"图集已保存: {atlas_path}（{pages[page][0]}x{pages[page][1]}，{len(members)} 张图片）")
+
+    rects = {text: {"page": page, "x": x, "y": y, "width": w, "height": h}
+             for text, (page, x, y), (w, h) in zip(unique_texts, positions, sizes)}
+    index = {"pages": [{"image": atlas_file_name(atlas_name, page, len(pages)), "width": width, "height": height}
+                       for page, (width, height) in enumerate(pages)],
+             "sprites": [dict(text=text, **rects[text]) for text in texts]}
+    atomic_write_bytes(os.path.join(output_dir, f"{atlas_name}.json"),
+                       json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8'))
+    print(f"共 {len(pages)} 张图集，{len(unique_texts)} 张图片")
+    return True
+
+
+def interactive_loop():
+    """交互模式 - 持续运行"""
     print("=== 文字渲染工具 (持续运行模式) ===")
     print(f"字体: {CONFIG['font_path']}")
     print(f"字体大小: {CONFIG['font_size']}")
@@ -98,6 +255,46 @@ def main():
             print("生成失败，请重试")
 
 
+def main():
+    """主函数：没有指定 --batch 时进入交互模式"""
+    parser = argparse.ArgumentParser(description='把文字渲染为透明背景的PNG图片')
+    parser.add_argument('--batch', metavar='FILE', help="批量模式：从文件读取文字（每行一条），'-' 表示标准输入")
+    parser.add_argument('--atlas', metavar='NAME', help='批量模式下把所有图片拼成图集 NAME.png（过高时拆成 NAME_1.png、NAME_2.png ...），并生成 NAME.json 索引')
+    parser.add_argument('-o', '--output-dir', default=CONFIG['output_dir'],
+                        help=f"输出目录 (默认: {CONFIG['output_dir']})")
+    parser.add_argument('--font', default=CONFIG['font_path'], help='字体文件路径')
+    parser.add_argument('--size', type=int, default=CONFIG['font_size'],
+                        help=f"字体大小 (默认: {CONFIG['font_size']})")
+    parser.add_argument('-w', '--workers', type=int, default=4, help='批量模式的渲染进程数 (默认: 4)')
+    args = parser.parse_args()
+
+    CONFIG['font_path'] = args.font
+    CONFIG['font_size'] = args.size
+    CONFIG['output_dir'] = args.output_dir
+
+    # 检查字体文件是否存在
+    if not os.path.exists(CONFIG['font_path']):
+        print(f"错误: 字体文件不存在 - {CONFIG['font_path']}")
+        print("请修改 CONFIG 中的 font_path 为正确的字体文件路径，或用 --font 指定")
+        exit(1)
+
+    # 确保输出目录存在
+    os.makedirs(CONFIG['output_dir'], exist_ok=True)
+
+    if not args.batch:
+        interactive_loop()
+        return
+
+    texts = read_texts(args.batch)
+    if not texts:
+        print("没有需要渲染的文字")
+        return
+
+    start = time.time()
+    render_batch(texts, CONFIG['output_dir'], args.workers, args.atlas)
+    print(f"用时 {time.time() - start:.1f} 秒")
+
+
 if __name__ == "__main__":
     # 安装依赖提示
     try:
@@ -106,10 +303,4 @@ if __name__ == "__main__":
         print("请安装Pillow库: pip install pillow")
         exit(1)
 
-    # 检查字体文件是否存在
-    if not os.path.exists(CONFIG['font_path']):
-        print(f"错误: 字体文件不存在 - {CONFIG['font_path']}")
-        print("请修改 CONFIG 中的 font_path 为正确的字体文件路径")
-        exit(1)
-
-    main()
\ No newline at end of file
+    main()
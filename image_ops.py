@@ -0,0 +1,116 @@
+import math
+
+from PIL import Image
+
+# 质量档位：reduce 预缩小后至少保留目标尺寸的多少倍，以及最终使用的滤镜
+# high 保留3倍余量再用LANCZOS，肉眼与直接LANCZOS无差别；档位越低越快
+QUALITY_TIERS = {
+    "high": (3.0, Image.Resampling.LANCZOS),
+    "balanced": (2.0, Image.Resampling.BICUBIC),
+    "fast": (1.0, Image.Resampling.BILINEAR),
+    "draft": (1.0, Image.Resampling.BOX),
+}
+
+# 放大时各档位使用的滤镜
+UPSCALE_FILTERS = {
+    "high": Image.Resampling.LANCZOS,
+    "balanced": Image.Resampling.BICUBIC,
+    "fast": Image.Resampling.BILINEAR,
+    "draft": Image.Resampling.NEAREST,
+}
+
+DEFAULT_QUALITY = "high"
+
+
+def choose_strategy(src_size, dst_size, quality=DEFAULT_QUALITY):
+    """根据缩小倍数和质量档位选择 (整数reduce因子, 最终滤镜)"""
+    if quality not in QUALITY_TIERS:
+        raise ValueError(f"未知的缩放质量档位: {quality}")
+
+    gap, resample = QUALITY_TIERS[quality]
+    scale = min(src_size[0] / dst_size[0], src_size[1] / dst_size[1])
+    if scale <= 1:
+        return 1, UPSCALE_FILTERS[quality]
+
+    factor = int(math.floor(scale / gap))
+    return (factor if factor >= 2 else 1), resample
+
+
+def reducible(img):
+    """返回可以用 reduce() 平均像素的图像
+
+    reduce() 不支持调色板、1位和16位整数图像（PA 虽不报错，但平均的是调色板索引），
+    这些模式先转换：调色板转为RGB（有透明信息时为RGBA），1位转为L，16位整数转为I
+    （缩小后由 resize_image 转回原来的16位模式）。其他模式原样返回。
+    """
+    if img.mode in ('P', 'PA'):
+        return img.convert('RGBA' if has_transparency(img) else 'RGB')
+    if img.mode == '1':
+        return img.convert('L')
+    if img.mode.startswith('I;16'):
+        return img.convert('I')
+    return img
+
+
+def resize_image(img, size, quality=DEFAULT_QUALITY, box=None):
+    """按质量档位缩放图像：大倍数缩小时先整数reduce再用高质量滤镜收尾
+
+    box 为源图中的裁剪区域，只对该区域做缩放（等价于先裁剪再缩放）。
+    图像尚未解码时，JPEG会先用draft模式按比例解码。
+    """
+    size = (max(1, int(size[0])), max(1, int(size[1])))
+    if box is None:
+        box = (0, 0, img.width, img.height)
+    box_size = (box[2] - box[0], box[3] - box[1])
+
+    gap = QUALITY_TIERS.get(quality, QUALITY_TIERS[DEFAULT_QUALITY])[0]
+    if img.format == 'JPEG':
+        # draft 保证解码结果不小于请求尺寸，对已解码的图像不起作用；裁剪区域按解码比例同步缩小
+        original_size = img.size
+        requested = (math.ceil(img.width * size[0] * gap / box_size[0]),
+                     math.ceil(img.height * size[1] * gap / box_size[1]))
+        if img.draft(img.mode if img.mode in ('RGB', 'L') else 'RGB', requested):
+            rx = img.width / original_size[0]
+            ry = img.height / original_size[1]
+            box = (box[0] * rx, box[1] * ry, box[2] * rx, box[3] * ry)
+            box_size = (box[2] - box[0], box[3] - box[1])
+
+    factor, resample = choose_strategy(box_size, size, quality)
+    if factor > 1:
+        # reduce 只接受整数坐标
+        box = tuple(int(round(v)) for v in box)
+        source = reducible(img)
+        reduced = source.reduce(factor, box=box)
+        if source is not img:
+            source.close()
+        if img.mode.startswith('I;16'):
+            restored = reduced.convert(img.mode)
+            reduced.close()
+            reduced = restored
+        result = reduced.resize(size, resample)
+        reduced.close()
+        return result
+
+    return img.resize(size, resample, box=box)
+
+
+def has_transparency(img):
+    """图像是否带有透明信息（alpha通道或调色板/tRNS透明色）"""
+    return img.mode in ('RGBA', 'LA', 'PA', 'RGBa') or 'transparency' in img.info
+
+
+def flatten_to_rgb(img, background=(255, 255, 255)):
+    """把图像合成到纯色背景上并返回RGB图像
+
+    调色板和带tRNS透明色的图像只转换一次到RGBA，再以自身alpha为蒙版一次粘贴完成，
+    不需要 split() 出单独的alpha通道。没有透明信息的图像直接转换为RGB。
+    """
+    if not has_transparency(img):
+        return img if img.mode == 'RGB' else img.convert('RGB')
+
+    if img.mode not in ('RGBA', 'LA'):
+        img = img.convert('RGBA')
+
+    result = Image.new('RGB', img.size, tuple(background))
+    result.paste(img, (0, 0), img)
+    return result
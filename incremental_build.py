@@ -0,0 +1,134 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+import zlib
+
+from PIL import ImageEnhance
+from reportlab.lib.pagesizes import A4
+
+from build_checkpoint import temp_path_for
+from page_pipeline import PagePipeline, canvas_pool_size
+from pdf_passthrough import PassthroughInfo
+from pdf_writer import DEFAULT_COMPRESS_LEVEL, ImagePdfWriter, load_manifest, read_stream, save_manifest
+from school_cards_to_png import SchoolCardsToPNG
+
+
+class IncrementalBook:
+    """按页指纹增量生成PDF
+
+    每页的指纹覆盖页面上的卡片文件（修改时间和大小）、排版参数和对比度设置，
+    记录在PDF旁的清单中。重新构建时只渲染指纹变化的页面，其余页面的图像流
+    从上一次的PDF中原样复制，不解码也不重新压缩。
+    """
+
+    def __init__(self, config_file="config.json", context=None, builder=None):
+        self.builder = builder or SchoolCardsToPNG(config_file, context)
+        self.config = self.builder.config
+        if self.config.get("add_contrast", False):
+            self.contrast_factor = self.config.get("contrast_factor", 1.2)
+        else:
+            self.contrast_factor = None
+        self.compress_level = DEFAULT_COMPRESS_LEVEL
+
+    def fingerprint(self, spec):
+        """页面指纹：页面内容摘要加上PDF阶段的对比度和压缩设置"""
+        content = [self.builder.page_content_fingerprint(spec), self.contrast_factor, self.compress_level]
+        return hashlib.sha1(json.dumps(content).encode('utf-8')).hexdigest()
+
+    def encode_page(self, page):
+        """对渲染好的页面做对比度增强并压缩成PDF图像流"""
+        if self.contrast_factor is not None:
+            page = ImageEnhance.Contrast(page).enhance(self.contrast_factor)
+        data = zlib.compress(page.tobytes(), self.compress_level)
+        return PassthroughInfo(page.width, page.height, 8, 'DeviceRGB', ['FlateDecode'], data)
+
+    def build(self, output_pdf=None, full=False, pages=None):
+        """生成或增量更新PDF；full 为True时忽略上一次的结果全部重新渲染
+
+        pages 为要放入PDF的页面描述（默认为整本书），所有页面指纹与上一次完全相同时不改写PDF。
+        """
+        if output_pdf is None:
+            output_pdf = self.config.get("students_pdf", "students.pdf")
+
+        if pages is None:
+            pages = self.builder.plan_pages()
+        if not pages:
+            print("没有可生成的页面")
+            return False
+
+        fingerprints = {spec["page_number"]: self.fingerprint(spec) for spec in pages}
+
+        previous = {}
+        if not full:
+            records = load_manifest(output_pdf) or []
+            if [record["fingerprint"] for record in records] == list(fingerprints.values()):
+                print(f"PDF没有变化: {output_pdf}")
+                return True
+            for record in records:
+                previous[record["fingerprint"]] = record
+
+        def reusable(spec):
+            return fingerprints[spec["page_number"]] in previous
+
+        builder = self.builder
+        pool_size = canvas_pool_size(builder.width, builder.height, self.config.get("page_memory_budget_mb"))
+        pipeline = PagePipeline(builder.render_page, (builder.width, builder.height), pool_size)
+
+        tmp_pdf = temp_path_for(output_pdf)
+        old_pdf = open(output_pdf, 'rb') if previous else None
+        reused = 0
+        try:
+            writer = ImagePdfWriter(tmp_pdf)
+            try:
+                for spec, page in pipeline.run(pages, skip=reusable):
+                    fingerprint = fingerprints[spec["page_number"]]
+                    if page is None:
+                        info = read_stream(old_pdf, previous[fingerprint])
+                        reused += 1
+                    else:
+                        info = self.encode_page(page)
+                        print(f"  - 重新渲染 {spec['school_name']} 第 {spec['school_page'] + 1}/{spec['school_pages']} 页")
+                    writer.add_page(info, A4)["fingerprint"] = fingerprint
+                writer.close()
+            except BaseException:
+                writer.file.close()
+                raise
+
+            if old_pdf is not None:
+                old_pdf.close()
+                old_pdf = None
+            os.replace(tmp_pdf, output_pdf)
+            save_manifest(output_pdf, writer.page_records)
+            print(f"PDF已成功生成: {output_pdf}，共 {len(pages)} 页，"
+                  f"复用 {reused} 页，重新渲染 {len(pages) - reused} 页")
+            return True
+
+        except Exception as e:
+            print(f"生成PDF时出错: {str(e)}")
+            return False
+
+        finally:
+            if old_pdf is not None:
+                old_pdf.close()
+            if os.path.exists(tmp_pdf):
+                os.remove(tmp_pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='增量生成PDF：只重新渲染内容变化的页面')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-o', '--output', help='输出PDF (默认: 配置中的 students_pdf)')
+    parser.add_argument('--full', action='store_true', help='忽略上一次的结果，全部重新渲染')
+    args = parser.parse_args()
+
+    start = time.time()
+    if IncrementalBook(args.config).build(args.output, full=args.full):
+        print(f"完成，用时 {time.time() - start:.1f} 秒")
+    else:
+        print("生成失败")
+
+
+if __name__ == "__main__":
+    main()
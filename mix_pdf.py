@@ -1,19 +1,33 @@
 import os
-import glob
 import json
 from PIL import Image, ImageEnhance
-from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-
-
-def create_pdf_from_pages(pages_folder=None, output_pdf=None, config_file="config.json"):
-    """将pages文件夹中的PNG页面合并为PDF"""
-    # 加载配置文件
-    try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = json.load(f)
-    except:
-        config = {}
+from reportlab.lib.utils import ImageReader
+
+from build_checkpoint import temp_path_for
+from page_formats import list_page_files
+from pdf_passthrough import draw_passthrough_image
+from pdf_writer import write_image_pdf
+
+
+def create_pdf_from_pages(pages_folder=None, output_pdf=None, config_file="config.json", context=None,
+                          progress_callback=None):
+    """将pages文件夹中的页面（PNG或WebP，见 page_formats）合并为PDF
+
+    progress_callback(序号, 总页数, 页面路径) 在每页写入后调用，抛出异常可中止合并。
+    默认使用逐页写盘的流式写入器（pdf_backend="stream"），内存占用与页数无关；
+    pdf_backend="reportlab" 时整本书在内存中生成后一次保存。
+    配置中 pdf_workers 大于1时，页面图像在多个进程中并行压缩，再按页序写入PDF。
+    """
+    # 加载配置文件（传入构建环境时使用其独立的配置）
+    if context is not None:
+        config = context.config
+    else:
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        except:
+            config = {}
 
     # 从配置中获取参数
     if pages_folder is None:
@@ -23,47 +37,54 @@ def create_pdf_from_pages(pages_folder=None, output_pdf=None, config_file="confi
 
     add_contrast = config.get("add_contrast", False)
     contrast_factor = config.get("contrast_factor", 1.2)
+    pdf_backend = config.get("pdf_backend", "stream")
+    pdf_workers = int(config.get("pdf_workers", 1))
 
-    # 获取所有PNG文件并按数字顺序排序
-    png_files = sorted(glob.glob(os.path.join(pages_folder, "*.png")))
+    # 获取所有页面文件并按数字顺序排序
+    png_files = list_page_files(pages_folder)
 
     if not png_files:
-        print("在pages文件夹中未找到PNG文件")
+        print("在pages文件夹中未找到页面文件")
         return False
 
+    if pdf_backend == "stream" or pdf_workers > 1:
+        return create_pdf_streaming(png_files, output_pdf, pdf_workers,
+                                    contrast_factor if add_contrast else None, progress_callback)
+
+    # 先写入临时文件，完成后再重命名，避免其他进程读到不完整的PDF
+    tmp_pdf = temp_path_for(output_pdf)
+
     try:
-        # 创建PDF
-        c = canvas.Canvas(output_pdf, pagesize=A4)
+        # 创建PDF（reportlab 的画布模块较重，只有这个后端用到，使用时才导入）
+        from reportlab.pdfgen import canvas
+        c = canvas.Canvas(tmp_pdf, pagesize=A4)
 
         for i, png_path in enumerate(png_files):
             print(f"添加页面 {i + 1}/{len(png_files)}: {os.path.basename(png_path)}")
 
             # 如果需要增强对比度
             if add_contrast:
-                # 打开图像并增强对比度
-                img = Image.open(png_path)
-                enhancer = ImageEnhance.Contrast(img)
-                img_enhanced = enhancer.enhance(contrast_factor)
-
-                # 保存增强后的临时图像
-                temp_path = f"{png_path}_temp.png"
-                img_enhanced.save(temp_path, 'PNG')
-
-                # 使用增强后的图像
-                c.drawImage(temp_path, 0, 0, width=A4[0], height=A4[1])
+                # 打开图像并增强对比度，直接在内存中交给PDF，不再写临时文件
+                with Image.open(png_path) as img:
+                    enhancer = ImageEnhance.Contrast(img)
+                    img_enhanced = enhancer.enhance(contrast_factor)
 
-                # 删除临时文件
-                os.remove(temp_path)
+                c.drawImage(ImageReader(img_enhanced), 0, 0, width=A4[0], height=A4[1])
             else:
-                # 直接使用原始图像
-                c.drawImage(png_path, 0, 0, width=A4[0], height=A4[1])
+                # 直接嵌入原始PNG数据，无法直接嵌入时再交给reportlab解码
+                if not draw_passthrough_image(c, png_path, 0, 0, A4[0], A4[1]):
+                    c.drawImage(png_path, 0, 0, width=A4[0], height=A4[1])
 
             # 如果不是最后一页，添加新页面
             if i < len(png_files) - 1:
                 c.showPage()
 
+            if progress_callback:
+                progress_callback(i + 1, len(png_files), png_path)
+
         # 保存PDF
         c.save()
+        os.replace(tmp_pdf, output_pdf)
         print(f"PDF已成功生成: {output_pdf}")
         if add_contrast:
             print(f"已应用对比度增强，增强因子: {contrast_factor}")
@@ -73,6 +94,35 @@ def create_pdf_from_pages(pages_folder=None, output_pdf=None, config_file="confi
         print(f"生成PDF时出错: {str(e)}")
         return False
 
+    finally:
+        if os.path.exists(tmp_pdf):
+            os.remove(tmp_pdf)
+
+
+def create_pdf_streaming(png_files, output_pdf, workers=1, contrast_factor=None, progress_callback=None):
+    """用流式写入器逐页写出PDF；workers 大于1时页面图像在进程池中并行压缩"""
+    def report(index, total, png_path):
+        print(f"添加页面 {index}/{total}: {os.path.basename(png_path)}")
+        if progress_callback:
+            progress_callback(index, total, png_path)
+
+    try:
+        if not write_image_pdf(output_pdf, png_files, A4, workers=workers, contrast_factor=contrast_factor,
+                               progress_callback=report):
+            print("没有可以写入的页面，未生成PDF")
+            return False
+    except Exception as e:
+        print(f"生成PDF时出错: {str(e)}")
+        return False
+
+    if workers > 1:
+        print(f"PDF已成功生成: {output_pdf}（{workers} 个进程并行编码）")
+    else:
+        print(f"PDF已成功生成: {output_pdf}")
+    if contrast_factor is not None:
+        print(f"已应用对比度增强，增强因子: {contrast_factor}")
+    return True
+
 
 def main():
     success = create_pdf_from_pages(config_file="config.json")
@@ -84,4 +134,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
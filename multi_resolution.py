@@ -0,0 +1,159 @@
+import argparse
+import os
+import time
+import zlib
+
+from PIL import ImageEnhance
+from reportlab.lib.pagesizes import A4
+
+from build_checkpoint import temp_path_for
+from image_ops import resize_image
+from page_pipeline import PagePipeline, canvas_pool_size
+from pdf_passthrough import PassthroughInfo
+from pdf_writer import DEFAULT_COMPRESS_LEVEL, ImagePdfWriter
+from school_cards_to_png import SchoolCardsToPNG
+
+
+def page_size_for(dpi):
+    """与 SchoolCardsToPNG 相同的A4像素尺寸"""
+    return int(8.27 * dpi), int(11.69 * dpi)
+
+
+def output_targets(config, context=None):
+    """所有输出：[(dpi, PDF路径), ...]，按dpi从高到低排列，第一项是按配置 dpi 合成的主输出
+
+    额外的输出由配置项 output_resolutions 给出，每项可以是 {"dpi": 150, "pdf": "screen.pdf"}，
+    也可以只写dpi，此时PDF命名为 <students_pdf>_<dpi>dpi.pdf。额外输出只能比主输出的dpi低，
+    更高的会被忽略（不会放大页面）。
+    """
+    dpi = config.get("dpi", 300)
+    main_pdf = config.get("students_pdf", "students.pdf")
+    targets = [(dpi, main_pdf)]
+
+    for entry in config.get("output_resolutions") or []:
+        if isinstance(entry, dict):
+            target_dpi, pdf_path = entry["dpi"], entry.get("pdf")
+        else:
+            target_dpi, pdf_path = entry, None
+        if target_dpi >= dpi:
+            print(f"忽略输出分辨率 {target_dpi} dpi：只能低于合成分辨率 {dpi} dpi")
+            continue
+        if not pdf_path:
+            stem, extension = os.path.splitext(main_pdf)
+            pdf_path = f"{stem}_{target_dpi}dpi{extension or '.pdf'}"
+        elif context is not None:
+            pdf_path = context.resolve(pdf_path)
+        targets.append((target_dpi, pdf_path))
+
+    return sorted(targets, key=lambda target: target[0], reverse=True)
+
+
+def pyramid(page, sizes, quality):
+    """按从大到小的尺寸依次缩小：每一级从上一级缩小，而不是每次都从整页开始"""
+    levels = []
+    current = page
+    for size in sizes:
+        current = resize_image(current, size, quality)
+        levels.append(current)
+    return levels
+
+
+def flate_info(img, compress_level):
+    data = zlib.compress(img.tobytes(), compress_level)
+    return PassthroughInfo(img.width, img.height, 8, 'DeviceRGB', ['FlateDecode'], data)
+
+
+def build_multi_resolution(config_file="config.json", context=None, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """一次合成，同时输出多个分辨率的PDF
+
+    每页只按配置的 dpi 合成一次（卡片只解码一次），对比度增强也只在最高分辨率上做一次，
+    然后逐级缩小得到各个较低的分辨率，每个分辨率写入自己的PDF。较低分辨率的输出
+    只多出缩小和压缩的开销。缩小后的页面与主输出的排版完全相同（边距、字号按比例缩小），
+    这与直接用较低的 dpi 单独构建不同，后者的边距和字号按像素固定。
+    不保存中间页面文件。
+    """
+    builder = SchoolCardsToPNG(config_file, context)
+    config = builder.config
+    contrast_factor = config.get("contrast_factor", 1.2) if config.get("add_contrast", False) else None
+    targets = output_targets(config, context)
+
+    pages = builder.plan_pages()
+    if not pages:
+        print("没有可生成的页面")
+        return False
+
+    size = (builder.width, builder.height)
+    extra_sizes = [page_size_for(dpi) for dpi, _ in targets[1:]]
+    pool = canvas_pool_size(size[0], size[1], config.get("page_memory_budget_mb"))
+    pipeline = PagePipeline(builder.render_page, size, pool)
+
+    tmp_paths = [temp_path_for(pdf_path) for _, pdf_path in targets]
+    writers = []
+    try:
+        try:
+            for tmp_path in tmp_paths:
+                writers.append(ImagePdfWriter(tmp_path))
+
+            for spec, canvas in pipeline.run(pages):
+                page = canvas
+                if contrast_factor is not None:
+                    page = ImageEnhance.Contrast(canvas).enhance(contrast_factor)
+                levels = [page] + pyramid(page, extra_sizes, builder.resample_quality)
+
+                for writer, level in zip(writers, levels):
+                    writer.add_page(flate_info(level, compress_level), A4)
+                for level in levels:
+                    if level is not canvas:
+                        level.close()
+                print(f"  - {spec['school_name']} 第 {spec['school_page'] + 1}/{spec['school_pages']} 页已写入 "
+                      f"{len(targets)} 个PDF")
+
+            for writer in writers:
+                writer.close()
+        except BaseException:
+            for writer in writers:
+                writer.file.close()
+            raise
+
+        for tmp_path, (dpi, pdf_path) in zip(tmp_paths, targets):
+            os.replace(tmp_path, pdf_path)
+            print(f"PDF已成功生成: {pdf_path}（{dpi} dpi），共 {len(pages)} 页")
+        return True
+
+    except Exception as e:
+        print(f"生成PDF时出错: {str(e)}")
+        return False
+
+    finally:
+        for tmp_path in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='一次合成页面，同时输出多个分辨率的PDF（如印刷版和屏幕版）')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('--target', action='append', metavar='DPI[:PDF]',
+                        help='额外输出的分辨率和PDF路径，可重复；给出时代替配置中的 output_resolutions')
+    args = parser.parse_args()
+
+    context = None
+    if args.target:
+        from build_context import BuildContext
+
+        targets = []
+        for target in args.target:
+            dpi, _, pdf_path = target.partition(":")
+            targets.append({"dpi": int(dpi), "pdf": pdf_path or None})
+        context = BuildContext(config_file=args.config)
+        context.config["output_resolutions"] = targets
+
+    start = time.time()
+    if build_multi_resolution(args.config, context):
+        print(f"完成，用时 {time.time() - start:.1f} 秒")
+    else:
+        print("生成失败")
+
+
+if __name__ == "__main__":
+    main()
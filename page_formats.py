@@ -0,0 +1,50 @@
+import glob
+import os
+
+from PIL import features
+
+# 中间页面的保存方式：(扩展名, Pillow格式, 保存参数)
+# fast 几乎不压缩，适合马上就要合并的临时页面；compact 体积最小，适合归档
+# WebP无损模式下 quality 表示压缩力度，再提高力度体积几乎不变但明显更慢
+PAGE_FORMATS = {
+    "fast": ("png", "PNG", {"compress_level": 1}),
+    "balanced": ("png", "PNG", {"compress_level": 6}),
+    "compact": ("webp", "WEBP", {"lossless": True, "method": 3, "quality": 10}),
+}
+
+DEFAULT_PAGE_FORMAT = "balanced"
+
+# 合并PDF时识别的页面文件扩展名
+PAGE_EXTENSIONS = ("png", "webp")
+
+
+def page_format(name=None):
+    """返回页面格式档位对应的 (扩展名, Pillow格式, 保存参数)
+
+    Pillow 没有编译WebP支持时，compact 改用开启 optimize 的PNG。
+    """
+    name = name or DEFAULT_PAGE_FORMAT
+    if name not in PAGE_FORMATS:
+        raise ValueError(f"未知的页面格式: {name}")
+
+    extension, image_format, params = PAGE_FORMATS[name]
+    if image_format == "WEBP" and not features.check("webp"):
+        return "png", "PNG", {"optimize": True}
+    return extension, image_format, dict(params)
+
+
+def list_page_files(pages_folder):
+    """页面文件夹中所有格式的页面，按文件名排序"""
+    page_files = []
+    for extension in PAGE_EXTENSIONS:
+        page_files.extend(glob.glob(os.path.join(pages_folder, f"*.{extension}")))
+    return sorted(page_files)
+
+
+def remove_other_formats(page_path):
+    """删除同一页以其他格式保存的旧文件，避免切换格式后同一页在文件夹中出现两次"""
+    base, extension = os.path.splitext(page_path)
+    for other in PAGE_EXTENSIONS:
+        other_path = f"{base}.{other}"
+        if other != extension.lstrip(".") and os.path.exists(other_path):
+            os.remove(other_path)
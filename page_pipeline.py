@@ -0,0 +1,97 @@
+import queue
+import threading
+
+from PIL import Image
+
+# 默认页面内存预算（MB），300dpi 的A4页面约 26MB
+DEFAULT_MEMORY_BUDGET_MB = 64
+
+# 画布池的上限，更多画布不会带来更快的速度
+MAX_POOL_SIZE = 4
+
+_END = object()
+
+
+def canvas_pool_size(width, height, memory_budget_mb=None):
+    """根据内存预算计算可以同时存在的页面画布数量（至少1个）"""
+    if memory_budget_mb is None:
+        memory_budget_mb = DEFAULT_MEMORY_BUDGET_MB
+    page_bytes = width * height * 3
+    return max(1, min(MAX_POOL_SIZE, int(memory_budget_mb * 1024 * 1024) // page_bytes))
+
+
+class PagePipeline:
+    """有内存上限的页面流水线
+
+    合成线程从画布池中取空闲画布渲染页面，调用方（编码端）按页序取出已渲染的画布
+    保存后再归还。画布池的大小就是内存上限：编码跟不上时合成线程会在取画布时阻塞，
+    因此无论书有多少页，同时存在的页面缓冲区数量都是固定的。
+    """
+
+    def __init__(self, render, size, pool_size=1):
+        self.render = render
+        self.size = size
+        self.pool_size = pool_size
+        self.free = queue.Queue()
+        for _ in range(pool_size):
+            self.free.put(Image.new('RGB', size, 'white'))
+        self.ready = queue.Queue()
+        self.stop = threading.Event()
+
+    def _acquire(self):
+        """取一块空闲画布，编码端处理慢时在这里等待（背压）"""
+        while not self.stop.is_set():
+            try:
+                return self.free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
+
+    def _composite(self, specs, skip):
+        try:
+            for spec in specs:
+                if skip is not None and skip(spec):
+                    self.ready.put((spec, None))
+                    continue
+
+                canvas = self._acquire()
+                if canvas is None:
+                    return
+                self.render(spec, canvas)
+                self.ready.put((spec, canvas))
+        except BaseException as e:
+            self.ready.put(e)
+            return
+        self.ready.put(_END)
+
+    def run(self, specs, skip=None):
+        """按顺序产出 (页面描述, 画布)；跳过的页面画布为None
+
+        画布在调用方取下一项时归还到池中，调用方不能在此之后继续持有它。
+        """
+        thread = threading.Thread(target=self._composite, args=(specs, skip), daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = self.ready.get()
+                if item is _END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+
+                spec, canvas = item
+                yield spec, canvas
+                if canvas is not None:
+                    self.free.put(canvas)
+        finally:
+            self.stop.set()
+            thread.join()
+            self.close()
+
+    def close(self):
+        """释放池中的画布"""
+        while True:
+            try:
+                self.free.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,197 @@
+import hashlib
+import struct
+
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.pdfutils import readJPEGInfo
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG颜色类型 -> (PDF色彩空间, 每像素通道数)；带alpha的类型不能直接嵌入
+PNG_COLOR_TYPES = {
+    0: ('DeviceGray', 1),
+    2: ('DeviceRGB', 3),
+    3: ('Indexed', 1),
+}
+
+
+class PassthroughInfo:
+    """已压缩好、可以直接写入PDF的图像流
+
+    color_space 为色彩空间名，或 ('Indexed', 调色板字节)；decode_parms 为普通字典。
+    只包含基本类型，可以在进程之间传递。
+    """
+
+    def __init__(self, width, height, bits_per_component, color_space, filters, data,
+                 decode_parms=None, decode=None):
+        self.width = width
+        self.height = height
+        self.bits_per_component = bits_per_component
+        self.color_space = color_space
+        self.filters = filters
+        self.data = data
+        self.decode_parms = decode_parms
+        self.decode = decode
+
+
+def probe_jpeg(path):
+    """读取JPEG文件头，返回可直接作为DCTDecode流嵌入的信息"""
+    with open(path, 'rb') as f:
+        try:
+            width, height, components = readJPEGInfo(f)[:3]
+        except Exception:
+            return None
+        f.seek(0)
+        data = f.read()
+
+    if components == 1:
+        color_space, decode = 'DeviceGray', None
+    elif components == 3:
+        color_space, decode = 'DeviceRGB', None
+    elif components == 4:
+        # Adobe 写出的CMYK JPEG是反相的
+        color_space, decode = 'DeviceCMYK', [1, 0, 1, 0, 1, 0, 1, 0]
+    else:
+        return None
+
+    return PassthroughInfo(width, height, 8, color_space, ['DCTDecode'], data, decode=decode)
+
+
+def probe_png(path):
+    """解析PNG分块，非隔行、无透明度的PNG直接把IDAT作为带预测器的FlateDecode流嵌入"""
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+
+        header = None
+        palette = None
+        idat = []
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return None
+            length, chunk_type = struct.unpack('>I4s', chunk_header)
+            data = f.read(length)
+            f.read(4)  # CRC
+
+            if chunk_type == b'IHDR':
+                header = struct.unpack('>IIBBBBB', data)
+            elif chunk_type == b'PLTE':
+                palette = data
+            elif chunk_type == b'tRNS':
+                return None
+            elif chunk_type == b'IDAT':
+                idat.append(data)
+            elif chunk_type == b'IEND':
+                break
+
+    if header is None or not idat:
+        return None
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if interlace or color_type not in PNG_COLOR_TYPES:
+        return None
+    if bit_depth > 8 or (color_type != 3 and bit_depth != 8):
+        return None
+
+    color_space, colors = PNG_COLOR_TYPES[color_type]
+    if color_type == 3:
+        if palette is None:
+            return None
+        color_space = ('Indexed', palette)
+
+    decode_parms = {
+        "Predictor": 15,
+        "Colors": colors,
+        "BitsPerComponent": bit_depth,
+        "Columns": width,
+    }
+    return PassthroughInfo(width, height, bit_depth, color_space, ['FlateDecode'], b''.join(idat),
+                           decode_parms=decode_parms)
+
+
+def probe_passthrough(path):
+    """判断文件能否直接嵌入PDF，可以时返回 PassthroughInfo，否则返回None"""
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(8)
+        if magic.startswith(b'\xff\xd8'):
+            return probe_jpeg(path)
+        if magic == PNG_SIGNATURE:
+            return probe_png(path)
+    except OSError:
+        pass
+    return None
+
+
+def indexed_palette_string(palette):
+    """调色板的PDF十六进制字符串"""
+    return b'<' + palette.hex().encode('ascii') + b'>'
+
+
+class PassthroughImageXObject(pdfdoc.PDFImageXObject):
+    """直接使用已压缩数据的图像XObject，不解码也不重新编码"""
+
+    def __init__(self, name, info):
+        pdfdoc.PDFImageXObject.__init__(self, name)
+        self.width = info.width
+        self.height = info.height
+        self.bitsPerComponent = info.bits_per_component
+        self.colorSpace = info.color_space
+        self._filters = info.filters
+        self.streamContent = info.data
+        self.decodeParms = info.decode_parms
+        self._decode = info.decode
+        self.mask = None
+
+    def format(self, document):
+        S = pdfdoc.PDFStream(content=self.streamContent)
+        d = S.dictionary
+        d["Type"] = pdfdoc.PDFName("XObject")
+        d["Subtype"] = pdfdoc.PDFName("Image")
+        d["Width"] = self.width
+        d["Height"] = self.height
+        d["BitsPerComponent"] = self.bitsPerComponent
+        if isinstance(self.colorSpace, str):
+            d["ColorSpace"] = pdfdoc.PDFName(self.colorSpace)
+        else:
+            palette = self.colorSpace[1]
+            d["ColorSpace"] = pdfdoc.PDFArray([pdfdoc.PDFName('Indexed'), pdfdoc.PDFName('DeviceRGB'),
+                                               len(palette) // 3 - 1, indexed_palette_string(palette)])
+        if self._decode:
+            d["Decode"] = pdfdoc.PDFArray(self._decode)
+        d["Filter"] = pdfdoc.PDFArray([pdfdoc.PDFName(f) for f in self._filters])
+        if self.decodeParms is not None:
+            # Filter 是数组时 DecodeParms 也必须是一一对应的数组
+            d["DecodeParms"] = pdfdoc.PDFArray([pdfdoc.PDFDictionary(dict(self.decodeParms))])
+        d["Length"] = len(self.streamContent)
+        return S.format(document)
+
+
+def draw_passthrough_image(c, path, x, y, width, height, info=None):
+    """在reportlab画布上直接嵌入图像文件，文件不适合直接嵌入时返回False
+
+    与 canvas.drawImage 的注册流程相同，只是图像对象换成了 PassthroughImageXObject。
+    """
+    if info is None:
+        info = probe_passthrough(path)
+    if info is None:
+        return False
+
+    # 按内容摘要命名，相同的图像在文档中只存一份
+    name = hashlib.md5(info.data).hexdigest()
+    reg_name = c._doc.getXObjectName(name)
+    if not c._doc.idToObject.get(reg_name):
+        img_obj = PassthroughImageXObject(name, info)
+        img_obj.name = name
+        c._setXObjects(img_obj)
+        c._doc.Reference(img_obj, reg_name)
+        c._doc.addForm(name, img_obj)
+
+    c._currentPageHasImages = 1
+    c.saveState()
+    c.translate(x, y)
+    c.scale(width, height)
+    c._code.append("/%s Do" % reg_name)
+    c.restoreState()
+    c._formsinuse.append(name)
+    return True
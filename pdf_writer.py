@@ -0,0 +1,329 @@
+import json
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageEnhance
+
+from build_checkpoint import atomic_write_bytes, temp_path_for
+from image_ops import flatten_to_rgb, has_transparency
+from pdf_passthrough import PassthroughInfo, indexed_palette_string, probe_passthrough
+
+# 解码后像素的zlib压缩级别
+DEFAULT_COMPRESS_LEVEL = 6
+
+# 对象1固定为Catalog，对象2固定为页面树，页面对象从3开始编号
+CATALOG_ID = 1
+PAGES_ID = 2
+
+# PDF旁记录每页图像流位置的清单文件后缀
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def pdf_number(value):
+    """PDF中的数字：整数不带小数点，小数最多保留4位"""
+    if float(value).is_integer():
+        return b'%d' % int(value)
+    return (b'%.4f' % value).rstrip(b'0')
+
+
+def pdf_text(text):
+    """PDF文本字符串：UTF-16BE加BOM的十六进制形式，可以包含中文"""
+    return b'<' + ('\ufeff' + text).encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+
+def image_dictionary(info):
+    """图像XObject的字典内容（不含两侧的 << >>）"""
+    if isinstance(info.color_space, str):
+        color_space = b'/' + info.color_space.encode('ascii')
+    else:
+        palette = info.color_space[1]
+        color_space = b'[/Indexed /DeviceRGB %d %s]' % (len(palette) // 3 - 1, indexed_palette_string(palette))
+
+    parts = [
+        b'/Type /XObject /Subtype /Image',
+        b'/Width %d /Height %d' % (info.width, info.height),
+        b'/BitsPerComponent %d' % info.bits_per_component,
+        b'/ColorSpace ' + color_space,
+        b'/Filter [' + b' '.join(b'/' + f.encode('ascii') for f in info.filters) + b']',
+    ]
+    if info.decode:
+        parts.append(b'/Decode [' + b' '.join(pdf_number(v) for v in info.decode) + b']')
+    if info.decode_parms:
+        # Filter 是数组时 DecodeParms 也必须是一一对应的数组
+        parms = b' '.join(b'/%s %d' % (k.encode('ascii'), v) for k, v in info.decode_parms.items())
+        parts.append(b'/DecodeParms [<< ' + parms + b' >>]')
+    parts.append(b'/Length %d' % len(info.data))
+    return b' '.join(parts)
+
+
+class ImagePdfWriter:
+    """只包含整页图像的PDF写入器
+
+    每个对象一生成就按顺序写入文件，每页写完立即刷到磁盘，内存中只保留各对象的字节偏移
+    （xref），页面树、Catalog 和 xref 表在 close() 时写在文件末尾，峰值内存与页数无关。
+    图像数据必须是已经压缩好的 PassthroughInfo，写入器本身不做任何编码，
+    因此可以由其他进程并行准备。
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.offsets = {}
+        self.next_id = PAGES_ID + 1
+        self.page_ids = []
+        self.page_records = []
+        self.outlines = []
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        """写入一个对象，有流时返回流数据在文件中的偏移"""
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b'%d 0 obj\n<< ' % obj_id + body + b' >>\n')
+        stream_offset = None
+        if stream is not None:
+            self.file.write(b'stream\n')
+            stream_offset = self.file.tell()
+            self.file.write(stream)
+            self.file.write(b'\nendstream\n')
+        self.file.write(b'endobj\n')
+        return stream_offset
+
+    def add_page(self, info, page_size, placement=None):
+        """写入一页：图像放在 placement=(x, y, 宽, 高) 处，默认铺满整页
+
+        返回这一页图像流的记录（见 stream_record），调用方可以在其中补充自己的字段，
+        close 之后用 save_manifest 保存，下次构建时从这个PDF中原样复制图像流。
+        """
+        page_width, page_height = page_size
+        x, y, width, height = placement or (0, 0, page_width, page_height)
+
+        image_id = self._allocate()
+        content_id = self._allocate()
+        page_id = self._allocate()
+
+        stream_offset = self._write_object(image_id, image_dictionary(info), info.data)
+
+        content = b'q %s 0 0 %s %s %s cm /Im0 Do Q' % (
+            pdf_number(width), pdf_number(height), pdf_number(x), pdf_number(y))
+        self._write_object(content_id, b'/Length %d' % len(content), content)
+
+        self._write_object(page_id, b'/Type /Page /Parent %d 0 R /MediaBox [0 0 %s %s] '
+                                    b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R'
+                           % (PAGES_ID, pdf_number(page_width), pdf_number(page_height), image_id, content_id))
+        self.page_ids.append(page_id)
+        self.file.flush()
+
+        record = stream_record(info, stream_offset)
+        self.page_records.append(record)
+        return record
+
+    def add_outline(self, title, page_index=None):
+        """添加一个顶层书签，指向第 page_index 页（从0开始，默认为下一页）"""
+        if page_index is None:
+            page_index = len(self.page_ids)
+        self.outlines.append((title, page_index))
+
+    def _write_outlines(self):
+        """写入书签树，返回书签根对象号"""
+        root_id = self._allocate()
+        item_ids = [self._allocate() for _ in self.outlines]
+        for i, (title, page_index) in enumerate(self.outlines):
+            body = b'/Title %s /Parent %d 0 R /Dest [%d 0 R /Fit]' % (
+                pdf_text(title), root_id, self.page_ids[page_index])
+            if i > 0:
+                body += b' /Prev %d 0 R' % item_ids[i - 1]
+            if i < len(item_ids) - 1:
+                body += b' /Next %d 0 R' % item_ids[i + 1]
+            self._write_object(item_ids[i], body)
+        self._write_object(root_id, b'/Type /Outlines /First %d 0 R /Last %d 0 R /Count %d'
+                           % (item_ids[0], item_ids[-1], len(item_ids)))
+        return root_id
+
+    def close(self):
+        """写入页面树、书签、Catalog、xref表和trailer并关闭文件"""
+        kids = b' '.join(b'%d 0 R' % page_id for page_id in self.page_ids)
+        self._write_object(PAGES_ID, b'/Type /Pages /Kids [%s] /Count %d' % (kids, len(self.page_ids)))
+
+        catalog = b'/Type /Catalog /Pages %d 0 R' % PAGES_ID
+        if self.outlines:
+            catalog += b' /Outlines %d 0 R /PageMode /UseOutlines' % self._write_outlines()
+        self._write_object(CATALOG_ID, catalog)
+
+        xref_offset = self.file.tell()
+        size = self.next_id
+        self.file.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for obj_id in range(1, size):
+            self.file.write(b'%010d 00000 n \n' % self.offsets[obj_id])
+        self.file.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                        % (size, CATALOG_ID, xref_offset))
+        self.file.close()
+
+
+def stream_record(info, offset):
+    """图像流的可JSON序列化描述：位置、长度和重建图像字典所需的字段"""
+    color_space = info.color_space
+    if not isinstance(color_space, str):
+        color_space = [color_space[0], color_space[1].hex()]
+    return {
+        "offset": offset,
+        "length": len(info.data),
+        "width": info.width,
+        "height": info.height,
+        "bits_per_component": info.bits_per_component,
+        "color_space": color_space,
+        "filters": list(info.filters),
+        "decode_parms": info.decode_parms,
+        "decode": info.decode,
+    }
+
+
+def read_stream(pdf_file, record):
+    """从已打开的PDF中读出记录对应的图像流，返回可以直接写入新PDF的 PassthroughInfo"""
+    pdf_file.seek(record["offset"])
+    data = pdf_file.read(record["length"])
+    if len(data) != record["length"]:
+        raise ValueError("PDF中的图像流不完整")
+
+    color_space = record["color_space"]
+    if not isinstance(color_space, str):
+        color_space = (color_space[0], bytes.fromhex(color_space[1]))
+    return PassthroughInfo(record["width"], record["height"], record["bits_per_component"], color_space,
+                           record["filters"], data, record["decode_parms"], record["decode"])
+
+
+def manifest_path(pdf_path):
+    return pdf_path + MANIFEST_SUFFIX
+
+
+def save_manifest(pdf_path, records):
+    """在PDF旁保存图像流清单，同时记录PDF的大小和修改时间"""
+    stat = os.stat(pdf_path)
+    manifest = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "pages": records}
+    atomic_write_bytes(manifest_path(pdf_path), json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+
+
+def load_manifest(pdf_path):
+    """读取PDF的图像流清单；清单不存在或PDF已被其他程序改写时返回None"""
+    try:
+        with open(manifest_path(pdf_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        stat = os.stat(pdf_path)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("size") != stat.st_size or manifest.get("mtime_ns") != stat.st_mtime_ns:
+        return None
+    return manifest.get("pages")
+
+
+def encode_image_file(path, contrast_factor=None, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """把图像文件准备成可以直接写入PDF的压缩流
+
+    不需要增强对比度时优先直接使用文件中的压缩数据；否则解码、处理后用zlib压缩像素。
+    在进程池中调用，只返回可序列化的 PassthroughInfo。
+    """
+    if contrast_factor is None:
+        info = probe_passthrough(path)
+        if info is not None:
+            return info
+
+    with Image.open(path) as img:
+        if img.mode == 'L' and not has_transparency(img):
+            pixels = img.copy()
+        else:
+            pixels = flatten_to_rgb(img)
+            if pixels is img:
+                pixels = img.copy()
+
+    if contrast_factor is not None:
+        pixels = ImageEnhance.Contrast(pixels).enhance(contrast_factor)
+
+    color_space = 'DeviceGray' if pixels.mode == 'L' else 'DeviceRGB'
+    data = zlib.compress(pixels.tobytes(), compress_level)
+    info = PassthroughInfo(pixels.width, pixels.height, 8, color_space, ['FlateDecode'], data)
+    pixels.close()
+    return info
+
+
+def _encode_or_error(path, contrast_factor, compress_level):
+    try:
+        return encode_image_file(path, contrast_factor, compress_level)
+    except Exception as e:
+        return e
+
+
+def iter_encoded(paths, workers=1, contrast_factor=None, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """按原顺序产出每个文件的压缩流，编码失败的文件产出对应的异常对象
+
+    workers 大于1时在进程池中并行编码，同时在途的任务数限制为 workers 的两倍，
+    写入端慢时不会把所有页面的压缩结果都堆在内存里。
+    """
+    if workers <= 1:
+        for path in paths:
+            yield _encode_or_error(path, contrast_factor, compress_level)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        path_iter = iter(paths)
+
+        def submit_next():
+            for path in path_iter:
+                pending.append(pool.submit(_encode_or_error, path, contrast_factor, compress_level))
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+
+        try:
+            while pending:
+                info = pending.popleft().result()
+                submit_next()
+                yield info
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def write_image_pdf(output_pdf, paths, page_size, placement=None, workers=1, contrast_factor=None,
+                    compress_level=DEFAULT_COMPRESS_LEVEL, progress_callback=None, on_error=None):
+    """把图像文件按顺序写成PDF，每个文件一页，返回写入的页数
+
+    placement(info) 返回图像在页面上的 (x, y, 宽, 高)，默认铺满整页。
+    编码在 workers 个进程中并行进行，写入始终按页序在当前进程完成，
+    因此输出与串行编码逐字节相同。
+    某个文件编码失败时，给出 on_error(路径, 异常) 则跳过该页继续，否则抛出异常。
+    一页都没有写入时不生成（也不覆盖）输出文件，返回0。
+    """
+    tmp_pdf = temp_path_for(output_pdf)
+    try:
+        writer = ImagePdfWriter(tmp_pdf)
+        try:
+            for i, info in enumerate(iter_encoded(paths, workers, contrast_factor, compress_level)):
+                if isinstance(info, Exception):
+                    if on_error is None:
+                        raise info
+                    on_error(paths[i], info)
+                    continue
+                writer.add_page(info, page_size, placement(info) if placement else None)
+                if progress_callback:
+                    progress_callback(i + 1, len(paths), paths[i])
+            page_count = len(writer.page_ids)
+            if page_count == 0:
+                writer.file.close()
+                return 0
+            writer.close()
+        except BaseException:
+            writer.file.close()
+            raise
+        os.replace(tmp_pdf, output_pdf)
+        return page_count
+    finally:
+        if os.path.exists(tmp_pdf):
+            os.remove(tmp_pdf)
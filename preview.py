@@ -0,0 +1,175 @@
+import argparse
+import math
+import os
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from build_checkpoint import atomic_save_image, temp_path_for
+from image_ops import resize_image
+from school_cards_to_png import SchoolCardsToPNG
+from shared_cache import get_font
+
+# 预览默认分辨率
+DEFAULT_PREVIEW_DPI = 40
+
+# 联系表每行的页数
+SHEET_COLUMNS = 6
+
+
+def load_reduced(path, size):
+    """以尽量小的代价把图像解码到目标尺寸：JPEG用draft按比例解码，其他格式先整数reduce再双线性缩放"""
+    with Image.open(path) as img:
+        return resize_image(img, size, "fast")
+
+
+class BookPreview:
+    """低分辨率预览整本书：排版与正式渲染完全相同（同样的分页和页码），只是按比例缩小"""
+
+    def __init__(self, config_file="config.json", context=None, preview_dpi=DEFAULT_PREVIEW_DPI):
+        self.builder = SchoolCardsToPNG(config_file, context)
+        self.scale = preview_dpi / self.builder.dpi
+        self.preview_dpi = preview_dpi
+        self.width = max(1, round(self.builder.width * self.scale))
+        self.height = max(1, round(self.builder.height * self.scale))
+
+    def scaled(self, value):
+        return max(1, round(value * self.scale))
+
+    def render_page(self, spec):
+        """按正式排版的坐标缩小后渲染一页"""
+        builder = self.builder
+        page = Image.new('RGB', (self.width, self.height), 'white')
+        draw = ImageDraw.Draw(page)
+
+        if spec["school_page"] == 0:
+            icon_path = spec["icon_path"]
+            if os.path.exists(icon_path):
+                icon = load_reduced(icon_path, (self.scaled(240), self.scaled(180)))
+                page.paste(icon, (self.scaled(builder.margin), self.scaled(builder.margin)))
+                icon.close()
+
+            font_path = builder.config.get("font_path")
+            try:
+                font = get_font(font_path, self.scaled(60)) if font_path else ImageFont.load_default()
+            except Exception:
+                font = ImageFont.load_default()
+            draw.text((self.scaled(builder.margin + 250), self.scaled(builder.margin + 60)), spec["school_name"],
+                      font=font, fill=(0, 0, 0))
+
+        card_size = (self.scaled(spec["card_size"][0]), self.scaled(spec["card_size"][1]))
+        for card_path, x, y in builder.card_positions(spec):
+            card_img = load_reduced(card_path, card_size)
+            page.paste(card_img, (self.scaled(x), self.scaled(y)))
+            card_img.close()
+
+        return page
+
+    def iter_pages(self, pages=None):
+        """逐页产出 (页面描述, 预览图像)；pages 为已规划的页面，默认重新规划"""
+        if pages is None:
+            pages = self.builder.plan_pages() or []
+        for spec in pages:
+            yield spec, self.render_page(spec)
+
+    def build_pdf(self, output_pdf):
+        """生成低分辨率预览PDF"""
+        tmp_pdf = temp_path_for(output_pdf)
+        try:
+            c = canvas.Canvas(tmp_pdf, pagesize=A4)
+            count = 0
+            for spec, page in self.iter_pages():
+                c.drawImage(ImageReader(page), 0, 0, width=A4[0], height=A4[1])
+                c.showPage()
+                count += 1
+            if count == 0:
+                print("没有可预览的页面")
+                return False
+            c.save()
+            os.replace(tmp_pdf, output_pdf)
+            print(f"预览PDF已生成: {output_pdf}，共 {count} 页")
+            return True
+        except Exception as e:
+            print(f"生成预览PDF时出错: {str(e)}")
+            return False
+        finally:
+            if os.path.exists(tmp_pdf):
+                os.remove(tmp_pdf)
+
+    def build_contact_sheet(self, output_path, columns=SHEET_COLUMNS):
+        """把所有页面缩略图排在一张图上，每页下方标注全局页码
+
+        联系表的尺寸由规划的页数决定，每页渲染后立即贴入并释放，不同时保留所有页面。
+        """
+        try:
+            return self._build_contact_sheet(output_path, columns)
+        except Exception as e:
+            print(f"生成预览联系表时出错: {str(e)}")
+            return False
+
+    def _build_contact_sheet(self, output_path, columns):
+        pages = self.builder.plan_pages() or []
+        if not pages:
+            print("没有可预览的页面")
+            return False
+
+        gap = 20
+        label_height = 24
+        rows = math.ceil(len(pages) / columns)
+        sheet_width = columns * (self.width + gap) + gap
+        sheet_height = rows * (self.height + label_height + gap) + gap
+        sheet = Image.new('RGB', (sheet_width, sheet_height), (200, 200, 200))
+        draw = ImageDraw.Draw(sheet)
+
+        for index, (spec, page) in enumerate(self.iter_pages(pages)):
+            row, col = divmod(index, columns)
+            x = gap + col * (self.width + gap)
+            y = gap + row * (self.height + label_height + gap)
+            sheet.paste(page, (x, y))
+            label = f"{spec['page_number']:03d}"
+            if spec["school_page"] == 0:
+                label += f" {spec['school_name']}"
+            try:
+                draw.text((x, y + self.height + 4), label, fill=(0, 0, 0))
+            except UnicodeEncodeError:
+                # 默认位图字体不支持中文时只显示页码
+                draw.text((x, y + self.height + 4), f"{spec['page_number']:03d}", fill=(0, 0, 0))
+            page.close()
+
+        atomic_save_image(sheet, output_path, 'PNG')
+        sheet.close()
+        print(f"预览联系表已生成: {output_path}，共 {len(pages)} 页")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='快速预览整本书的排版')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_PREVIEW_DPI,
+                        help=f'预览分辨率 (默认: {DEFAULT_PREVIEW_DPI})')
+    parser.add_argument('--sheet', action='store_true', help='输出联系表PNG而不是PDF')
+    parser.add_argument('-o', '--output', help='输出文件 (默认: preview.pdf 或 preview_sheet.png)')
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        preview = BookPreview(args.config, preview_dpi=args.dpi)
+        if args.sheet:
+            success = preview.build_contact_sheet(args.output or "preview_sheet.png")
+        else:
+            success = preview.build_pdf(args.output or "preview.pdf")
+    except Exception as e:
+        print(f"预览出错: {str(e)}")
+        success = False
+
+    if success:
+        print(f"预览完成，用时 {time.time() - start:.1f} 秒")
+    else:
+        print("预览失败")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""多机分片渲染：预先规划全书页码，把页面分成作业放入共享目录中的文件队列
+
+共享目录结构：
+    plan.json     全书规划：配置、每个学院的页码范围、每页的内容指纹
+    queue/        待执行的作业描述
+    claimed/      已被某个工作进程领取的作业（文件名后加 @领取者标识）
+    done/         完成记录：每页的文件名和SHA1
+    failed/       失败的作业及错误信息
+    pages/        按全局页码命名的页面文件
+
+领取作业使用 os.rename 原子地从 queue/ 移到 claimed/，多台机器挂载同一个目录即可
+同时工作；gather 检查所有作业的完成记录和页面文件后合并PDF。
+
+用法:
+    python render_jobs.py plan   共享目录 [-c config.json] [--pages-per-job 8]
+    python render_jobs.py work   共享目录 [--worker-id ID] [--stale-after 600]
+    python render_jobs.py gather 共享目录 [-o students.pdf]
+    python render_jobs.py local  共享目录 [-c config.json] [-w 4] [-o students.pdf]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from build_checkpoint import atomic_save_image, atomic_write_bytes
+from build_context import BuildContext, load_config_file
+from mix_pdf import create_pdf_from_pages
+from page_formats import list_page_files, page_format
+from school_cards_to_png import SchoolCardsToPNG
+
+# 每个作业最多包含的页数，大学院会被拆成多个作业
+DEFAULT_PAGES_PER_JOB = 8
+
+# 领取后超过这么多秒没有进展的作业视为工作进程已退出，重新放回队列
+DEFAULT_STALE_AFTER = 600
+
+QUEUE_DIRS = ("queue", "claimed", "done", "failed", "pages")
+
+
+def write_json(path, data):
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_builder(shared_dir, plan):
+    """按规划中的配置创建页面渲染器，输出目录固定为共享目录下的 pages/"""
+    context = BuildContext(config=plan["config"], workspace=shared_dir)
+    context.config["pages_folder"] = os.path.join(shared_dir, "pages")
+    return SchoolCardsToPNG(context=context)
+
+
+def render_environment(builder):
+    """影响渲染结果但不在配置中的本机环境：实际加载的标题字体文件内容
+
+    配置相同而字体文件不同（或某台机器缺少字体而退回默认字体）时，各机器渲染的标题不一致。
+    """
+    font_path = builder.config.get("font_path")
+    return {"font": file_sha1(font_path) if builder.title_font is not None else None}
+
+
+def plan_jobs(shared_dir, config_file="config.json", pages_per_job=DEFAULT_PAGES_PER_JOB):
+    """规划全书并生成作业；页码在这里一次确定，与作业的执行顺序和执行位置无关"""
+    config = load_config_file(config_file)
+    # 卡片路径写入作业描述，必须是各台机器上都有效的绝对路径
+    config["cards_folder"] = os.path.abspath(config.get("cards_folder") or "character_cards")
+
+    for name in QUEUE_DIRS:
+        os.makedirs(os.path.join(shared_dir, name), exist_ok=True)
+    for name in QUEUE_DIRS:
+        for path in glob.glob(os.path.join(shared_dir, name, "*")):
+            os.remove(path)
+
+    builder = load_builder(shared_dir, {"config": config})
+    pages = builder.plan_pages()
+    if not pages:
+        print("没有可生成的页面")
+        return None
+
+    schools = {}
+    for spec in pages:
+        first, last = schools.get(spec["school_name"], (spec["page_number"], spec["page_number"]))
+        schools[spec["school_name"]] = (min(first, spec["page_number"]), max(last, spec["page_number"]))
+
+    jobs = []
+    for school_name in schools:
+        specs = [spec for spec in pages if spec["school_name"] == school_name]
+        for start in range(0, len(specs), pages_per_job):
+            chunk = specs[start:start + pages_per_job]
+            job_id = f"{chunk[0]['page_number']:05d}-{chunk[-1]['page_number']:05d}"
+            jobs.append({
+                "job_id": job_id,
+                "school_name": school_name,
+                "pages": chunk,
+                "fingerprints": [builder.page_content_fingerprint(spec) for spec in chunk],
+            })
+
+    plan = {
+        "config": config,
+        "layout_signature": builder.layout_signature(),
+        "environment": render_environment(builder),
+        "total_pages": len(pages),
+        "schools": [{"school_name": name, "first_page": first, "last_page": last}
+                    for name, (first, last) in schools.items()],
+        "jobs": [job["job_id"] for job in jobs],
+    }
+    write_json(os.path.join(shared_dir, "plan.json"), plan)
+    for job in jobs:
+        write_json(os.path.join(shared_dir, "queue", f"{job['job_id']}.json"), job)
+
+    print(f"共 {len(pages)} 页，{len(schools)} 个学院，拆分为 {len(jobs)} 个作业")
+    return plan
+
+
+def claim_job(shared_dir, worker_id):
+    """从队列中原子地领取一个作业，返回领取后的文件路径；队列为空时返回None"""
+    for path in sorted(glob.glob(os.path.join(shared_dir, "queue", "*.json"))):
+        claimed = os.path.join(shared_dir, "claimed", f"{os.path.basename(path)}@{worker_id}")
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue  # 被其他工作进程抢先领取
+        return claimed
+    return None
+
+
+def requeue_stale(shared_dir, stale_after):
+    """把长时间没有进展的已领取作业放回队列，返回放回的数量"""
+    count = 0
+    now = time.time()
+    for path in glob.glob(os.path.join(shared_dir, "claimed", "*.json@*")):
+        try:
+            if now - os.path.getmtime(path) < stale_after:
+                continue
+            job_file = os.path.basename(path).split("@", 1)[0]
+            os.rename(path, os.path.join(shared_dir, "queue", job_file))
+            count += 1
+        except FileNotFoundError:
+            continue
+    return count
+
+
+def run_job(shared_dir, builder, claimed_path):
+    """渲染一个作业中的所有页面并写入完成记录"""
+    job = read_json(claimed_path)
+    extension, image_format, save_params = page_format(builder.config.get("page_format"))
+    page_files = []
+    for spec, fingerprint in zip(job["pages"], job["fingerprints"]):
+        if builder.page_content_fingerprint(spec) != fingerprint:
+            raise ValueError(f"第 {spec['page_number']} 页的卡片文件在规划之后被修改，请重新规划")
+
+        page_path = os.path.join(shared_dir, "pages", f"{spec['page_number']:03d}.{extension}")
+        page = builder.render_page(spec)
+        atomic_save_image(page, page_path, image_format, dpi=(builder.dpi, builder.dpi), **save_params)
+        page.close()
+        page_files.append({"page_number": spec["page_number"], "file": os.path.basename(page_path),
+                           "sha1": file_sha1(page_path)})
+        # 更新领取文件的修改时间作为心跳
+        os.utime(claimed_path)
+
+    write_json(os.path.join(shared_dir, "done", f"{job['job_id']}.json"),
+               {"job_id": job["job_id"], "pages": page_files, "worker": os.path.basename(claimed_path)})
+    os.remove(claimed_path)
+    return job
+
+
+def work(shared_dir, worker_id=None, stale_after=DEFAULT_STALE_AFTER):
+    """工作进程：不断领取并执行作业，直到队列为空；返回完成的作业数"""
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    plan = read_json(os.path.join(shared_dir, "plan.json"))
+    builder = load_builder(shared_dir, plan)
+    if render_environment(builder) != plan["environment"]:
+        raise ValueError("本机的标题字体与规划时不一致，渲染结果会与其他机器不同")
+
+    completed = 0
+    while True:
+        claimed_path = claim_job(shared_dir, worker_id)
+        if claimed_path is None:
+            if requeue_stale(shared_dir, stale_after):
+                continue
+            break
+
+        job_name = os.path.basename(claimed_path).split("@", 1)[0]
+        try:
+            job = run_job(shared_dir, builder, claimed_path)
+            completed += 1
+            print(f"[{worker_id}] 完成作业 {job['job_id']}（{job['school_name']}，{len(job['pages'])} 页）")
+        except Exception as e:
+            if not os.path.exists(claimed_path):
+                # 领取超时被放回队列，作业已由其他工作进程接手，不记为失败
+                print(f"[{worker_id}] 作业 {job_name} 已被重新放回队列，放弃本次执行")
+                continue
+            write_json(os.path.join(shared_dir, "failed", job_name),
+                       {"job": job_name, "worker": worker_id, "error": f"{type(e).__name__}: {e}"})
+            if os.path.exists(claimed_path):
+                os.remove(claimed_path)
+            print(f"[{worker_id}] 作业 {job_name} 失败: {e}")
+    return completed
+
+
+def verify(shared_dir):
+    """检查所有作业都已完成、页码连续且页面文件与完成记录一致，返回问题列表"""
+    plan = read_json(os.path.join(shared_dir, "plan.json"))
+    problems = []
+    recorded = {}
+
+    for job_id in plan["jobs"]:
+        done_path = os.path.join(shared_dir, "done", f"{job_id}.json")
+        failed_path = os.path.join(shared_dir, "failed", f"{job_id}.json")
+        # 作业可能先在一台机器上失败、重新执行后成功，有完成记录时以完成记录为准
+        if not os.path.exists(done_path):
+            if os.path.exists(failed_path):
+                problems.append(f"作业 {job_id} 失败: {read_json(failed_path)['error']}")
+            else:
+                problems.append(f"作业 {job_id} 尚未完成")
+            continue
+        for page in read_json(done_path)["pages"]:
+            recorded[page["page_number"]] = page
+
+    missing = [n for n in range(1, plan["total_pages"] + 1) if n not in recorded]
+    if missing and not problems:
+        problems.append(f"缺少页面: {missing}")
+
+    expected_files = set()
+    for page_number, page in sorted(recorded.items()):
+        page_path = os.path.join(shared_dir, "pages", page["file"])
+        expected_files.add(page_path)
+        if not os.path.exists(page_path):
+            problems.append(f"第 {page_number} 页文件不存在: {page['file']}")
+        elif file_sha1(page_path) != page["sha1"]:
+            problems.append(f"第 {page_number} 页文件与完成记录不一致: {page['file']}")
+
+    extra = [path for path in list_page_files(os.path.join(shared_dir, "pages")) if path not in expected_files]
+    if extra:
+        problems.append(f"pages/ 中有不属于本次规划的文件: {[os.path.basename(p) for p in extra]}")
+    return problems
+
+
+def gather(shared_dir, output_pdf=None):
+    """校验全部作业的结果并合并成PDF"""
+    problems = verify(shared_dir)
+    if problems:
+        for problem in problems:
+            print(f"  - {problem}")
+        print("校验未通过，未生成PDF")
+        return False
+
+    plan = read_json(os.path.join(shared_dir, "plan.json"))
+    output_pdf = output_pdf or os.path.join(shared_dir, "students.pdf")
+    context = BuildContext(config=plan["config"], workspace=shared_dir)
+    print(f"校验通过：{plan['total_pages']} 页，{len(plan['jobs'])} 个作业")
+    return create_pdf_from_pages(os.path.join(shared_dir, "pages"), output_pdf, context=context)
+
+
+def run_local(shared_dir, config_file="config.json", workers=4, output_pdf=None,
+              pages_per_job=DEFAULT_PAGES_PER_JOB):
+    """在本机启动多个独立的工作进程模拟多机渲染：规划、并行执行、校验合并"""
+    if plan_jobs(shared_dir, config_file, pages_per_job) is None:
+        return False
+
+    script = os.path.abspath(__file__)
+    processes = [subprocess.Popen([sys.executable, script, "work", shared_dir, "--worker-id", f"local{i}"])
+                 for i in range(workers)]
+    for process in processes:
+        process.wait()
+    return gather(shared_dir, output_pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多机分片渲染：规划、执行作业、校验合并')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help='规划全书并生成作业队列')
+    plan_parser.add_argument('shared_dir', help='共享目录')
+    plan_parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    plan_parser.add_argument('--pages-per-job', type=int, default=DEFAULT_PAGES_PER_JOB,
+                             help=f'每个作业最多包含的页数 (默认: {DEFAULT_PAGES_PER_JOB})')
+
+    work_parser = subparsers.add_parser('work', help='领取并执行作业直到队列为空')
+    work_parser.add_argument('shared_dir', help='共享目录')
+    work_parser.add_argument('--worker-id', help='工作进程标识 (默认: 主机名-进程号)')
+    work_parser.add_argument('--stale-after', type=float, default=DEFAULT_STALE_AFTER,
+                             help=f'已领取作业超过多少秒无进展时重新放回队列 (默认: {DEFAULT_STALE_AFTER})')
+
+    gather_parser = subparsers.add_parser('gather', help='校验所有作业并合并PDF')
+    gather_parser.add_argument('shared_dir', help='共享目录')
+    gather_parser.add_argument('-o', '--output', help='输出PDF (默认: 共享目录下的 students.pdf)')
+
+    local_parser = subparsers.add_parser('local', help='在本机用多个进程执行全过程')
+    local_parser.add_argument('shared_dir', help='共享目录')
+    local_parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    local_parser.add_argument('-w', '--workers', type=int, default=4, help='工作进程数 (默认: 4)')
+    local_parser.add_argument('-o', '--output', help='输出PDF (默认: 共享目录下的 students.pdf)')
+    local_parser.add_argument('--pages-per-job', type=int, default=DEFAULT_PAGES_PER_JOB,
+                              help=f'每个作业最多包含的页数 (默认: {DEFAULT_PAGES_PER_JOB})')
+
+    args = parser.parse_args()
+    shared_dir = os.path.abspath(args.shared_dir)
+
+    if args.command == 'plan':
+        success = plan_jobs(shared_dir, args.config, args.pages_per_job) is not None
+    elif args.command == 'work':
+        work(shared_dir, args.worker_id, args.stale_after)
+        success = True
+    elif args.command == 'gather':
+        success = gather(shared_dir, args.output)
+    else:
+        success = run_local(shared_dir, args.config, args.workers, args.output, args.pages_per_job)
+
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
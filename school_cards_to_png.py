@@ -0,0 +1,374 @@
+import glob
+import hashlib
+import json
+import math
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+from build_checkpoint import BuildCheckpoint, atomic_save_image
+from image_ops import resize_image
+from page_formats import page_format, remove_other_formats
+from page_pipeline import PagePipeline, canvas_pool_size
+from shared_cache import get_font, load_thumbnail
+
+# 卡片之间的垂直间距
+VERTICAL_SPACING = 20
+
+
+class SchoolCardsToPNG:
+    def __init__(self, config_file="config.json", context=None):
+        # 加载配置文件（传入构建环境时使用其独立的配置）
+        self.context = context
+        self.config = context.config if context else self.load_config(config_file)
+
+        # 从配置中读取参数
+        dpi = self.config.get("dpi", 300)
+        margin = self.config.get("margin", 80)
+        font_path = self.config.get("font_path")
+
+        # A4尺寸 (8.27x11.69英寸) 乘以DPI得到像素尺寸
+        self.width = int(8.27 * dpi)  # 2481像素
+        self.height = int(11.69 * dpi)  # 3507像素
+        self.margin = margin
+        self.dpi = dpi
+        self.use_thumbnail_cache = self.config.get("thumbnail_cache", False)
+        self.resample_quality = self.config.get("resample_quality", "high")
+        # 卡片宽高比缓存，按 (路径, 修改时间) 区分，长时间运行时重新规划不必再打开文件
+        self.aspect_ratios = {}
+        # 重复检测用的卡片哈希索引，第一次需要时创建
+        self.card_hashes = None
+
+        # 预加载字体
+        self.title_font = None
+        if font_path and os.path.exists(font_path):
+            try:
+                self.title_font = get_font(font_path, 60)
+            except:
+                print(f"无法加载字体: {font_path}")
+
+    def load_config(self, config_file):
+        """加载配置文件"""
+        try:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"配置文件 {config_file} 不存在，使用默认配置")
+            return {}
+        except Exception as e:
+            print(f"读取配置文件失败: {str(e)}，使用默认配置")
+            return {}
+
+    def get_school_folders(self, root_folder):
+        return sorted([item for item in os.listdir(root_folder)
+            if os.path.isdir(os.path.join(root_folder, item))])
+
+    def get_card_files(self, folder_path):
+        extensions = ['*.png', '*.jpg', '*.jpeg']
+        card_files = []
+        for ext in extensions:
+            pattern = os.path.join(folder_path, ext)
+            files = [f for f in glob.glob(pattern) if not f.endswith('icon.png')]
+            card_files.extend(files)
+
+        # 按数字顺序排序
+        def extract_number(filename):
+            base = os.path.basename(filename)
+            name, _ = os.path.splitext(base)
+            numbers = ''.join(filter(str.isdigit, name))
+            return int(numbers) if numbers else 0
+
+        return sorted(card_files, key=extract_number)
+
+    def get_ordered_schools(self, root_folder, school_order):
+        """获取所有学院文件夹并按指定顺序排序，不在顺序列表中的学院放在最后"""
+        return self.order_schools(self.get_school_folders(root_folder), school_order)
+
+    @staticmethod
+    def order_schools(all_schools, school_order):
+        """按指定顺序排列学院名，不在顺序列表中的学院按名称排在最后"""
+        all_schools = list(all_schools)
+
+        school_folders = []
+        for school in school_order:
+            if school in all_schools:
+                school_folders.append(school)
+                all_schools.remove(school)
+
+        # 添加未在顺序列表中指定的学院
+        school_folders.extend(sorted(all_schools))
+        return school_folders
+
+    def page_layout(self, card_count, aspect_ratio, cards_per_row):
+        """学院页面的排版：返回 (卡片宽, 卡片高, 每页行数, 每页卡片数, 页数)"""
+        # 计算卡片尺寸
+        available_width = self.width - 2 * self.margin
+        card_width = available_width // cards_per_row - 20  # 减去间距
+        card_height = int(card_width * aspect_ratio)
+
+        # 计算每页可以显示的行数
+        available_height = self.height - 2 * self.margin - 180  # 为标题预留更多空间
+        cards_per_column = available_height // (card_height + VERTICAL_SPACING)
+        cards_per_page = cards_per_row * cards_per_column
+
+        total_pages = math.ceil(card_count / cards_per_page)
+        return card_width, card_height, cards_per_column, cards_per_page, total_pages
+
+    def plan_pages(self):
+        """只计算排版，不渲染：返回每一页的描述，学院文件夹不存在时返回None"""
+        # 从配置中读取参数
+        root_folder = self.config.get("cards_folder")
+        cards_per_row = self.config.get("cards_per_row", 4)
+        school_order = self.config.get("school_order", [])
+
+        school_folders = self.get_ordered_schools(root_folder, school_order)
+        if not school_folders:
+            return None
+
+        school_cards = {school_name: self.get_card_files(os.path.join(root_folder, school_name))
+                        for school_name in school_folders}
+        if self.config.get("exclude_duplicate_cards", False):
+            school_cards = self.exclude_duplicate_cards(school_cards)
+
+        pages = []
+        for school_name in school_folders:
+            print(f"处理学院: {school_name}")
+            school_path = os.path.join(root_folder, school_name)
+            card_files = school_cards[school_name]
+            icon_path = os.path.join(school_path, "icon.png")
+
+            if not card_files:
+                print(f"  - 没有找到角色卡，跳过")
+                continue
+
+            print(f"  - 找到 {len(card_files)} 张角色卡，每行 {cards_per_row} 张")
+
+            # 按第一张卡片的尺寸比例计算卡片尺寸和每页可以显示的行数
+            aspect_ratio = self.card_aspect_ratio(card_files[0])
+            card_width, card_height, cards_per_column, cards_per_page, total_pages = self.page_layout(
+                len(card_files), aspect_ratio, cards_per_row)
+            print(f"  - 每页 {cards_per_row} x {cards_per_column} = {cards_per_page} 张卡片，共 {total_pages} 页")
+
+            for page_num in range(total_pages):
+                start_index = page_num * cards_per_page
+                end_index = min(start_index + cards_per_page, len(card_files))
+                pages.append({
+                    "page_number": len(pages) + 1,
+                    "school_name": school_name,
+                    "school_page": page_num,
+                    "school_pages": total_pages,
+                    "icon_path": icon_path,
+                    "card_files": card_files[start_index:end_index],
+                    "card_size": (card_width, card_height),
+                    "cards_per_row": cards_per_row,
+                })
+
+        return pages
+
+    def exclude_duplicate_cards(self, school_cards):
+        """去掉近似重复的卡片，每组只保留修改时间最新的一张（见 card_dedup）"""
+        from card_dedup import DEFAULT_THRESHOLD, CardHashIndex, cache_path_for, find_duplicates
+
+        if self.card_hashes is None:
+            self.card_hashes = CardHashIndex(cache_path_for(self.config, self.context))
+        card_files = [path for paths in school_cards.values() for path in paths]
+        threshold = self.config.get("duplicate_threshold", DEFAULT_THRESHOLD)
+
+        excluded = set()
+        for group in find_duplicates(card_files, self.card_hashes, threshold):
+            for path, distance in group["duplicates"]:
+                print(f"跳过近似重复的卡片: {path}（与 {os.path.basename(group['keep'])} 的距离 {distance}）")
+                excluded.add(path)
+        return {school_name: [path for path in paths if path not in excluded]
+                for school_name, paths in school_cards.items()}
+
+    def card_aspect_ratio(self, card_path):
+        """卡片的高宽比（只读取文件头）"""
+        key = (card_path, os.stat(card_path).st_mtime_ns)
+        if key not in self.aspect_ratios:
+            with Image.open(card_path) as img:
+                self.aspect_ratios[key] = img.height / img.width
+        return self.aspect_ratios[key]
+
+    def render_page(self, spec, page=None):
+        """按页面描述渲染一页，返回PIL图像；传入page时复用这块画布"""
+        card_width, card_height = spec["card_size"]
+
+        # 创建空白A4页面（复用画布时先清成白色）
+        if page is None:
+            page = Image.new('RGB', (self.width, self.height), 'white')
+        else:
+            page.paste((255, 255, 255), (0, 0, page.width, page.height))
+        draw = ImageDraw.Draw(page)
+
+        # 只在学院第一页添加图标和名称
+        if spec["school_page"] == 0:
+            school_name = spec["school_name"]
+            icon_path = spec["icon_path"]
+
+            # 添加学院图标 - 增大尺寸
+            if os.path.exists(icon_path):
+                icon_width, icon_height = 240, 180  # 增大图标尺寸
+                with Image.open(icon_path) as icon_src:
+                    icon = resize_image(icon_src, (icon_width, icon_height), self.resample_quality)
+                page.paste(icon, (self.margin, self.margin))
+                icon.close()
+
+            # 添加学院名称
+            if self.title_font:
+                draw.text((self.margin + 250, self.margin + 60), school_name, font=self.title_font,
+                          fill=(0, 0, 0))
+            else:
+                # 如果没有字体，使用默认字体
+                try:
+                    font = ImageFont.truetype("Arial", 60)
+                    draw.text((self.margin + 250, self.margin + 60), school_name, font=font, fill=(0, 0, 0))
+                except:
+                    draw.text((self.margin + 250, self.margin + 60), school_name, fill=(0, 0, 0))
+
+        # 绘制当前页的卡片
+        for card_path, x, y in self.card_positions(spec):
+            # 加载并调整卡片大小（构建服务中从共享缩略图缓存获取）
+            if self.use_thumbnail_cache:
+                card_img = load_thumbnail(card_path, (card_width, card_height), self.resample_quality)
+                page.paste(card_img, (x, y))
+                continue
+
+            # 解码后的卡片用完立即释放，不在页面之间累积
+            with Image.open(card_path) as card_src:
+                card_img = resize_image(card_src, (card_width, card_height), self.resample_quality)
+
+            # 粘贴卡片到页面
+            page.paste(card_img, (x, y))
+            card_img.close()
+
+        return page
+
+    def card_positions(self, spec):
+        """返回页面上每张卡片的 (路径, x, y)"""
+        card_width, card_height = spec["card_size"]
+        cards_per_row = spec["cards_per_row"]
+
+        positions = []
+        for position_in_page, card_path in enumerate(spec["card_files"]):
+            row = position_in_page // cards_per_row
+            col = position_in_page % cards_per_row
+
+            x = self.margin + col * (card_width + 20)
+            y = self.margin + 180 + row * (card_height + VERTICAL_SPACING)  # 调整起始位置
+            positions.append((card_path, x, y))
+        return positions
+
+    def layout_signature(self):
+        """影响排版结果的配置摘要，配置变化时检查点失效"""
+        layout = {
+            "cards_folder": self.config.get("cards_folder"),
+            "cards_per_row": self.config.get("cards_per_row", 4),
+            "school_order": self.config.get("school_order", []),
+            "dpi": self.dpi,
+            "margin": self.margin,
+            "font_path": self.config.get("font_path"),
+            "resample_quality": self.resample_quality,
+        }
+        return hashlib.sha1(json.dumps(layout, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def page_content_fingerprint(self, spec):
+        """页面渲染结果的摘要：卡片和图标文件（含修改时间和大小）以及影响绘制的参数
+
+        不包含全局页码，其他学院增删页面导致页码移动时，内容不变的页面指纹也不变。
+        """
+        def file_state(path):
+            try:
+                stat = os.stat(path)
+                return [path, stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                return [path, None, None]
+
+        content = {
+            "page": [spec["school_name"], spec["school_page"], list(spec["card_size"]), spec["cards_per_row"]],
+            "cards": [file_state(path) for path in spec["card_files"]],
+            "icon": file_state(spec["icon_path"]) if spec["school_page"] == 0 else None,
+            "layout": [self.width, self.height, self.margin, self.config.get("font_path"), self.resample_quality],
+        }
+        return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def iter_saved_pages(self, pages, output_dir, resume=True):
+        """逐页渲染并保存，每完成一页产出 (页面描述, 文件路径)；出错时异常直接抛出
+
+        页面文件的格式和压缩参数由配置中的 page_format 档位决定（fast/balanced/compact）。
+        """
+        checkpoint = BuildCheckpoint(os.path.join(output_dir, ".pages_checkpoint.json"),
+                                     signature=self.layout_signature())
+        if not resume:
+            checkpoint.reset()
+
+        extension, image_format, save_params = page_format(self.config.get("page_format"))
+
+        def page_path(spec):
+            return f"{output_dir}/{spec['page_number']:03d}.{extension}"
+
+        # 检查点按页面内容指纹判断，卡片在原路径重新生成（修改时间或大小变化）时该页会重新渲染
+        def already_done(spec):
+            return (checkpoint.is_done(spec["page_number"], self.page_content_fingerprint(spec))
+                    and os.path.exists(page_path(spec)))
+
+        # 合成与编码在两个线程中交替进行，同时存在的页面画布数量由内存预算决定
+        pool_size = canvas_pool_size(self.width, self.height, self.config.get("page_memory_budget_mb"))
+        pipeline = PagePipeline(self.render_page, (self.width, self.height), pool_size)
+
+        for spec, page in pipeline.run(pages, skip=already_done):
+            page_number = spec["page_number"]
+            file_path = page_path(spec)
+            fingerprint = self.page_content_fingerprint(spec)
+
+            if page is None:
+                print(f"  - 跳过已完成的页面: {file_path}")
+                yield spec, file_path
+                continue
+
+            # 保存页面，并删除这一页以其他格式保存的旧文件
+            atomic_save_image(page, file_path, image_format, dpi=(self.dpi, self.dpi), **save_params)
+            remove_other_formats(file_path)
+            checkpoint.mark_done(page_number, fingerprint)
+
+            print(f"  - {spec['school_name']} 第 {spec['school_page'] + 1}/{spec['school_pages']} 页: {file_path}")
+            yield spec, file_path
+
+        checkpoint.clear()
+
+    def create_pages_by_schools(self, resume=True):
+        """从配置中读取参数创建页面，已完成的页面记录在检查点中，中断后可续跑"""
+        output_dir = self.config.get("pages_folder")
+
+        pages = self.plan_pages()
+        if pages is None:
+            return False
+
+        # 创建输出目录
+        os.makedirs(output_dir, exist_ok=True)
+
+        try:
+            for _ in self.iter_saved_pages(pages, output_dir, resume):
+                pass
+
+            print(f"所有页面已保存到 {output_dir} 文件夹，共 {len(pages)} 页")
+            return True
+
+        except Exception as e:
+            print(f"Error: {str(e)}")
+            print("已完成的页面已记录到检查点，重新运行将从中断处继续")
+            return False
+
+
+def main():
+    # 从配置文件创建生成器
+    merger = SchoolCardsToPNG("config.json")
+    success = merger.create_pages_by_schools()
+
+    if success:
+        print("PNG页面生成成功")
+    else:
+        print("PNG页面生成失败")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
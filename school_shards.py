@@ -0,0 +1,159 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4
+
+from build_checkpoint import temp_path_for
+from incremental_build import IncrementalBook
+from pdf_writer import MANIFEST_SUFFIX, ImagePdfWriter, load_manifest, manifest_path, read_stream, save_manifest
+from school_cards_to_png import SchoolCardsToPNG
+
+
+def shard_file_name(school_name):
+    """学院分片PDF的文件名（去掉文件名中不允许的字符）"""
+    return re.sub(r'[\\/:*?"<>|]', '_', school_name) + ".pdf"
+
+
+def _build_shard(config_file, context, shard_pdf, pages):
+    """在子进程中生成一个学院的分片PDF（分片内部同样按页增量更新）"""
+    return IncrementalBook(config_file, context).build(shard_pdf, pages=pages)
+
+
+def merge_shards(shards, output_pdf):
+    """把各学院的分片PDF合并成整本书，并为每个学院添加书签
+
+    shards 为 [(学院名, 分片PDF路径), ...]。图像流按分片清单中记录的位置原样复制，
+    不解析也不解码分片中的图像。
+    """
+    tmp_pdf = temp_path_for(output_pdf)
+    try:
+        writer = ImagePdfWriter(tmp_pdf)
+        try:
+            for school_name, shard_pdf in shards:
+                records = load_manifest(shard_pdf)
+                if not records:
+                    raise ValueError(f"分片缺少图像流清单: {shard_pdf}")
+
+                writer.add_outline(school_name)
+                with open(shard_pdf, 'rb') as f:
+                    for record in records:
+                        writer.add_page(read_stream(f, record), A4)["fingerprint"] = record.get("fingerprint")
+            writer.close()
+        except BaseException:
+            writer.file.close()
+            raise
+        os.replace(tmp_pdf, output_pdf)
+        save_manifest(output_pdf, writer.page_records)
+    finally:
+        if os.path.exists(tmp_pdf):
+            os.remove(tmp_pdf)
+
+
+class SchoolShards:
+    """按学院分片生成PDF
+
+    每个学院的页面在独立的进程中生成为一个分片PDF，分片带有页指纹清单，
+    内容没有变化的学院直接沿用缓存的分片。最后复制各分片的图像流合并成整本书。
+    """
+
+    def __init__(self, config_file="config.json", context=None, workers=None):
+        self.config_file = config_file
+        self.context = context
+        self.builder = SchoolCardsToPNG(config_file, context)
+        self.book = IncrementalBook(config_file, context, self.builder)
+        self.config = self.builder.config
+        self.shards_folder = self.config.get("shards_folder", "school_shards")
+        self.workers = workers or self.config.get("shard_workers") or os.cpu_count() or 1
+
+    def plan_shards(self):
+        """按学院分组的页面描述：[(学院名, 分片PDF路径, [页面描述, ...]), ...]，保持书中的顺序"""
+        pages = self.builder.plan_pages()
+        if not pages:
+            return []
+
+        groups = {}
+        for spec in pages:
+            groups.setdefault(spec["school_name"], []).append(spec)
+        return [(school_name, os.path.join(self.shards_folder, shard_file_name(school_name)), specs)
+                for school_name, specs in groups.items()]
+
+    def remove_stale_shards(self, shards):
+        """删除已不在计划中的学院（被删除或改名）留下的分片PDF及其清单，返回删除的文件数"""
+        keep = set()
+        for _, shard_pdf, _ in shards:
+            keep.update((os.path.basename(shard_pdf), os.path.basename(manifest_path(shard_pdf))))
+
+        removed = 0
+        for name in os.listdir(self.shards_folder):
+            if name in keep or not name.endswith((".pdf", ".pdf" + MANIFEST_SUFFIX)):
+                continue
+            try:
+                os.remove(os.path.join(self.shards_folder, name))
+                removed += 1
+            except OSError as e:
+                print(f"删除过期分片 {name} 时出错: {str(e)}")
+        return removed
+
+    def build(self, output_pdf=None, schools=None):
+        """并行生成（或沿用）各学院分片，再合并成整本书
+
+        给出 schools 时只检查这些学院的分片，其他学院的分片只要存在就直接使用。
+        workers 为1时在当前进程中生成，字体、缩略图等缓存在多次构建之间保持有效。
+        """
+        if output_pdf is None:
+            output_pdf = self.config.get("students_pdf", "students.pdf")
+
+        shards = self.plan_shards()
+        if not shards:
+            print("没有可生成的页面")
+            return False
+
+        os.makedirs(self.shards_folder, exist_ok=True)
+        pending = [(school_name, shard_pdf, specs) for school_name, shard_pdf, specs in shards
+                   if schools is None or school_name in schools or load_manifest(shard_pdf) is None]
+
+        if self.workers == 1 or len(pending) <= 1:
+            failed = [school_name for school_name, shard_pdf, specs in pending
+                      if not self.book.build(shard_pdf, pages=specs)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                futures = [(school_name, pool.submit(_build_shard, self.config_file, self.context, shard_pdf, specs))
+                           for school_name, shard_pdf, specs in pending]
+                failed = [school_name for school_name, future in futures if not future.result()]
+
+        if failed:
+            print(f"以下学院的分片生成失败: {', '.join(failed)}")
+            return False
+
+        try:
+            merge_shards([(school_name, shard_pdf) for school_name, shard_pdf, _ in shards], output_pdf)
+        except Exception as e:
+            print(f"合并分片时出错: {str(e)}")
+            return False
+
+        removed = self.remove_stale_shards(shards)
+        if removed:
+            print(f"已删除 {removed} 个过期的分片文件")
+        print(f"PDF已成功生成: {output_pdf}，共 {len(shards)} 个学院")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按学院分片并行生成PDF，再合并成整本书')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-w', '--workers', type=int, help='并行生成分片的进程数 (默认: CPU核数)')
+    parser.add_argument('-o', '--output', help='输出PDF (默认: 配置中的 students_pdf)')
+    args = parser.parse_args()
+
+    start = time.time()
+    if SchoolShards(args.config, workers=args.workers).build(args.output):
+        print(f"完成，用时 {time.time() - start:.1f} 秒")
+    else:
+        print("生成失败")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import functools
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageFont
+
+from image_ops import resize_image
+
+
+@functools.lru_cache(maxsize=64)
+def get_font(font_path, size):
+    """加载并缓存字体，同一字体和字号在整个进程内只加载一次"""
+    return ImageFont.truetype(font_path, size)
+
+
+class AssetCache:
+    """下载素材的磁盘缓存，按URL摘要存放，多个构建共享
+
+    缓存目录在第一次存入文件时才创建，只查询缓存（如试运行规划）不会写入任何东西。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path_for(self, url):
+        """URL对应的缓存文件路径"""
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.bin")
+
+    def fetch(self, url, save_path):
+        """命中缓存时复制到目标路径并返回True"""
+        cached_path = self.path_for(url)
+        if not os.path.exists(cached_path):
+            return False
+        shutil.copyfile(cached_path, save_path)
+        return True
+
+    def store(self, url, file_path):
+        """把下载好的文件放入缓存（先复制到临时文件再重命名）"""
+        cached_path = self.path_for(url)
+        tmp_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        try:
+            shutil.copyfile(file_path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+_asset_caches = {}
+_asset_caches_lock = threading.Lock()
+
+
+def get_asset_cache(cache_dir):
+    """按目录返回共享的素材缓存实例"""
+    cache_dir = os.path.abspath(cache_dir)
+    with _asset_caches_lock:
+        if cache_dir not in _asset_caches:
+            _asset_caches[cache_dir] = AssetCache(cache_dir)
+        return _asset_caches[cache_dir]
+
+
+class ThumbnailCache:
+    """缩放后卡片图像的内存LRU缓存，按 (路径, 修改时间, 尺寸) 区分，限制总字节数"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, size, loader, variant=None):
+        """返回缓存的缩略图，未命中时调用 loader() 生成并缓存"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return loader()
+
+        key = (os.path.abspath(path), mtime, tuple(size), variant)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        img = loader()
+        nbytes = img.width * img.height * len(img.getbands())
+        if nbytes > self.max_bytes:
+            return img
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = img
+                self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.current_bytes -= old.width * old.height * len(old.getbands())
+        return img
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+
+# 进程内共享的缩略图缓存
+thumbnail_cache = ThumbnailCache()
+
+
+def load_thumbnail(path, size, quality="high"):
+    """从共享缓存中取得缩放到指定尺寸的卡片图像"""
+    def loader():
+        with Image.open(path) as img:
+            return resize_image(img, size, quality)
+
+    return thumbnail_cache.get(path, size, loader, quality)
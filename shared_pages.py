@@ -0,0 +1,225 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from multiprocessing import shared_memory
+
+from PIL import Image, ImageEnhance, ImageFile
+from reportlab.lib.pagesizes import A4
+
+from build_checkpoint import temp_path_for
+from pdf_passthrough import PassthroughInfo
+from pdf_writer import DEFAULT_COMPRESS_LEVEL, ImagePdfWriter
+from school_cards_to_png import SchoolCardsToPNG
+
+
+class SharedPageRing:
+    """一块共享内存划分成若干页面槽，每个槽存放一页打包好的RGB像素
+
+    渲染进程把页面写入槽中，写入进程直接在槽上压缩，页面像素不经过pickle、
+    不写PNG文件。槽用完归还后再分配给下一页，因此内存占用只取决于槽数。
+    """
+
+    def __init__(self, slot_count, size, name=None):
+        self.slot_count = slot_count
+        self.size = size
+        self.slot_bytes = size[0] * size[1] * 3
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slot_count)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot):
+        """槽对应的内存视图（不复制）"""
+        start = slot * self.slot_bytes
+        return self.shm.buf[start:start + self.slot_bytes]
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 等待渲染结果时每隔这么多秒检查一次渲染进程是否还在运行
+WORKER_POLL_SECONDS = 1.0
+
+
+def pack_into(page, view):
+    """把RGB页面按行打包写入内存视图，与 page.tobytes() 的内容相同
+
+    tobytes() 先生成整页大小的 bytes 再复制进共享内存；这里逐块取出打包好的像素直接写入视图，
+    临时内存只有一块的大小。
+    """
+    encoder = Image._getencoder(page.mode, "raw", page.mode)
+    encoder.setimage(page.im, (0, 0) + page.size)
+    bufsize = max(ImageFile.MAXBLOCK, page.width * 4)
+    offset = 0
+    while True:
+        _, errcode, data = encoder.encode(bufsize)
+        view[offset:offset + len(data)] = data
+        offset += len(data)
+        if errcode:
+            break
+    if errcode < 0 or offset != len(view):
+        raise RuntimeError(f"打包页面像素失败（错误码 {errcode}，写入 {offset}/{len(view)} 字节）")
+
+
+def _render_worker(config_file, context, ring_name, slot_count, size, contrast_factor, tasks, done):
+    """渲染进程：取 (页序号, 槽号, 页面描述)，渲染后把像素写入槽并通知写入进程"""
+    builder = SchoolCardsToPNG(config_file, context)
+    ring = SharedPageRing(slot_count, size, ring_name)
+    canvas = Image.new('RGB', size, 'white')
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            index, slot, spec = task
+            try:
+                page = builder.render_page(spec, canvas)
+                if contrast_factor is not None:
+                    page = ImageEnhance.Contrast(page).enhance(contrast_factor)
+                view = ring.view(slot)
+                pack_into(page, view)
+                view.release()
+                if page is not canvas:
+                    page.close()
+                done.put((index, slot, None))
+            except Exception as e:
+                # 异常对象不一定能pickle，只传回说明文字
+                done.put((index, slot, f"{type(e).__name__}: {e}"))
+    finally:
+        canvas.close()
+        ring.shm.close()
+
+
+def iter_shared_pages(builder, pages, workers=2, slot_count=None, contrast_factor=None, config_file="config.json"):
+    """在 workers 个进程中渲染页面，按页序产出 (页面描述, 槽内存视图)
+
+    视图只在调用方取下一项之前有效，之后对应的槽会分配给后面的页面。
+    同时在途的页面数等于槽数，写入端慢时渲染进程会等待空闲的槽。
+    """
+    size = (builder.width, builder.height)
+    slot_count = slot_count or workers + 2
+    mp = multiprocessing.get_context()
+    ring = SharedPageRing(slot_count, size)
+    tasks = mp.Queue()
+    done = mp.Queue()
+    processes = [
+        mp.Process(target=_render_worker,
+                   args=(config_file, builder.context, ring.name, slot_count, size, contrast_factor,
+                         tasks, done),
+                   daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    free_slots = list(range(slot_count))
+    finished = {}
+    next_task = 0
+    try:
+        for index, spec in enumerate(pages):
+            # 按页序分配槽，保证当前需要的页面一定已经派发
+            while free_slots and next_task < len(pages):
+                tasks.put((next_task, free_slots.pop(), pages[next_task]))
+                next_task += 1
+
+            while index not in finished:
+                try:
+                    done_index, slot, error = done.get(timeout=WORKER_POLL_SECONDS)
+                except queue.Empty:
+                    # 渲染进程崩溃（如被系统因内存不足杀掉）时它手上的页面不会再返回，不能一直等下去
+                    dead = [process for process in processes if not process.is_alive()]
+                    if dead:
+                        raise RuntimeError(f"渲染进程意外退出（退出码 {dead[0].exitcode}），"
+                                           f"等待第 {spec['page_number']} 页时中止")
+                    continue
+                if error is not None:
+                    raise RuntimeError(f"渲染第 {pages[done_index]['page_number']} 页失败: {error}")
+                finished[done_index] = slot
+
+            slot = finished.pop(index)
+            view = ring.view(slot)
+            try:
+                yield spec, view
+            finally:
+                view.release()
+            free_slots.append(slot)
+    finally:
+        for _ in processes:
+            tasks.put(None)
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        ring.close()
+
+
+def build_pdf_shared(config_file="config.json", context=None, workers=2, slot_count=None, output_pdf=None,
+                     compress_level=DEFAULT_COMPRESS_LEVEL):
+    """不写中间PNG，直接从渲染进程经共享内存取页面写成PDF"""
+    builder = SchoolCardsToPNG(config_file, context)
+    config = builder.config
+    if output_pdf is None:
+        output_pdf = config.get("students_pdf", "students.pdf")
+    contrast_factor = config.get("contrast_factor", 1.2) if config.get("add_contrast", False) else None
+
+    pages = builder.plan_pages()
+    if not pages:
+        print("没有可生成的页面")
+        return False
+
+    tmp_pdf = temp_path_for(output_pdf)
+    try:
+        writer = ImagePdfWriter(tmp_pdf)
+        try:
+            for spec, view in iter_shared_pages(builder, pages, workers, slot_count, contrast_factor,
+                                                   config_file):
+                # 直接在共享内存上压缩，不复制页面像素
+                data = zlib.compress(view, compress_level)
+                info = PassthroughInfo(builder.width, builder.height, 8, 'DeviceRGB', ['FlateDecode'], data)
+                writer.add_page(info, A4)
+                print(f"  - {spec['school_name']} 第 {spec['school_page'] + 1}/{spec['school_pages']} 页已写入PDF")
+            writer.close()
+        except BaseException:
+            writer.file.close()
+            raise
+        os.replace(tmp_pdf, output_pdf)
+        print(f"PDF已成功生成: {output_pdf}，共 {len(pages)} 页")
+        return True
+
+    except Exception as e:
+        print(f"生成PDF时出错: {str(e)}")
+        return False
+
+    finally:
+        if os.path.exists(tmp_pdf):
+            os.remove(tmp_pdf)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多进程渲染页面，经共享内存直接写入PDF（不保存中间PNG）')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='渲染进程数 (默认: 2)')
+    parser.add_argument('--slots', type=int, help='共享内存页面槽数 (默认: 进程数+2)')
+    parser.add_argument('-o', '--output', help='输出PDF (默认: 配置中的 students_pdf)')
+    args = parser.parse_args()
+
+    start = time.time()
+    if build_pdf_shared(args.config, workers=args.workers, slot_count=args.slots, output_pdf=args.output):
+        print(f"完成，用时 {time.time() - start:.1f} 秒")
+    else:
+        print("生成失败")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import os
+import time
+
+from school_shards import SchoolShards
+
+# 轮询间隔（秒）
+DEFAULT_INTERVAL = 1.0
+
+# 最后一次变化之后等待多久再重建，一次拷入多张卡片时只重建一次
+DEFAULT_DEBOUNCE = 2.0
+
+WATCHED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class CardWatcher:
+    """轮询 cards_folder 中卡片和学院图标的修改时间，变化稳定后只重建受影响学院的分片并重新合并PDF
+
+    所有构建都在当前进程中进行，字体、缩略图缓存和卡片尺寸信息在多次重建之间保持有效。
+    只依赖文件修改时间，不需要平台相关的文件通知接口。
+    """
+
+    def __init__(self, config_file="config.json", context=None, interval=DEFAULT_INTERVAL,
+                 debounce=DEFAULT_DEBOUNCE):
+        self.shards = SchoolShards(config_file, context, workers=1)
+        # 长时间运行时从共享缩略图缓存中取卡片，未变化的卡片不再重新解码缩放
+        self.shards.builder.use_thumbnail_cache = True
+        self.cards_folder = self.shards.config.get("cards_folder")
+        self.interval = interval
+        self.debounce = debounce
+
+    def snapshot(self):
+        """返回 {文件路径: (学院名, 修改时间, 大小)}，覆盖所有学院文件夹中的卡片和 icon.png"""
+        state = {}
+        try:
+            school_names = os.listdir(self.cards_folder)
+        except OSError:
+            return state
+
+        for school_name in school_names:
+            school_path = os.path.join(self.cards_folder, school_name)
+            if not os.path.isdir(school_path):
+                continue
+            try:
+                entries = list(os.scandir(school_path))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.lower().endswith(WATCHED_EXTENSIONS):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                state[entry.path] = (school_name, stat.st_mtime_ns, stat.st_size)
+        return state
+
+    @staticmethod
+    def changed_schools(old, new):
+        """两次快照之间有文件新增、删除或修改的学院"""
+        schools = set()
+        for path in old.keys() | new.keys():
+            if old.get(path) != new.get(path):
+                schools.add((old.get(path) or new.get(path))[0])
+        return schools
+
+    def rebuild(self, schools=None):
+        """重建指定学院（默认全部检查）并合并PDF
+
+        卡片可能还没拷贝完或已损坏，读取出错时只报告错误并返回False，不让监视进程退出。
+        """
+        start = time.time()
+        label = "全部学院" if schools is None else "、".join(sorted(schools))
+        print(f"开始重建: {label}")
+        try:
+            success = self.shards.build(schools=schools)
+        except Exception as e:
+            print(f"重建出错: {type(e).__name__}: {e}")
+            success = False
+        print(f"重建{'完成' if success else '失败'}，用时 {time.time() - start:.1f} 秒")
+        return success
+
+    def run(self, max_rebuilds=None):
+        """先做一次完整构建，然后持续监视；max_rebuilds 限制监视期间的重建次数（用于测试）"""
+        # 先取快照再构建，构建期间发生的变化会在第一次轮询时发现
+        state = self.snapshot()
+        pending = set()
+        last_change = 0.0
+        if not self.rebuild():
+            pending = {school_name for school_name, _, _ in state.values()}
+            last_change = time.time()
+        rebuilds = 0
+
+        print(f"正在监视 {self.cards_folder}，按 Ctrl+C 退出")
+        while max_rebuilds is None or rebuilds < max_rebuilds:
+            time.sleep(self.interval)
+            current = self.snapshot()
+            changed = self.changed_schools(state, current)
+            state = current
+            if changed:
+                pending |= changed
+                last_change = time.time()
+                print(f"检测到变化: {'、'.join(sorted(changed))}")
+                continue
+
+            if pending and time.time() - last_change >= self.debounce:
+                if self.rebuild(pending):
+                    pending = set()
+                    rebuilds += 1
+                else:
+                    # 保留这些学院，等待下一个防抖周期再试（文件通常在那之前拷贝完成）
+                    print(f"将在 {self.debounce:g} 秒后重试: {'、'.join(sorted(pending))}")
+                    last_change = time.time()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='监视角色卡文件夹，变化后自动增量重建页面和PDF')
+    parser.add_argument('-c', '--config', default='config.json', help='配置文件 (默认: config.json)')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'轮询间隔秒数 (默认: {DEFAULT_INTERVAL})')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help=f'最后一次变化后等待多少秒再重建 (默认: {DEFAULT_DEBOUNCE})')
+    args = parser.parse_args()
+
+    watcher = CardWatcher(args.config, interval=args.interval, debounce=args.debounce)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("已停止监视")
+
+
+if __name__ == "__main__":
+    main()